@@ -1,9 +1,11 @@
 from flask import Flask, render_template, request, jsonify, url_for
 from ce3 import Assistant
 import os
-from werkzeug.utils import secure_filename
-import base64
+import select
+import socket
+import threading
 from config import Config
+from core.images import shared_encoder
 
 app = Flask(__name__, static_folder='static')
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -12,8 +14,59 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize the assistant
-assistant = Assistant()
+# Uploaded and pasted images are downscaled and re-encoded before reaching the model
+image_encoder = shared_encoder(
+    getattr(Config, 'IMAGE_MAX_DIMENSION', 1568),
+    getattr(Config, 'IMAGE_JPEG_QUALITY', 85),
+    getattr(Config, 'IMAGE_CACHE_SIZE', 64)
+)
+
+# The assistant is created by the first request that needs it, so importing
+# the app (and starting or restarting a server worker) doesn't wait for the
+# tools to load
+_assistant = None
+_assistant_lock = threading.Lock()
+
+def create_assistant(interactive: bool = False) -> Assistant:
+    assistant = Assistant(interactive=interactive)
+    if getattr(Config, 'RESUME_SESSION', None):
+        assistant.resume_session(None if Config.RESUME_SESSION == 'latest' else Config.RESUME_SESSION)
+    return assistant
+
+def get_assistant() -> Assistant:
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                # Server workers have no terminal to answer prompts on, so
+                # tools with missing dependencies are skipped
+                _assistant = create_assistant(interactive=False)
+    return _assistant
+
+def __getattr__(name):
+    # app.assistant still works, and creates the assistant like a request would
+    if name == 'assistant':
+        return get_assistant()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def watch_for_disconnect(environ, done: threading.Event):
+    """
+    Cancel the assistant's turn if the client closes the connection before the
+    response is ready. Needs the socket, which the Werkzeug server exposes;
+    elsewhere the turn simply runs to completion.
+    """
+    sock = environ.get('werkzeug.socket')
+    if sock is None:
+        return
+    while not done.wait(0.5):
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # Readable with nothing to read means the peer has closed the connection
+            if readable and not sock.recv(1, socket.MSG_PEEK):
+                get_assistant().cancel()
+                return
+        except (OSError, ValueError):
+            return
 
 @app.route('/')
 def home():
@@ -27,17 +80,19 @@ def chat():
     
     # Prepare the message content
     if image_data:
+        # Images from /upload are already normalized and come straight from the cache
+        try:
+            image = image_encoder.encode_base64(image_data)
+        except ValueError as e:
+            return jsonify({
+                'response': f"Error: {str(e)}",
+                'thinking': False,
+                'tool_name': None,
+                'token_usage': None
+            }), 200
+
         # Create a message with both text and image in correct order
-        message_content = [
-            {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/jpeg",  # We should detect this from the image
-                    "data": image_data.split(',')[1] if ',' in image_data else image_data  # Remove data URL prefix if present
-                }
-            }
-        ]
+        message_content = [image.to_block()]
         
         # Only add text message if there is actual text
         if message.strip():
@@ -50,34 +105,32 @@ def chat():
         message_content = message
     
     try:
+        assistant = get_assistant()
         # Handle the chat message with the appropriate content
-        response = assistant.chat(message_content)
+        done = threading.Event()
+        threading.Thread(target=watch_for_disconnect, args=(request.environ, done), daemon=True).start()
+        try:
+            response = assistant.chat(message_content)
+        finally:
+            done.set()
         
         # Get token usage from assistant
         token_usage = {
-            'total_tokens': assistant.total_tokens_used,
-            'max_tokens': Config.MAX_CONVERSATION_TOKENS
+            'total_tokens': assistant.context_tokens,
+            'billed_tokens': assistant.total_tokens_used,
+            'max_tokens': Config.MAX_CONVERSATION_TOKENS,
+            'cache_read_tokens': assistant.cache_read_tokens,
+            'cache_write_tokens': assistant.cache_write_tokens
         }
         
-        # Get the last used tool from the conversation history
-        tool_name = None
-        if assistant.conversation_history:
-            for msg in reversed(assistant.conversation_history):
-                if msg.get('role') == 'assistant' and msg.get('content'):
-                    content = msg['content']
-                    if isinstance(content, list):
-                        for block in content:
-                            if isinstance(block, dict) and block.get('type') == 'tool_use':
-                                tool_name = block.get('name')
-                                break
-                    if tool_name:
-                        break
-        
         return jsonify({
             'response': response,
             'thinking': False,
-            'tool_name': tool_name,
-            'token_usage': token_usage
+            'tool_name': assistant.conversation_history.last_tool_name,
+            'token_usage': token_usage,
+            'time_to_first_token': assistant.last_time_to_first_token,
+            'steps': [record.to_dict() for record in assistant.last_turn_steps],
+            'tool_cache': assistant.tool_cache.stats() if assistant.tool_cache else None
         })
         
     except Exception as e:
@@ -98,24 +151,16 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Get the actual media type
-        media_type = file.content_type or 'image/jpeg'  # Default to jpeg if not detected
-        
-        # Convert image to base64
-        with open(filepath, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        # Clean up the file
-        os.remove(filepath)
+        # Downscale and re-encode in memory; the media type comes from the content
+        try:
+            image = image_encoder.encode(file.read())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'image_data': encoded_string,
-            'media_type': media_type
+            'image_data': image.data,
+            'media_type': image.media_type
         })
     
     return jsonify({'error': 'Invalid file type'}), 400
@@ -123,8 +168,26 @@ def upload_file():
 @app.route('/reset', methods=['POST'])
 def reset():
     # Reset the assistant's conversation history
-    assistant.reset()
+    get_assistant().reset()
     return jsonify({'status': 'success'})
 
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    # Profiling reports expose code paths and memory contents: local requests only
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    action = (request.json or {}).get('action', '') if request.is_json else request.args.get('action', '')
+    if action not in ('on', 'off', 'dump', 'status'):
+        return jsonify({'error': "action must be one of: on, off, dump, status"}), 400
+
+    assistant = get_assistant()
+    message = assistant.profile_command(action)
+    return jsonify({'status': 'success', 'active': assistant.profiler.active, 'message': message})
+
 if __name__ == '__main__':
+    # Run from a terminal: load the tools (asking about missing dependencies)
+    # before serving; the API client is set up in the background
+    _assistant = create_assistant(interactive=True)
+    _assistant.warm_up()
     app.run(debug=False) 
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Non-interactive batch mode: run many prompts concurrently, each in a fresh
+conversation, and stream the results to a JSONL file.
+
+    python batch.py tasks.jsonl -o results.jsonl -j 8
+
+Every input line is a task: {"id": "...", "prompt": "..."} with an optional
+"model". Blank lines and lines starting with '#' are skipped. Each task gets
+a fresh conversation (and session journal) on its worker thread's Assistant,
+which is reset between tasks rather than built again; all tasks share one API
+client (one connection pool), one tool registry (tools are imported once) and
+the rate limiter of the API key. One result line is written per task as soon as it finishes, so the
+output can be followed with `tail -f` and a partial run keeps its results.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+
+from rich.console import Console
+
+from ce3 import Assistant
+from config import Config
+from core.registry import ToolRegistry
+
+
+def read_tasks(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    The tasks of a JSONL file, in order. Tasks without an id are numbered by
+    their line.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                task = json.loads(line)
+            except ValueError as e:
+                yield {"id": f"line-{line_number}", "error": f"Invalid JSON: {str(e)}"}
+                continue
+            if isinstance(task, str):
+                task = {"prompt": task}
+            if not isinstance(task, dict) or not task.get('prompt'):
+                yield {"id": f"line-{line_number}", "error": "Task has no prompt"}
+                continue
+            task.setdefault('id', f"line-{line_number}")
+            yield task
+
+
+class BatchRunner:
+    """
+    Runs tasks on a thread pool, at most `concurrency` at a time, and writes
+    one result line per task to `output` as tasks complete.
+    """
+
+    def __init__(self, output, concurrency: int = 4, verbose: bool = False):
+        self.output = output
+        self.concurrency = max(1, concurrency)
+        self.verbose = verbose
+        self.client = Assistant.create_client()
+        self.tool_registry = ToolRegistry()
+        # One assistant per worker thread, reused for each of its tasks
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        self.billed_tokens = 0
+
+        # The first assistant loads the tools into the shared registry
+        self._new_assistant()
+
+    def _new_assistant(self) -> Assistant:
+        console = Console(stderr=True) if self.verbose else Console(quiet=True)
+        assistant = Assistant(client=self.client, tool_registry=self.tool_registry,
+                              console=console, interactive=False)
+        assistant.thinking_enabled = False
+        return assistant
+
+    def _task_assistant(self) -> Assistant:
+        """
+        This worker thread's assistant, with an empty conversation.
+        """
+        assistant = getattr(self._local, 'assistant', None)
+        if assistant is None:
+            assistant = self._local.assistant = self._new_assistant()
+        else:
+            assistant.new_conversation(new_session=True)
+        assistant.model = Config.MODEL
+        return assistant
+
+    def run_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"id": task['id'], "status": "error"}
+        if task.get('error'):
+            result['error'] = task['error']
+            return result
+        if self._cancelled.is_set():
+            result['error'] = "Cancelled"
+            return result
+
+        started = time.perf_counter()
+        assistant = None
+        try:
+            assistant = self._task_assistant()
+            if task.get('model'):
+                assistant.model = task['model']
+            response = assistant.chat(task['prompt'])
+            failed = isinstance(response, str) and response.startswith("Error:")
+            result.update({
+                "status": "error" if failed else "ok",
+                "response": response,
+                "model": assistant.model,
+                "steps": len(assistant.last_turn_steps),
+                "tool_calls": sum(len(record.tool_calls) for record in assistant.last_turn_steps),
+                "usage": {
+                    "billed_tokens": assistant.total_tokens_used,
+                    "context_tokens": assistant.context.last_prompt_tokens,
+                    "cache_read_tokens": assistant.cache_read_tokens,
+                    "cache_write_tokens": assistant.cache_write_tokens
+                },
+                "time_to_first_token": assistant.last_time_to_first_token,
+                "step_records": [record.to_dict() for record in assistant.last_turn_steps]
+            })
+            if failed:
+                result['error'] = response
+            if assistant.journal is not None:
+                result['session_id'] = assistant.journal.session_id
+        except Exception as e:
+            logging.error(f"Error in batch task {task['id']}: {str(e)}")
+            result['error'] = str(e)
+        finally:
+            if assistant is not None and assistant.journal is not None:
+                assistant.journal.close()
+        result['wall_time'] = round(time.perf_counter() - started, 3)
+        return result
+
+    def _write(self, result: Dict[str, Any]) -> None:
+        line = json.dumps(result, default=str) + "\n"
+        with self._write_lock:
+            self.output.write(line)
+            self.output.flush()
+            if result['status'] == 'ok':
+                self.completed += 1
+            else:
+                self.failed += 1
+            self.billed_tokens += (result.get('usage') or {}).get('billed_tokens', 0)
+
+    def run(self, tasks: Iterator[Dict[str, Any]]) -> None:
+        """
+        Submit tasks as workers free up, so a large input file is never read
+        into memory at once. Ctrl+C stops submitting, and the running tasks
+        finish and are recorded before the run ends.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            pending = set()
+            try:
+                for task in tasks:
+                    if len(pending) >= self.concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._write(future.result())
+                    pending.add(pool.submit(self.run_task, task))
+                for future in wait(pending).done:
+                    self._write(future.result())
+            except KeyboardInterrupt:
+                self._cancelled.set()
+                print("\nInterrupted: waiting for running tasks to finish...", file=sys.stderr)
+                for future in wait(pending).done:
+                    self._write(future.result())
+                raise
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run prompts from a JSONL file concurrently")
+    parser.add_argument('tasks', help='JSONL file with one {"id", "prompt"} task per line')
+    parser.add_argument('-o', '--output', help="results JSONL file (default: stdout)")
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help="tasks run at the same time")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show assistant output on stderr")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    started = time.perf_counter()
+    runner = None
+    try:
+        runner = BatchRunner(output, concurrency=args.concurrency, verbose=args.verbose)
+        runner.run(read_tasks(args.tasks))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if runner is not None:
+            print(f"{runner.completed} tasks succeeded, {runner.failed} failed in "
+                  f"{time.perf_counter() - started:.1f}s; {runner.billed_tokens:,} tokens billed",
+                  file=sys.stderr)
+    return 1 if runner is None or runner.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Offline benchmark of the agent loop: runs ce3.Assistant and the app.py /chat
+endpoint against a local fake Messages API and reports the time spent outside
+the model.
+
+    python -m benchmarks.bench_agent_loop --turns 300 --target both
+
+Per turn, the fake server's handling time (including the simulated model
+latency) is subtracted from the wall-clock time of the turn, leaving the
+framework overhead: history handling, serialization, streaming, tool dispatch,
+display and, for app.py, Flask, plus any --tool-latency that is not hidden
+behind generation by speculative tool execution. Tool dispatch is the tool
+round time minus the time spent inside the benchmark tool itself, measured on
+turns without speculative calls. Memory is the process RSS growth over the run.
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import builtins
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_api import FakeMessagesAPI  # noqa: E402
+from config import Config  # noqa: E402
+from core.context import estimate_text_tokens  # noqa: E402
+from tools.base import BaseTool  # noqa: E402
+
+
+class BenchEchoTool(BaseTool):
+    """
+    Read-only tool returning a fixed payload, so tool rounds measure the
+    dispatch path rather than real work.
+    """
+
+    name = "benchechotool"
+    read_only = True
+    description = "Returns a fixed block of text. Only used by the benchmarks."
+    input_schema = {
+        "type": "object",
+        "properties": {"path": {"type": "string"}},
+        "required": []
+    }
+
+    def __init__(self, payload_bytes: int, latency: float = 0.0):
+        line = "def handler(request):  # benchmark payload line\n"
+        self.payload = (line * (payload_bytes // len(line) + 1))[:payload_bytes]
+        self.latency = latency
+        self.exec_time = 0.0
+        self._running = 0
+        self._busy_since = 0.0
+        self._lock = threading.Lock()
+
+    def execute(self, **kwargs) -> str:
+        # exec_time is the time at least one call was running, so concurrent calls count once
+        with self._lock:
+            if not self._running:
+                self._busy_since = time.perf_counter()
+            self._running += 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return json.dumps({kwargs.get('path', 'bench.py'): self.payload})
+        finally:
+            with self._lock:
+                self._running -= 1
+                if not self._running:
+                    self.exec_time += time.perf_counter() - self._busy_since
+
+    def take_exec_time(self) -> float:
+        with self._lock:
+            total, self.exec_time = self.exec_time, 0.0
+            return total
+
+
+class BenchFillerTool(BaseTool):
+    """
+    Installed but unrelated tool, to measure how the request grows with the
+    number of installed tools.
+    """
+
+    name = "fillertool"
+    description = ""
+    read_only = True
+    input_schema = {
+        "type": "object",
+        "properties": {
+            "target": {"type": "string", "description": "Identifier of the record to process"},
+            "options": {"type": "object", "description": "Processing options for the record"}
+        },
+        "required": ["target"]
+    }
+
+    def __init__(self, number: int):
+        self.name = f"fillertool{number}"
+        self.description = (
+            f"Processes inventory records of warehouse {number}: validates the quantities, "
+            "reconciles them with the ledger and reports discrepancies by section. "
+        ) * 4
+
+    def execute(self, **kwargs) -> str:
+        return "ok"
+
+
+def rss_bytes() -> int:
+    """
+    Current resident set size, or the peak where the current one is unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values) if values else 0.0,
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'max': max(values) if values else 0.0
+    }
+
+
+def configure(args, work_dir: str) -> None:
+    """
+    Point Config at the fake server's environment before any Assistant exists.
+    Everything the run writes (journals, traces) goes to work_dir.
+    """
+    Config.ANTHROPIC_API_KEY = Config.ANTHROPIC_API_KEY or "bench-key"
+    Config.ENABLE_STREAMING = not args.no_stream
+    Config.SPECULATIVE_TOOL_EXECUTION = not args.no_speculation
+    Config.MODEL_ROUTING = args.routing
+    Config.TOOL_SELECTION = not args.no_tool_selection
+    Config.SESSIONS_DIR = Path(work_dir) / "sessions"
+    # Fake spans must not end up in the user's trace file and 'stats all'
+    Config.TRACE_PATH = Path(work_dir) / "traces.jsonl"
+    Config.ENABLE_SESSION_JOURNAL = not args.no_journal
+    # The benchmark must not be throttled by the client-side rate limiter
+    Config.RATE_LIMIT_REQUESTS_PER_MINUTE = None
+    Config.RATE_LIMIT_TOKENS_PER_MINUTE = None
+    # Tools with missing dependencies are skipped instead of prompting
+    builtins.input = lambda *_: "n"
+
+
+def prepare(assistant, tool: BenchEchoTool, extra_tools: int = 0) -> None:
+    from rich.console import Console
+
+    assistant.console = Console(file=open(os.devnull, 'w'), width=120)
+    assistant.thinking_enabled = False
+    for number in range(extra_tools):
+        assistant.tool_registry.register(BenchFillerTool(number))
+    assistant.tool_registry.register(tool)
+    assistant.tools = assistant._tool_definitions()
+    assistant._index_tools([tool.name])
+
+
+def run_turns(name: str, send_turn, assistant, api: FakeMessagesAPI, tool: BenchEchoTool,
+              args) -> Dict[str, Any]:
+    for turn in range(args.warmup):
+        send_turn(f"Warm-up request {turn}")
+    api.take_request_time()
+    tool.take_exec_time()
+
+    overheads, walls, dispatch_per_call, tool_calls, speculative_calls = [], [], [], 0, 0
+    steps, fast_requests, redone, cost_start = 0, 0, 0, assistant.total_cost
+    rss_start = rss_bytes()
+    started = time.perf_counter()
+
+    for turn in range(args.turns):
+        turn_started = time.perf_counter()
+        send_turn(f"Please look at bench_{turn}.py and tell me what it does.")
+        wall = time.perf_counter() - turn_started
+        walls.append(wall)
+        overheads.append(wall - api.take_request_time())
+        steps += len(assistant.last_turn_steps)
+        fast_requests += sum(1 for record in assistant.last_turn_steps if record.route == 'fast')
+        redone += sum(1 for record in assistant.last_turn_steps if record.escalated)
+
+        calls = sum(len(record.tool_calls) for record in assistant.last_turn_steps)
+        speculative = sum(record.speculative_calls for record in assistant.last_turn_steps)
+        round_time = sum(record.tool_latency for record in assistant.last_turn_steps)
+        exec_time = tool.take_exec_time()
+        if calls and not speculative:
+            dispatch_per_call.append((round_time - exec_time) / calls)
+        tool_calls += calls
+        speculative_calls += speculative
+
+    elapsed = time.perf_counter() - started
+    rss_growth = rss_bytes() - rss_start
+    return {
+        'target': name,
+        'turns': args.turns,
+        'requests': api.request_count,
+        'tool_calls': tool_calls,
+        'speculative_calls': speculative_calls,
+        'steps': steps,
+        'fast_requests': fast_requests,
+        'redone_requests': redone,
+        'cost': assistant.total_cost - cost_start,
+        'elapsed': elapsed,
+        'turn_wall': summarize(walls),
+        'turn_overhead': summarize(overheads),
+        'tool_dispatch_per_call': summarize(dispatch_per_call),
+        'rss_growth_bytes': rss_growth,
+        'rss_growth_per_turn_bytes': rss_growth / args.turns if args.turns else 0,
+        'tools_offered': len(assistant.request_tools),
+        'tools_installed': len(assistant.tools),
+        'tools_tokens': estimate_text_tokens(json.dumps(assistant.request_tools)),
+        'history_messages': len(assistant.conversation_history),
+        'context_tokens': assistant.context_tokens
+    }
+
+
+def bench_ce3(args, api: FakeMessagesAPI, tool: BenchEchoTool) -> Dict[str, Any]:
+    import ce3
+
+    assistant = ce3.Assistant()
+    prepare(assistant, tool, args.extra_tools)
+    return run_turns('ce3', assistant.chat, assistant, api, tool, args)
+
+
+def bench_app(args, api: FakeMessagesAPI, tool: BenchEchoTool) -> Dict[str, Any]:
+    import app as web_app
+
+    assistant = web_app.get_assistant()
+    prepare(assistant, tool, args.extra_tools)
+    client = web_app.app.test_client()
+
+    def send_turn(message: str):
+        response = client.post('/chat', json={'message': message})
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat returned {response.status_code}")
+        return response.get_json()
+
+    return run_turns('app', send_turn, assistant, api, tool, args)
+
+
+def print_report(result: Dict[str, Any], args) -> None:
+    ms = lambda seconds: f"{seconds * 1000:8.2f} ms"  # noqa: E731
+    overhead = result['turn_overhead']
+    dispatch = result['tool_dispatch_per_call']
+    mode = "non-streaming" if args.no_stream else "streaming"
+    print(f"\n{result['target']}: {result['turns']} turns, {args.tool_rounds} tool rounds x "
+          f"{args.tools_per_round} calls, {mode}, latency {args.latency * 1000:.0f} ms")
+    print(f"  turn overhead    mean {ms(overhead['mean'])}  p50 {ms(overhead['p50'])}  "
+          f"p95 {ms(overhead['p95'])}  max {ms(overhead['max'])}")
+    if dispatch['count']:
+        print(f"  tool dispatch    mean {ms(dispatch['mean'])}  p50 {ms(dispatch['p50'])}  "
+              f"p95 {ms(dispatch['p95'])}  per call")
+    wall = result['turn_wall']
+    print(f"  turn time        mean {ms(wall['mean'])}  p50 {ms(wall['p50'])}  "
+          f"p95 {ms(wall['p95'])}  cost ${result['cost'] / result['turns']:.4f} per turn")
+    if args.routing:
+        print(f"  routing          {result['fast_requests']} of {result['steps']} requests on the fast model, "
+              f"{result['redone_requests']} redone")
+    if result['speculative_calls']:
+        print(f"  speculation      {result['speculative_calls']} of {result['tool_calls']} tool calls "
+              f"started while streaming")
+    print(f"  tools            {result['tools_offered']} of {result['tools_installed']} offered, "
+          f"~{result['tools_tokens']:,} tokens per request")
+    print(f"  memory           rss {result['rss_growth_bytes'] / 1024 / 1024:+.1f} MB "
+          f"({result['rss_growth_per_turn_bytes'] / 1024:+.1f} KB/turn)")
+    print(f"  history          {result['history_messages']} messages, "
+          f"~{result['context_tokens']:,} tokens; {result['requests']} requests in {result['elapsed']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent loop benchmark")
+    parser.add_argument('--target', choices=['ce3', 'app', 'both'], default='both')
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--tool-rounds', type=int, default=1, help="tool rounds per turn")
+    parser.add_argument('--tools-per-round', type=int, default=2, help="tool calls per round")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument('--block-latency', type=float, default=0.0,
+                        help="simulated generation time per streamed content block in seconds")
+    parser.add_argument('--tool-latency', type=float, default=0.0, help="time each tool call takes in seconds")
+    parser.add_argument('--payload-bytes', type=int, default=4000, help="size of each tool result")
+    parser.add_argument('--no-stream', action='store_true', help="use non-streaming requests")
+    parser.add_argument('--no-journal', action='store_true', help="disable the session journal")
+    parser.add_argument('--no-speculation', action='store_true',
+                        help="wait for the whole response before starting read-only tools")
+    parser.add_argument('--routing', action='store_true', help="send tool rounds to Config.FAST_MODEL")
+    parser.add_argument('--fast-latency', type=float, default=None,
+                        help="simulated latency of Config.FAST_MODEL requests (default: --latency)")
+    parser.add_argument('--no-tool-selection', action='store_true', help="send every installed tool")
+    parser.add_argument('--extra-tools', type=int, default=0, help="unrelated tools installed besides the real ones")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    targets = ['ce3', 'app'] if args.target == 'both' else [args.target]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ce3-bench-") as work_dir:
+        configure(args, work_dir)
+        for target in targets:
+            api = FakeMessagesAPI(
+                BenchEchoTool.name, {"path": "bench.py"},
+                tool_rounds=args.tool_rounds, tools_per_round=args.tools_per_round,
+                latency=args.latency, block_latency=args.block_latency,
+                model_latency=None if args.fast_latency is None else {Config.FAST_MODEL: args.fast_latency}
+            )
+            os.environ['ANTHROPIC_BASE_URL'] = api.start()
+            tool = BenchEchoTool(args.payload_bytes, latency=args.tool_latency)
+            try:
+                runner = bench_ce3 if target == 'ce3' else bench_app
+                result = runner(args, api, tool)
+            finally:
+                api.stop()
+            results.append(result)
+            print_report(result, args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
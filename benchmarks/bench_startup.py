@@ -0,0 +1,324 @@
+"""
+Startup benchmark: the time from launching `python ce3.py` to its first
+prompt, the import time of ce3, app and the tool worker, and where that time
+goes according to `python -X importtime`.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --check --baseline startup.json
+
+Every measurement runs in a fresh interpreter. Bytecode is compiled first, so
+the numbers don't include compiling modules changed since the last run.
+Import times are the cumulative -X importtime of the module; the time to
+first prompt is wall-clock time, interpreter start included, measured in a
+pseudo-terminal (POSIX only). The CLI's breakdown covers the imports that
+finished before the prompt appeared, which can include the first modules of
+the SDK import it starts in the background.
+
+With --check the exit status is 1 when a median is over its budget (or more
+than --tolerance above the same target in --baseline, a file written by
+--json), or when a module listed in DEFERRED is imported at startup.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import compileall
+import json
+import os
+import re
+import select
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Milliseconds allowed per target: about twice the current times on a
+# development machine, so noise passes and an eagerly imported SDK does not
+BUDGETS_MS = {
+    'cli': 600,
+    'ce3': 250,
+    'app': 500,
+    'worker': 50,
+}
+# Modules imported on first use; loading one at startup is a regression.
+# The CLI starts importing the SDK in the background once its prompt is up,
+# so only the modules it never needs before the first message are listed.
+DEFERRED = {
+    'cli': ('rich.markdown', 'PIL'),
+    'ce3': ('anthropic', 'httpx', 'pydantic', 'prompt_toolkit', 'rich.markdown', 'rich.live', 'PIL'),
+    'app': ('anthropic', 'httpx', 'pydantic', 'prompt_toolkit', 'rich.markdown', 'rich.live', 'PIL'),
+    'worker': ('anthropic', 'rich', 'prompt_toolkit', 'PIL'),
+}
+IMPORT_TARGETS = {
+    'ce3': 'ce3',
+    'app': 'app',
+    'worker': 'core.tool_worker',
+}
+PROMPT = "You: "
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|( +)(\S+)')
+_ANSI = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-_]')
+
+
+def parse_importtime(lines: List[str]) -> List[Tuple[str, float, float, int]]:
+    """
+    (module, self ms, cumulative ms, depth) for each line of -X importtime
+    output. Imports done by site (interpreter start, .pth files) are left out.
+    """
+    entries = []
+    for line in lines:
+        match = _IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            depth = (len(indent) - 1) // 2
+            if name == 'site' and depth == 0:
+                entries = []
+                continue
+            entries.append((name, int(own) / 1000, int(cumulative) / 1000, depth))
+    return entries
+
+
+def breakdown(entries: List[Tuple[str, float, float, int]], top: int) -> List[Tuple[str, float]]:
+    """
+    Self time per top-level package, largest first.
+    """
+    packages: Dict[str, float] = {}
+    for name, own, _, _ in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + own
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def environment() -> Dict[str, str]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), env.get('PYTHONPATH')]))
+    # The CLI stops before its prompt without a key; no request is made
+    env.setdefault('ANTHROPIC_API_KEY', 'bench-key')
+    env.setdefault('TERM', 'xterm')
+    return env
+
+
+def measure_import(module: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float, float, int]]]:
+    """
+    Import time of a module in ms and the -X importtime entries behind it.
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True, timeout=120
+    )
+    entries = parse_importtime(completed.stderr.splitlines())
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    total = next((cumulative for name, _, cumulative, depth in entries if name == module and depth == 0), None)
+    if total is None:
+        raise RuntimeError(f"no -X importtime entry for {module}")
+    return total, entries
+
+
+def measure_first_prompt(env: Dict[str, str], importtime: bool,
+                         timeout: float) -> Tuple[float, List[Tuple[str, float, float, int]]]:
+    """
+    Launch the CLI in a pseudo-terminal and return the ms until its prompt
+    appears, answering 'n' to dependency installs on the way, then quit it.
+    With importtime, also the -X importtime entries of the imports that
+    finished before the prompt.
+    """
+    import fcntl
+    import pty
+    import struct
+    import termios
+
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', 40, 120, 0, 0))
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [str(ROOT / 'ce3.py')]
+    stderr_lines: List[Tuple[float, str]] = []
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env, stdin=slave, stdout=slave,
+        stderr=subprocess.PIPE if importtime else slave, start_new_session=True
+    )
+    os.close(slave)
+    if importtime:
+        def read_stderr():
+            for line in iter(process.stderr.readline, b''):
+                stderr_lines.append((time.perf_counter(), line.decode('utf-8', 'replace')))
+        reader = threading.Thread(target=read_stderr, daemon=True)
+        reader.start()
+
+    output, answered, prompted_at = "", 0, None
+    try:
+        while prompted_at is None and time.perf_counter() - started < timeout:
+            ready, _, _ = select.select([master], [], [], 0.05)
+            if not ready:
+                if process.poll() is not None:
+                    break
+                continue
+            try:
+                chunk = os.read(master, 65536)
+            except OSError:  # The terminal closes when the process exits
+                break
+            output += _ANSI.sub('', chunk.decode('utf-8', 'replace'))
+            if PROMPT in output:
+                prompted_at = time.perf_counter()
+            elif output.count('(y/n):') > answered:
+                answered += 1
+                os.write(master, b'n\r')
+
+        if prompted_at is not None:
+            os.write(master, b'quit\r')
+        exit_deadline = time.perf_counter() + 10
+        while process.poll() is None and time.perf_counter() < exit_deadline:
+            ready, _, _ = select.select([master], [], [], 0.05)
+            if ready:
+                try:
+                    os.read(master, 65536)
+                except OSError:
+                    break
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        os.close(master)
+    if importtime:
+        reader.join(timeout=5)
+
+    if prompted_at is None:
+        raise RuntimeError(f"no prompt within {timeout:.0f}s; output:\n{output[-2000:]}")
+    lines = [line for arrived, line in stderr_lines if arrived <= prompted_at]
+    return (prompted_at - started) * 1000, parse_importtime(lines)
+
+
+def run_target(target: str, args, env: Dict[str, str]) -> Dict[str, Any]:
+    times = []
+    if target == 'cli':
+        for _ in range(args.runs):
+            times.append(measure_first_prompt(env, False, args.timeout)[0])
+        # One more run for the breakdown: -X importtime slows imports down
+        _, entries = measure_first_prompt(env, True, args.timeout)
+    else:
+        runs = [measure_import(IMPORT_TARGETS[target], env) for _ in range(args.runs)]
+        times = [total for total, _ in runs]
+        median = statistics.median(times)
+        _, entries = min(runs, key=lambda run: abs(run[0] - median))
+
+    imported = {name for name, _, _, _ in entries}
+    deferred = [module for module in DEFERRED.get(target, ())
+                if any(name == module or name.startswith(module + '.') for name in imported)]
+    slowest = sorted(
+        (entry for entry in entries if entry[3] <= 1 and entry[0] != IMPORT_TARGETS.get(target)),
+        key=lambda entry: -entry[2]
+    )[:args.top]
+    return {
+        'target': target,
+        'runs': len(times),
+        'median_ms': statistics.median(times),
+        'min_ms': min(times),
+        'max_ms': max(times),
+        'budget_ms': args.budgets.get(target),
+        'modules': len(entries),
+        'packages': [{'package': name, 'self_ms': own} for name, own in breakdown(entries, args.top)],
+        'slowest': [{'module': name, 'cumulative_ms': cumulative} for name, _, cumulative, _ in slowest],
+        'deferred_imported': deferred
+    }
+
+
+def check(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    The regressions in a set of results, as messages.
+    """
+    previous = {result['target']: result for result in (baseline or {}).get('results', [])}
+    failures = []
+    for result in results:
+        target, median = result['target'], result['median_ms']
+        if result['budget_ms'] is not None and median > result['budget_ms']:
+            failures.append(f"{target}: {median:.0f} ms is over the {result['budget_ms']:.0f} ms budget")
+        if target in previous:
+            limit = previous[target]['median_ms'] * (1 + tolerance)
+            if median > limit:
+                failures.append(f"{target}: {median:.0f} ms is more than {tolerance:.0%} above "
+                                f"the baseline's {previous[target]['median_ms']:.0f} ms")
+        for module in result['deferred_imported']:
+            failures.append(f"{target}: {module} is imported at startup")
+    return failures
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    label = "time to first prompt" if result['target'] == 'cli' else f"import {IMPORT_TARGETS[result['target']]}"
+    budget = f", budget {result['budget_ms']:.0f} ms" if result['budget_ms'] is not None else ""
+    print(f"\n{result['target']}: {label}, {result['runs']} runs{budget}")
+    print(f"  time             median {result['median_ms']:8.1f} ms  min {result['min_ms']:8.1f} ms  "
+          f"max {result['max_ms']:8.1f} ms")
+    print(f"  modules          {result['modules']} imported")
+    print("  by package       " + ", ".join(
+        f"{row['package']} {row['self_ms']:.1f}" for row in result['packages']) + " (ms, self time)")
+    print("  slowest imports  " + ", ".join(
+        f"{row['module']} {row['cumulative_ms']:.1f}" for row in result['slowest']) + " (ms, cumulative)")
+    if result['deferred_imported']:
+        print(f"  imported early   {', '.join(result['deferred_imported'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument('--target', choices=['cli', 'ce3', 'app', 'worker', 'all'], default='all')
+    parser.add_argument('--runs', type=int, default=5, help="measurements per target; the median is reported")
+    parser.add_argument('--top', type=int, default=8, help="packages and modules listed in the breakdowns")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for the CLI prompt")
+    parser.add_argument('--budget', action='append', default=[], metavar='TARGET=MS',
+                        help="override a target's budget, e.g. --budget cli=800")
+    parser.add_argument('--baseline', metavar='PATH', help="results written by --json to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown relative to --baseline (0.25 = 25%%)")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 on a regression")
+    parser.add_argument('--no-compile', action='store_true', help="don't compile bytecode first")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    args.budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        target, _, value = item.partition('=')
+        if target not in BUDGETS_MS or not value:
+            parser.error(f"--budget expects TARGET=MS with TARGET one of {', '.join(BUDGETS_MS)}")
+        args.budgets[target] = float(value)
+
+    targets = ['cli', 'ce3', 'app', 'worker'] if args.target == 'all' else [args.target]
+    if 'cli' in targets and os.name != 'posix':
+        print("Skipping cli: measuring the first prompt needs a POSIX pseudo-terminal")
+        targets.remove('cli')
+
+    if not args.no_compile:
+        for path in ('ce3.py', 'app.py', 'config.py'):
+            compileall.compile_file(str(ROOT / path), quiet=2)
+        for directory in ('core', 'tools', 'prompts'):
+            compileall.compile_dir(str(ROOT / directory), quiet=2)
+
+    env = environment()
+    results = []
+    for target in targets:
+        result = run_target(target, args, env)
+        results.append(result)
+        print_report(result)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    failures = check(results, baseline, args.tolerance)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'results': results, 'failures': failures}, f, indent=2)
+
+    print()
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if not failures:
+        print("Startup within budget")
+    if failures and args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
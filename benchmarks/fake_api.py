@@ -0,0 +1,222 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import itertools
+import json
+import threading
+import time
+
+
+class FakeMessagesAPI:
+    """
+    Local stand-in for the Anthropic Messages endpoint, for offline benchmarks.
+
+    Every user turn is answered with `tool_rounds` assistant messages that each
+    call `tool_name` `tools_per_round` times, followed by an end_turn text
+    reply. The position in the turn is derived from the request's messages, so
+    any number of clients can share one server. Both plain and streamed
+    (`stream: true`) requests are supported; `latency` seconds (or the
+    `model_latency` of the requested model) are spent before each response
+    to stand in for model time, and a streamed response waits
+    `block_latency` seconds after each content block to stand in for
+    generation time.
+
+    The time spent handling every request is recorded in `request_times`, so
+    a benchmark can subtract it and keep only the client-side overhead.
+    """
+
+    def __init__(self, tool_name: str, tool_input: Optional[Dict[str, Any]] = None,
+                 tool_rounds: int = 1, tools_per_round: int = 1, latency: float = 0.0,
+                 block_latency: float = 0.0, model_latency: Optional[Dict[str, float]] = None,
+                 reply_text: str = "Done. Everything you asked for is in place."):
+        self.tool_name = tool_name
+        self.tool_input = tool_input or {}
+        self.tool_rounds = tool_rounds
+        self.tools_per_round = tools_per_round
+        self.latency = latency
+        self.block_latency = block_latency
+        self.model_latency = model_latency or {}
+        self.reply_text = reply_text
+        self.request_times: List[float] = []
+        self.request_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """
+        Serve on a free local port in a background thread. Returns the base URL.
+        """
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-messages-api", daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def take_request_time(self) -> float:
+        """
+        Total handling time of the requests served since the last call.
+        """
+        with self._lock:
+            total = sum(self.request_times)
+            self.request_times.clear()
+            return total
+
+    def respond(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The scripted Message for a request body.
+        """
+        messages = body.get('messages', [])
+        rounds_done = 0
+        for message in reversed(messages):
+            if message.get('role') == 'assistant':
+                rounds_done += 1
+            elif not _is_tool_result(message):
+                break
+
+        if rounds_done < self.tool_rounds:
+            content = [{"type": "text", "text": "Let me check that."}]
+            for _ in range(self.tools_per_round):
+                content.append({
+                    "type": "tool_use",
+                    "id": f"toolu_bench_{next(self._ids)}",
+                    "name": self.tool_name,
+                    "input": self.tool_input
+                })
+            stop_reason = "tool_use"
+        else:
+            content = [{"type": "text", "text": self.reply_text}]
+            stop_reason = "end_turn"
+
+        return {
+            "id": f"msg_bench_{next(self._ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get('model', 'fake-model'),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": len(json.dumps(messages)) // 4,
+                "output_tokens": 20,
+                "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0
+            }
+        }
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes on a kept-alive
+            # connection; with Nagle on, each response would wait ~40 ms for
+            # the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                started = time.perf_counter()
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                message = api.respond(body)
+                latency = api.model_latency.get(body.get('model'), api.latency)
+                if latency:
+                    time.sleep(latency)
+                if body.get('stream'):
+                    self._send_stream(message)
+                else:
+                    self._send_json(message)
+                with api._lock:
+                    api.request_count += 1
+                    api.request_times.append(time.perf_counter() - started)
+
+            def _send_json(self, message):
+                data = json.dumps(message).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, message):
+                if api.block_latency:
+                    return self._send_stream_slowly(message)
+                data = "".join(self._stream_events(message)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream_slowly(self, message):
+                # One chunk per content block, so the client sees each block close in time
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                pending = []
+                for event in self._stream_events(message):
+                    pending.append(event)
+                    if event.startswith('event: content_block_stop'):
+                        self._write_chunk("".join(pending))
+                        pending = []
+                        time.sleep(api.block_latency)
+                self._write_chunk("".join(pending))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream_events(self, message):
+                chunks = []
+
+                def event(event_type, data):
+                    data['type'] = event_type
+                    chunks.append(f"event: {event_type}\ndata: {json.dumps(data)}\n\n")
+
+                event('message_start', {"message": dict(message, content=[], stop_reason=None)})
+                for index, block in enumerate(message['content']):
+                    if block['type'] == 'text':
+                        event('content_block_start', {"index": index, "content_block": {"type": "text", "text": ""}})
+                        for start in range(0, len(block['text']), 16):
+                            event('content_block_delta', {
+                                "index": index,
+                                "delta": {"type": "text_delta", "text": block['text'][start:start + 16]}
+                            })
+                    else:
+                        event('content_block_start', {
+                            "index": index,
+                            "content_block": dict(block, input={})
+                        })
+                        event('content_block_delta', {
+                            "index": index,
+                            "delta": {"type": "input_json_delta", "partial_json": json.dumps(block['input'])}
+                        })
+                    event('content_block_stop', {"index": index})
+                event('message_delta', {
+                    "delta": {"stop_reason": message['stop_reason'], "stop_sequence": None},
+                    "usage": {"output_tokens": message['usage']['output_tokens']}
+                })
+                event('message_stop', {})
+                return chunks
+
+        return Handler
+
+
+def _is_tool_result(message: Dict[str, Any]) -> bool:
+    content = message.get('content')
+    return (message.get('role') == 'user' and isinstance(content, list)
+            and any(isinstance(block, dict) and block.get('type') == 'tool_result' for block in content))
@@ -1,25 +1,51 @@
 # ce3.py
-import anthropic
+import argparse
+from rich import box
 from rich.console import Console
-from rich.markdown import Markdown
-from rich.live import Live
-from rich.spinner import Spinner
 from rich.panel import Panel
-from typing import List, Dict, Any
+from rich.text import Text
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 import importlib
 import inspect
 import pkgutil
 import os
-import json
 import sys
+import threading
+import time
 import logging
+from pathlib import Path
+from types import SimpleNamespace
 
 from config import Config
+from core.agent_loop import AgentLoop, StepBudgetExceeded, StepRecord, TurnCancelled
+from core.cache import ToolResultCache
+from core.compaction import ConversationCompactor
+from core.context import ContextTracker
+from core.display import preview
+from core.isolation import ToolCancelled, shared_tool_pool
+from core.journal import SessionJournal
+from core.manifest import ToolManifest, module_changed
+from core.messages import MessageStore, create_message
+from core.ratelimit import RetryScheduler, error_type, shared_limiter
+from core.profiling import SessionProfiler
+from core.prompt_cache import cached_system, cached_tools, with_rolling_breakpoint
+from core.registry import ToolRegistry
+from core.routing import ModelRouter, estimate_cost
+from core.results import ResultPagerTool, ResultStore
+from core.scheduler import ToolScheduler
+from core.streaming import StreamAccumulator
+from core.tool_index import ToolSearchTool, ToolSelector
+from core.tracing import NOOP_SPAN, Tracer
 from tools.base import BaseTool
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
 from prompts.system_prompts import SystemPrompts
 
+# The SDK (with pydantic and httpx), prompt_toolkit and rich's Markdown and Live
+# are imported where they are first used: together they take most of the
+# startup time, and the web app or a batch worker may never need some of them.
+# benchmarks/bench_startup.py keeps track of it.
+if TYPE_CHECKING:
+    import anthropic
+
 # Configure logging to only show ERROR level and above
 logging.basicConfig(
     level=logging.ERROR,
@@ -34,23 +60,206 @@ class Assistant:
     - Handling user commands such as 'refresh' and 'reset'.
     - Token usage tracking and display.
     - Tool execution upon request from model responses.
+
+    Several assistants can share one API client and one tool registry (see
+    batch.py): pass them in and the tools are not loaded again. With
+    interactive=False, missing tool dependencies are skipped instead of
+    prompting for their installation.
     """
 
-    def __init__(self):
+    def __init__(self, client: Optional["anthropic.Anthropic"] = None,
+                 tool_registry: Optional[ToolRegistry] = None,
+                 console: Optional[Console] = None, interactive: bool = True):
         if not getattr(Config, 'ANTHROPIC_API_KEY', None):
             raise ValueError("No ANTHROPIC_API_KEY found in environment variables")
 
-        # Initialize Anthropics client
-        self.client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
+        # Anthropics client, created on first use (see the client property).
+        # Retries are left to self.retry_scheduler, which shares one rate
+        # limiter between every assistant using this key.
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.interactive = interactive
+        requests_per_minute = getattr(Config, 'RATE_LIMIT_REQUESTS_PER_MINUTE', None)
+        tokens_per_minute = getattr(Config, 'RATE_LIMIT_TOKENS_PER_MINUTE', None)
+        limiter = None
+        if requests_per_minute or tokens_per_minute:
+            limiter = shared_limiter(Config.ANTHROPIC_API_KEY, requests_per_minute, tokens_per_minute)
+        self.retry_scheduler = RetryScheduler(
+            limiter,
+            max_retries=getattr(Config, 'MAX_API_RETRIES', 2),
+            base_delay=getattr(Config, 'RETRY_BASE_DELAY', 1.0),
+            max_delay=getattr(Config, 'RETRY_MAX_DELAY', 60.0)
+        )
+
+        self.conversation_history = MessageStore()
+        self.console = console or Console()
 
-        self.conversation_history: List[Dict[str, Any]] = []
-        self.console = Console()
+        # Every message is appended to the session journal as it is produced
+        self.journal = None
+        if getattr(Config, 'ENABLE_SESSION_JOURNAL', False):
+            self.journal = SessionJournal(self._sessions_dir())
+        self._resume_thread = None
+        self._resumed_history: List[Dict[str, Any]] = []
 
+        self.model = Config.MODEL
         self.thinking_enabled = getattr(Config, 'ENABLE_THINKING', False)
         self.temperature = getattr(Config, 'DEFAULT_TEMPERATURE', 0.7)
+        # total_tokens_used is cumulative billing usage (every request, including
+        # cached input); limits use the real prompt size from self.context instead.
         self.total_tokens_used = 0
+        self.total_cost = 0.0
+        self.context = ContextTracker()
+        # Intermediate tool rounds go to a faster model, see core.routing
+        self.router = None
+        if getattr(Config, 'MODEL_ROUTING', False) and getattr(Config, 'FAST_MODEL', None):
+            self.router = ModelRouter(
+                Config.FAST_MODEL,
+                fast_max_tokens=getattr(Config, 'FAST_MODEL_MAX_TOKENS', None),
+                routes=getattr(Config, 'MODEL_ROUTES', None)
+            )
+        self.compactor = None
+        if getattr(Config, 'ENABLE_COMPACTION', False):
+            self.compactor = ConversationCompactor(
+                threshold=getattr(Config, 'COMPACTION_THRESHOLD', int(Config.MAX_CONVERSATION_TOKENS * 0.75)),
+                target=getattr(Config, 'COMPACTION_TARGET', int(Config.MAX_CONVERSATION_TOKENS * 0.5)),
+                keep_turns=getattr(Config, 'COMPACTION_KEEP_TURNS', 2),
+                message_tokens=self.context.message_tokens
+            )
+        self.system_prompt = f"{SystemPrompts.DEFAULT}\n\n{SystemPrompts.TOOL_USAGE}"
+        self.prompt_caching = getattr(Config, 'ENABLE_PROMPT_CACHING', False)
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+
+        # Streaming state: render_stream is switched on by the CLI so text is
+        # printed as it arrives; the web UI leaves it off and gets the final text.
+        self.streaming_enabled = getattr(Config, 'ENABLE_STREAMING', False)
+        # Start read-only tool calls as soon as their block closes in the stream
+        self.speculative_tools = getattr(Config, 'SPECULATIVE_TOOL_EXECUTION', False)
+        self._last_round_speculative = 0
+        self.render_stream = False
+        self.last_response_streamed = False
+        self.last_time_to_first_token = None
+        self._stream_header_shown = False
+        self._last_streamed_text = None
+        # Set when a stream fails after printing part of the response
+        self._stream_interrupted = False
+        self._last_request_ttft = None
+        self._last_request_retries = 0
+        self._last_request_wait = 0.0
+        self._last_request_latency = 0.0
+        self._last_request_cost = None
+        self._last_round_errors = 0
+        # Text of provisional responses is only shown once it is a tool call
+        self._defer_rendering = False
+        self._reserved_tokens = 0
+
+        # Spans for turns, model requests, tool executions and display
+        self.tracer = Tracer(
+            getattr(Config, 'TRACE_PATH', None),
+            enabled=getattr(Config, 'ENABLE_TRACING', False)
+        )
+
+        # cProfile/tracemalloc around chat turns, switched on with 'profile on'
+        self.profiler = SessionProfiler(
+            getattr(Config, 'PROFILE_DIR', Config.BASE_DIR / ".cache" / "profiles"),
+            history_size=lambda: (len(self.conversation_history), self.context_tokens)
+        )
+
+        # Per-step records of the most recent turn (see core.agent_loop)
+        self.last_turn_steps: List[StepRecord] = []
+
+        # Tool name -> live instance, filled by _load_tools / refresh_tools
+        shared_registry = tool_registry is not None and len(tool_registry) > 0
+        self.tool_registry = tool_registry if tool_registry is not None else ToolRegistry()
+        # Tools bound to this assistant's own state, kept out of the shared registry
+        self.builtin_tools: Dict[str, BaseTool] = {}
+        self.tool_manifest = ToolManifest(
+            getattr(Config, 'TOOL_MANIFEST_PATH', Config.BASE_DIR / ".cache" / "tool_manifest.json")
+        )
+        # Full text of oversized tool results, read back through the pager tool
+        self.result_store = ResultStore(
+            token_budget=getattr(Config, 'TOOL_RESULT_TOKEN_BUDGET', None),
+            page_tokens=getattr(Config, 'TOOL_RESULT_PAGE_TOKENS', 4000)
+        )
+        # Results of repeated read-only tool calls
+        cache_size = getattr(Config, 'TOOL_CACHE_SIZE', 0)
+        self.tool_cache = ToolResultCache(max_entries=cache_size) if cache_size else None
+        # Module name -> fingerprint of the file as last loaded, for incremental refresh
+        self._tool_module_state: Dict[str, Dict[str, Any]] = {}
+        # Set to stop the current turn: Ctrl+C in the CLI, client disconnect in app.py
+        self.cancel_event = threading.Event()
+        # Worker processes for tools from tools/, killed when they overrun or are cancelled
+        self.tool_pool = shared_tool_pool(
+            getattr(Config, 'TOOL_WORKER_PROCESSES', 8),
+            getattr(Config, 'TOOL_MEMORY_LIMIT_MB', None)
+        ) if getattr(Config, 'TOOL_ISOLATION', False) else None
+        self._tool_round_deadline: Optional[float] = None
+        self.tool_scheduler = ToolScheduler(
+            self._execute_tool,
+            self._is_read_only_tool,
+            max_workers=getattr(Config, 'MAX_CONCURRENT_TOOLS', 4),
+            cancel_event=self.cancel_event,
+            time_limit=self._tool_time_limit
+        )
+
+        # Only the tools relevant to the current turn are sent, see core.tool_index
+        self.tool_selector = None
+        self._tool_search_prompt = None
+        if getattr(Config, 'TOOL_SELECTION', False):
+            self.tool_selector = ToolSelector(
+                top_k=getattr(Config, 'TOOL_SELECTION_TOP_K', 6),
+                pinned=list(getattr(Config, 'PINNED_TOOLS', [])) + [ResultPagerTool.name, ToolSearchTool.name],
+                min_tools=getattr(Config, 'TOOL_SELECTION_MIN_TOOLS', 0)
+            )
+            # Sent instead of system_prompt while the selector leaves tools out
+            self._tool_search_prompt = f"{self.system_prompt}\n\n{SystemPrompts.TOOL_SEARCH}"
+
+        if shared_registry:
+            self._register_builtin_tools()
+            self.tools = self._tool_definitions()
+        else:
+            self.tools = self._load_tools()
+        self._index_tools()
+
+    @staticmethod
+    def create_client() -> "anthropic.Anthropic":
+        """
+        An API client for Config.ANTHROPIC_API_KEY, safe to share between
+        assistants and threads.
+        """
+        import anthropic
+        return anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY, max_retries=0)
 
-        self.tools = self._load_tools()
+    @property
+    def client(self) -> "anthropic.Anthropic":
+        """
+        The API client. Importing the SDK and setting up its HTTP client take
+        about half a second, so unless a client was passed in it is created
+        by the first request (or by warm_up) rather than at startup.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    @client.setter
+    def client(self, client: "anthropic.Anthropic") -> None:
+        self._client = client
+
+    def warm_up(self) -> None:
+        """
+        Create the API client in a background thread, so that it is ready
+        by the time the user has typed the first message. Errors are left
+        for the first request to report.
+        """
+        def create():
+            try:
+                self.client
+            except Exception as e:
+                logging.debug(f"Client warm-up failed: {str(e)}")
+
+        threading.Thread(target=create, name="ce3-warm-up", daemon=True).start()
 
     def _execute_uv_install(self, package_name: str) -> bool:
         """
@@ -64,6 +273,15 @@ class Assistant:
                 "packages": [package_name]
             }
 
+        # The installer may be needed before its own module was reached while loading
+        if ToolUseMock.name not in self.tool_registry:
+            try:
+                module = importlib.import_module(f'tools.{ToolUseMock.name}')
+                self._extract_tools_from_module(module, [])
+            except Exception as e:
+                self.console.print(f"[red]Could not load {ToolUseMock.name}:[/red] {str(e)}")
+                return False
+
         result = self._execute_tool(ToolUseMock())
         if "Error" not in result and "failed" not in result.lower():
             self.console.print("[green]The package was installed successfully.[/green]")
@@ -74,18 +292,21 @@ class Assistant:
 
     def _load_tools(self) -> List[Dict[str, Any]]:
         """
-        Dynamically load all tool classes from the tools directory.
+        Load all tool classes from the tools directory.
+        With LAZY_TOOL_LOADING, tool metadata comes from the tool manifest and a
+        module is only imported when one of its tools is first executed.
         If a dependency is missing, prompt the user to install it via uvpackagemanager.
         
         Returns:
             A list of tools (dicts) containing their 'name', 'description', and 'input_schema'.
         """
-        tools = []
+        self.tool_registry.clear()
+        self._tool_module_state = {}
         tools_path = getattr(Config, 'TOOLS_DIR', None)
 
         if tools_path is None:
             self.console.print("[red]TOOLS_DIR not set in Config[/red]")
-            return tools
+            return []
 
         # Clear cached tool modules for fresh import
         for module_name in list(sys.modules.keys()):
@@ -93,39 +314,155 @@ class Assistant:
                 del sys.modules[module_name]
 
         try:
-            for module_info in pkgutil.iter_modules([str(tools_path)]):
-                if module_info.name == 'base':
-                    continue
-
-                # Attempt loading the tool module
-                try:
-                    module = importlib.import_module(f'tools.{module_info.name}')
-                    self._extract_tools_from_module(module, tools)
-                except ImportError as e:
-                    # Handle missing dependencies
-                    missing_module = self._parse_missing_dependency(str(e))
-                    self.console.print(f"\n[yellow]Missing dependency:[/yellow] {missing_module} for tool {module_info.name}")
-                    user_response = input(f"Would you like to install {missing_module}? (y/n): ").lower()
-
-                    if user_response == 'y':
-                        success = self._execute_uv_install(missing_module)
-                        if success:
-                            # Retry loading the module after installation
-                            try:
-                                module = importlib.import_module(f'tools.{module_info.name}')
-                                self._extract_tools_from_module(module, tools)
-                            except Exception as retry_err:
-                                self.console.print(f"[red]Failed to load tool after installation: {str(retry_err)}[/red]")
-                        else:
-                            self.console.print(f"[red]Installation of {missing_module} failed. Skipping this tool.[/red]")
-                    else:
-                        self.console.print(f"[yellow]Skipping tool {module_info.name} due to missing dependency[/yellow]")
-                except Exception as mod_err:
-                    self.console.print(f"[red]Error loading module {module_info.name}:[/red] {str(mod_err)}")
+            for module_name, file_path in self._scan_tool_modules(tools_path).items():
+                self._tool_module_state[module_name] = module_changed(None, file_path)
+                self._load_tool_module(module_name, file_path)
         except Exception as overall_err:
             self.console.print(f"[red]Error in tool loading process:[/red] {str(overall_err)}")
 
-        return tools
+        self._save_tool_manifest()
+        self._register_builtin_tools()
+
+        # The registry holds one instance per name, so duplicates collapse here
+        return self._tool_definitions()
+
+    def _register_builtin_tools(self) -> None:
+        """
+        Set up tools that are part of the assistant rather than the tools
+        directory. They live outside the registry, so refresh never touches
+        them and a shared registry doesn't mix up assistants' state.
+        """
+        self.builtin_tools = {}
+        if self.result_store.token_budget:
+            pager = ResultPagerTool(self.result_store)
+            self.builtin_tools[pager.name] = pager
+        if self.tool_selector is not None:
+            search = ToolSearchTool(self.tool_selector)
+            self.builtin_tools[search.name] = search
+
+    def _tool_definitions(self) -> List[Dict[str, Any]]:
+        """
+        Definitions of the registry's tools followed by the built-in ones.
+        """
+        builtin = [
+            {"name": tool.name, "description": tool.description, "input_schema": tool.input_schema}
+            for name, tool in self.builtin_tools.items()
+            if name not in self.tool_registry
+        ]
+        return self.tool_registry.definitions() + builtin
+
+    def _index_tools(self, added: List[str] = ()) -> None:
+        if self.tool_selector is not None:
+            self.tool_selector.rebuild(self.tools, added)
+
+    def _select_tools(self, user_input) -> None:
+        """
+        Choose the tools offered in this turn from the user's message and the
+        tools used in the previous turns.
+        """
+        if self.tool_selector is None:
+            return
+        if isinstance(user_input, str):
+            query = user_input
+        else:
+            query = " ".join(
+                block.get('text', '') for block in user_input
+                if isinstance(block, dict) and block.get('type') == 'text'
+            )
+        self.tool_selector.select(query, used=self.conversation_history.tools_used(turns=3))
+
+    @property
+    def request_tools(self) -> List[Dict[str, Any]]:
+        """
+        The tool definitions sent with the next request.
+        """
+        if self.tool_selector is None:
+            return self.tools
+        return self.tool_selector.definitions()
+
+    @property
+    def request_system(self) -> str:
+        """
+        The system prompt sent with the next request. It only mentions tool
+        search while some installed tools are actually left out.
+        """
+        if self.tool_selector is not None and self.tool_selector.active:
+            return self._tool_search_prompt
+        return self.system_prompt
+
+    def _scan_tool_modules(self, tools_path) -> Dict[str, Path]:
+        """
+        Map the name of every tool module in the tools directory to its file.
+        """
+        modules = {}
+        for module_info in pkgutil.iter_modules([str(tools_path)]):
+            if module_info.name == 'base':
+                continue
+            file_path = Path(tools_path) / f"{module_info.name}.py"
+            if file_path.exists():
+                modules[module_info.name] = file_path
+        return modules
+
+    def _load_tool_module(self, module_name: str, file_path: Path) -> None:
+        """
+        Register the tools of one module, from the manifest when possible and
+        by importing the module otherwise.
+        """
+        lazy = getattr(Config, 'LAZY_TOOL_LOADING', False)
+        if lazy:
+            entry = self.tool_manifest.entry_for(module_name, file_path)
+            if entry is not None:
+                for spec in entry['tools']:
+                    self.tool_registry.register_spec(spec, f'tools.{module_name}')
+                    self.console.print(f"[green]Loaded tool:[/green] {spec['name']}")
+                return
+
+        # Attempt loading the tool module
+        module = self._import_tool_module(module_name)
+        if module is not None:
+            self._extract_tools_from_module(module, [])
+            if lazy:
+                self.tool_manifest.record(
+                    module_name, file_path,
+                    self.tool_registry.specs_for_module(module.__name__)
+                )
+
+    def _save_tool_manifest(self) -> None:
+        if getattr(Config, 'LAZY_TOOL_LOADING', False):
+            self.tool_manifest.prune(self._tool_module_state)
+            self.tool_manifest.save()
+
+    def _import_tool_module(self, module_name: str):
+        """
+        Import a tool module, offering to install a missing dependency.
+        Returns the module, or None if it could not be loaded.
+        """
+        try:
+            return importlib.import_module(f'tools.{module_name}')
+        except ImportError as e:
+            # Handle missing dependencies
+            missing_module = self._parse_missing_dependency(str(e))
+            self.console.print(f"\n[yellow]Missing dependency:[/yellow] {missing_module} for tool {module_name}")
+            if not self.interactive:
+                self.console.print(f"[yellow]Skipping tool {module_name} due to missing dependency[/yellow]")
+                return None
+            user_response = input(f"Would you like to install {missing_module}? (y/n): ").lower()
+
+            if user_response == 'y':
+                success = self._execute_uv_install(missing_module)
+                if success:
+                    # Retry loading the module after installation
+                    try:
+                        return importlib.import_module(f'tools.{module_name}')
+                    except Exception as retry_err:
+                        self.console.print(f"[red]Failed to load tool after installation: {str(retry_err)}[/red]")
+                else:
+                    self.console.print(f"[red]Installation of {missing_module} failed. Skipping this tool.[/red]")
+            else:
+                self.console.print(f"[yellow]Skipping tool {module_name} due to missing dependency[/yellow]")
+        except Exception as mod_err:
+            self.console.print(f"[red]Error loading module {module_name}:[/red] {str(mod_err)}")
+        return None
 
     def _parse_missing_dependency(self, error_str: str) -> str:
         """
@@ -141,7 +478,7 @@ class Assistant:
     def _extract_tools_from_module(self, module, tools: List[Dict[str, Any]]) -> None:
         """
         Given a tool module, find and instantiate all tool classes (subclasses of BaseTool).
-        Append them to the 'tools' list.
+        Register the instances and append their definitions to the 'tools' list.
         """
         for name, obj in inspect.getmembers(module):
             if (inspect.isclass(obj) and issubclass(obj, BaseTool) and obj != BaseTool):
@@ -152,29 +489,114 @@ class Assistant:
                         "description": tool_instance.description,
                         "input_schema": tool_instance.input_schema
                     })
+                    self.tool_registry.register(tool_instance, module.__name__)
                     self.console.print(f"[green]Loaded tool:[/green] {tool_instance.name}")
                 except Exception as tool_init_err:
                     self.console.print(f"[red]Error initializing tool {name}:[/red] {str(tool_init_err)}")
 
+    def _is_read_only_tool(self, tool_name: str) -> bool:
+        """
+        Whether a tool may run concurrently with other read-only tool calls.
+        """
+        if tool_name in self.builtin_tools:
+            return bool(getattr(self.builtin_tools[tool_name], 'read_only', False))
+        return self.tool_registry.is_read_only(tool_name)
+
+    def _tool_time_limit(self, tool_name: str) -> Optional[float]:
+        """
+        The time_limit a tool declares for itself, or None.
+        """
+        if tool_name in self.builtin_tools:
+            return getattr(self.builtin_tools[tool_name], 'time_limit', None)
+        spec = self.tool_registry.spec(tool_name)
+        return spec.get('time_limit') if spec else None
+
+    def _pooled_spec(self, tool_name: str) -> Optional[Dict[str, Any]]:
+        """
+        The registry spec of a tool that runs in a worker process, or None if
+        it runs in this process.
+        """
+        if self.tool_pool is None or tool_name in self.builtin_tools:
+            return None
+        spec = self.tool_registry.spec(tool_name)
+        if spec is None or not spec.get('isolated', True) or not (spec.get('module') or '').startswith('tools.'):
+            return None
+        return spec
+
     def refresh_tools(self):
         """
-        Refresh the list of tools and show newly discovered tools.
-        """
-        current_tool_names = {tool['name'] for tool in self.tools}
-        self.tools = self._load_tools()
-        new_tool_names = {tool['name'] for tool in self.tools}
-        new_tools = new_tool_names - current_tool_names
-
-        if new_tools:
-            self.console.print("\n")
-            for tool_name in new_tools:
-                tool_info = next((t for t in self.tools if t['name'] == tool_name), None)
-                if tool_info:
-                    description_lines = tool_info['description'].strip().split('\n')
-                    formatted_description = '\n    '.join(line.strip() for line in description_lines)
-                    self.console.print(f"[bold green]NEW[/bold green] 🔧 [cyan]{tool_name}[/cyan]:\n    {formatted_description}")
-        else:
-            self.console.print("\n[yellow]No new tools found[/yellow]")
+        Incrementally refresh the tools: only modules that were added, removed
+        or modified since the last load are (re)loaded. Tools from unchanged
+        modules keep their instances. Shows what changed.
+        """
+        tools_path = getattr(Config, 'TOOLS_DIR', None)
+        if tools_path is None:
+            self.console.print("[red]TOOLS_DIR not set in Config[/red]")
+            return
+
+        current_modules = self._scan_tool_modules(tools_path)
+        added_tools, updated_tools, removed_tools = [], [], []
+        # Modules whose old code tool workers may still have loaded
+        stale_modules = []
+
+        for module_name in list(self._tool_module_state):
+            if module_name not in current_modules:
+                stale_modules.append(f'tools.{module_name}')
+                removed_tools.extend(self.tool_registry.remove_module(f'tools.{module_name}'))
+                sys.modules.pop(f'tools.{module_name}', None)
+                del self._tool_module_state[module_name]
+
+        for module_name, file_path in current_modules.items():
+            is_new = module_name not in self._tool_module_state
+            try:
+                fingerprint = module_changed(self._tool_module_state.get(module_name), file_path)
+            except OSError as e:
+                self.console.print(f"[red]Error reading module {module_name}:[/red] {str(e)}")
+                continue
+            if fingerprint is None:
+                continue
+
+            if not is_new:
+                stale_modules.append(f'tools.{module_name}')
+            previous_names = set(self.tool_registry.remove_module(f'tools.{module_name}'))
+            sys.modules.pop(f'tools.{module_name}', None)
+            self._tool_module_state[module_name] = fingerprint
+            self._load_tool_module(module_name, file_path)
+
+            current_names = set(
+                spec['name'] for spec in self.tool_registry.specs_for_module(f'tools.{module_name}')
+            )
+            added_tools.extend(sorted(current_names - previous_names))
+            removed_tools.extend(sorted(previous_names - current_names))
+            if not is_new:
+                updated_tools.extend(sorted(current_names & previous_names))
+
+        self._save_tool_manifest()
+        self.tools = self._tool_definitions()
+        self._index_tools(added_tools)
+        if self.tool_cache is not None:
+            for tool_name in updated_tools + removed_tools:
+                self.tool_cache.invalidate(tool_name)
+        if self.tool_pool is not None and stale_modules:
+            # Workers keep the modules they imported: those that loaded a changed
+            # module are replaced, the others stay warm
+            self.tool_pool.restart(stale_modules)
+
+        if not (added_tools or updated_tools or removed_tools):
+            self.console.print("\n[yellow]No tool changes found[/yellow]")
+            return
+
+        self.console.print("\n")
+        for tool_name in added_tools:
+            tool_info = next((t for t in self.tools if t['name'] == tool_name), None)
+            if tool_info:
+                description_lines = tool_info['description'].strip().split('\n')
+                formatted_description = '\n    '.join(line.strip() for line in description_lines)
+                self.console.print(f"[bold green]NEW[/bold green] 🔧 [cyan]{tool_name}[/cyan]:\n    {formatted_description}")
+        for tool_name in updated_tools:
+            self.console.print(f"[bold yellow]UPDATED[/bold yellow] 🔧 [cyan]{tool_name}[/cyan]")
+        for tool_name in removed_tools:
+            self.console.print(f"[bold red]REMOVED[/bold red] 🔧 [cyan]{tool_name}[/cyan]")
 
     def display_available_tools(self):
         """
@@ -189,128 +611,235 @@ class Assistant:
         self.console.print(formatted_tools)
         self.console.print("\n---")
 
-    def _display_tool_usage(self, tool_name: str, input_data: Dict, result: str):
+    def _display_tool_usage(self, tool_name: str, input_data: Dict, result: Any):
         """
-        If SHOW_TOOL_USAGE is enabled, display the input and result of a tool execution.
-        Handles special cases like image data and large outputs for cleaner display.
+        Display the input and result of a tool execution. Callers check
+        SHOW_TOOL_USAGE first, so nothing is rendered when it is off; when on,
+        only a bounded preview of each side is built (see core.display).
         """
-        if not getattr(Config, 'SHOW_TOOL_USAGE', False):
-            return
-
-        # Clean up input data by removing any large binary/base64 content
-        cleaned_input = self._clean_data_for_display(input_data)
-        
-        # Clean up result data
-        cleaned_result = self._clean_data_for_display(result)
-
-        tool_info = f"""[cyan]📥 Input:[/cyan] {json.dumps(cleaned_input, indent=2)}
-[cyan]📤 Result:[/cyan] {cleaned_result}"""
-        
-        panel = Panel(
-            tool_info,
-            title=f"Tool used: {tool_name}",
-            title_align="left",
-            border_style="cyan",
-            padding=(1, 2)
-        )
-        self.console.print(panel)
-
-    def _clean_data_for_display(self, data):
-        """
-        Helper method to clean data for display by handling various data types
-        and removing/replacing large content like base64 strings.
-        """
-        if isinstance(data, str):
-            try:
-                # Try to parse as JSON first
-                parsed_data = json.loads(data)
-                return self._clean_parsed_data(parsed_data)
-            except json.JSONDecodeError:
-                # If it's a long string, check for base64 patterns
-                if len(data) > 1000 and ';base64,' in data:
-                    return "[base64 data omitted]"
-                return data
-        elif isinstance(data, dict):
-            return self._clean_parsed_data(data)
-        else:
-            return data
-
-    def _clean_parsed_data(self, data):
-        """
-        Recursively clean parsed JSON/dict data, handling nested structures
-        and replacing large data with placeholders.
-        """
-        if isinstance(data, dict):
-            cleaned = {}
-            for key, value in data.items():
-                # Handle image data in various formats
-                if key in ['data', 'image', 'source'] and isinstance(value, str):
-                    if len(value) > 1000 and (';base64,' in value or value.startswith('data:')):
-                        cleaned[key] = "[base64 data omitted]"
-                    else:
-                        cleaned[key] = value
-                else:
-                    cleaned[key] = self._clean_parsed_data(value)
-            return cleaned
-        elif isinstance(data, list):
-            return [self._clean_parsed_data(item) for item in data]
-        elif isinstance(data, str) and len(data) > 1000 and ';base64,' in data:
-            return "[base64 data omitted]"
-        return data
+        with self.tracer.span("display.tool_usage", {"tool.name": tool_name}) as span:
+            max_chars = getattr(Config, 'TOOL_USAGE_PREVIEW_CHARS', 2000)
+            tool_info = Text.assemble(
+                ("📥 Input: ", "cyan"), preview(input_data, max_chars), "\n",
+                ("📤 Result: ", "cyan"), preview(result, max_chars)
+            )
+            span.set("display.bytes", len(tool_info))
+
+            panel = Panel(
+                tool_info,
+                title=f"Tool used: {tool_name}",
+                title_align="left",
+                border_style="cyan",
+                padding=(1, 2)
+            )
+            self.console.print(panel)
 
-    def _execute_tool(self, tool_use):
+    def _execute_tool(self, tool_use, speculative: bool = False):
         """
         Given a tool usage request (with tool name and inputs),
-        dynamically load and execute the corresponding tool.
+        look up the registered tool instance and execute it.
+        Speculative executions run while a response is still streaming, so
+        their usage is displayed later by _run_tool_round.
         """
         tool_name = tool_use.name
         tool_input = tool_use.input or {}
         tool_result = None
 
-        try:
-            module = importlib.import_module(f'tools.{tool_name}')
-            tool_instance = self._find_tool_instance_in_module(module, tool_name)
-
-            if not tool_instance:
-                tool_result = f"Tool not found: {tool_name}"
-            else:
+        with self.tracer.span("tool.execute", {"tool.name": tool_name, "tool.speculative": speculative}) as span:
+            tool_instance = None
+            try:
+                pooled_spec = self._pooled_spec(tool_name)
+                if pooled_spec is not None and not (self.tool_cache is not None and pooled_spec.get('path_inputs')):
+                    # Runs in a worker, so the tool (and whatever it imports) is
+                    # never loaded here: dispatch and the cache work from the spec.
+                    # Cached path tools are the exception, their skip_path runs here.
+                    tool_instance = SimpleNamespace(**pooled_spec)
+                else:
+                    # Lazily registered tools are imported on their first call
+                    tool_instance = self.builtin_tools.get(tool_name) or self.tool_registry.get(tool_name)
+                if not tool_instance:
+                    tool_result = f"Tool not found: {tool_name}"
+                elif self.tool_selector is not None:
+                    # A tool the model knew about without being offered stays offered
+                    self.tool_selector.add((tool_name,))
+            except ImportError as e:
+                missing_module = self._parse_missing_dependency(str(e))
+                tool_result = (
+                    f"Failed to import tool: {tool_name} (missing dependency: {missing_module}). "
+                    "It can be installed with the uvpackagemanager tool."
+                )
+            except Exception as e:
+                tool_result = f"Error loading tool '{tool_name}': {str(e)}"
+
+            if tool_instance:
                 # Execute the tool with the provided input
                 try:
-                    result = tool_instance.execute(**tool_input)
-                    # Keep structured data intact
+                    result = self._execute_cached(tool_instance, tool_input, span)
+                    # Keep structured data intact; oversized text is stored and paged
+                    if tool_name != ResultPagerTool.name:
+                        result = self.result_store.budget(tool_name, result)
                     tool_result = result
                 except Exception as exec_err:
                     tool_result = f"Error executing tool '{tool_name}': {str(exec_err)}"
-        except ImportError:
-            tool_result = f"Failed to import tool: {tool_name}"
-        except Exception as e:
-            tool_result = f"Error executing tool: {str(e)}"
 
-        # Display tool usage with proper handling of structured data
-        self._display_tool_usage(tool_name, tool_input, 
-            json.dumps(tool_result) if not isinstance(tool_result, str) else tool_result)
+            # Structured results are never serialized here; the API request does that once
+            is_text = isinstance(tool_result, str)
+            span.set("result.bytes", len(tool_result) if is_text else None)
+            span.set("tool.error", tool_instance is None or (is_text and tool_result.startswith("Error")))
+
+            if getattr(Config, 'SHOW_TOOL_USAGE', False) and not speculative:
+                self._display_tool_usage(tool_name, tool_input, tool_result)
         return tool_result
 
-    def _find_tool_instance_in_module(self, module, tool_name: str):
+    def _execute_speculative(self, tool_use):
+        return self._execute_tool(tool_use, speculative=True)
+
+    def _execute_cached(self, tool_instance, tool_input: Dict[str, Any], span=NOOP_SPAN):
         """
-        Search a given module for a tool class matching tool_name and return an instance of it.
+        Execute a tool, answering repeated read-only calls from the tool cache.
         """
-        for name, obj in inspect.getmembers(module):
-            if (inspect.isclass(obj) and issubclass(obj, BaseTool) and obj != BaseTool):
-                candidate_tool = obj()
-                if candidate_tool.name == tool_name:
-                    return candidate_tool
-        return None
+        if self.tool_cache is None or not self.tool_cache.is_cacheable(tool_instance):
+            return self._call_tool(tool_instance, tool_input)
+
+        # Taken once, before the tool runs: it validates the entry found and keys the new one
+        fingerprint = self.tool_cache.fingerprint(tool_instance, tool_input)
+        hit, result = self.tool_cache.get(tool_instance, tool_input, fingerprint)
+        span.set("cache.hit", hit)
+        if hit:
+            return result
+
+        started = time.perf_counter()
+        result = self._call_tool(tool_instance, tool_input)
+        if not (isinstance(result, str) and result.startswith("Error")):
+            self.tool_cache.put(tool_instance, tool_input, result, fingerprint,
+                                time.perf_counter() - started)
+        return result
+
+    def _call_tool(self, tool_instance, tool_input: Dict[str, Any]):
+        """
+        Run a tool: in a worker process for tools from the tools directory when
+        TOOL_ISOLATION is on, in this process otherwise. Worker calls are sent
+        by the module and class in the tool's spec.
+        """
+        spec = self._pooled_spec(tool_instance.name)
+        if spec is None:
+            return tool_instance.execute(**tool_input)
+
+        # A tool's own time_limit wins (installs and code generation need their
+        # time); the default TOOL_TIMEOUT is cut short by the step's deadline
+        time_limit = spec.get('time_limit')
+        timeout = time_limit or getattr(Config, 'TOOL_TIMEOUT', None)
+        round_deadline = self._tool_round_deadline
+        if round_deadline is not None and not time_limit:
+            remaining = max(0.0, round_deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            result = self.tool_pool.call(
+                spec['module'], spec['class_name'], tool_input, spec['name'],
+                timeout=timeout, cancel_event=self.cancel_event
+            )
+        except ToolCancelled:
+            return f"Error: tool '{spec['name']}' was cancelled"
+        if isinstance(result, str) and result.startswith(f"Error executing tool '{spec['name']}': ModuleNotFoundError"):
+            # The tool's module was first imported by the worker
+            return (
+                f"Failed to import tool: {spec['name']} (missing dependency: {self._parse_missing_dependency(result)}). "
+                "It can be installed with the uvpackagemanager tool."
+            )
+        return result
+
+    def cancel(self) -> None:
+        """
+        Stop the current turn: running tool workers are killed, tools not yet
+        started are skipped and the turn ends at the next step boundary.
+        """
+        self.cancel_event.set()
+
+    def _close_cancelled_turn(self) -> None:
+        """
+        Keep the history valid after a cancelled turn. Tool rounds are only
+        recorded once complete, so at most the last message is a user message
+        without a reply; it is answered with a note about the cancellation so
+        the next user message does not follow it directly.
+        """
+        self.tool_scheduler.discard_speculative()
+        if self.conversation_history and self.conversation_history[-1].get('role') == 'user':
+            self._append_message({
+                "role": "assistant",
+                "content": [{"type": "text", "text": "(The user cancelled this request before it was finished.)"}]
+            })
+
+    def _sessions_dir(self) -> Path:
+        return Path(getattr(Config, 'SESSIONS_DIR', Config.BASE_DIR / "sessions"))
+
+    def _append_message(self, message: Dict[str, Any]) -> None:
+        """
+        Add a message to the conversation history and the session journal.
+        """
+        record = self.conversation_history.append(message)
+        if self.journal is not None:
+            self.journal.append(record)
+
+    def resume_session(self, session_id: Optional[str] = None) -> Optional[str]:
+        """
+        Continue a journaled session (the most recent one if no id is given).
+        The journal is streamed on a background thread, so the caller doesn't
+        wait for it; the history is needed from the next chat() on.
+        Returns the session id, or None if there is no such session.
+        """
+        sessions_dir = self._sessions_dir()
+        session_id = session_id or SessionJournal.latest_session(sessions_dir)
+        if not session_id:
+            return None
+        journal = SessionJournal(sessions_dir, session_id)
+        if not journal.exists():
+            return None
+
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = journal
+        self._resumed_history = []
+
+        def load():
+            try:
+                for message in journal.replay():
+                    self._resumed_history.append(message)
+            except Exception as e:
+                logging.error(f"Error resuming session {session_id}: {str(e)}")
+
+        self._resume_thread = threading.Thread(target=load, name="ce3-resume", daemon=True)
+        self._resume_thread.start()
+        return session_id
+
+    def _ensure_history_loaded(self) -> None:
+        if self._resume_thread is None:
+            return
+        self._resume_thread.join()
+        self._resume_thread = None
+        history = MessageStore(self._resumed_history)
+        history.extend(self.conversation_history)
+        self.conversation_history = history
+        self._resumed_history = []
+
+    @property
+    def context_tokens(self) -> int:
+        """
+        Estimated prompt size in tokens of the next request.
+        """
+        self._ensure_history_loaded()
+        self.context.set_prompt(self.request_system, self.request_tools)
+        return self.context.estimate(self.conversation_history)
 
     def _display_token_usage(self, usage):
         """
-        Display a visual representation of token usage and remaining tokens.
-        Uses only the tracked total_tokens_used.
+        Display a visual representation of the context size and remaining tokens,
+        followed by the cumulative billed usage.
         """
-        used_percentage = (self.total_tokens_used / Config.MAX_CONVERSATION_TOKENS) * 100
-        remaining_tokens = max(0, Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used)
+        context_tokens = self.context_tokens
+        used_percentage = min(100.0, (context_tokens / Config.MAX_CONVERSATION_TOKENS) * 100)
+        remaining_tokens = max(0, Config.MAX_CONVERSATION_TOKENS - context_tokens)
 
-        self.console.print(f"\nTotal used: {self.total_tokens_used:,} / {Config.MAX_CONVERSATION_TOKENS:,}")
+        self.console.print(f"\nContext: {context_tokens:,} / {Config.MAX_CONVERSATION_TOKENS:,}")
 
         bar_width = 40
         filled = int(used_percentage / 100 * bar_width)
@@ -327,90 +856,407 @@ class Assistant:
         if remaining_tokens < 20000:
             self.console.print(f"[bold red]Warning: Only {remaining_tokens:,} tokens remaining![/bold red]")
 
+        if self.tool_selector is not None:
+            self.console.print(f"[dim]Tools offered: {len(self.request_tools)} of {len(self.tools)}[/dim]")
+
+        self.console.print(f"[dim]Billed this session: {self.total_tokens_used:,} tokens"
+                           f"{f' (~${self.total_cost:.4f})' if self.total_cost else ''}[/dim]")
+
+        if self.router is not None:
+            routes = []
+            for row in self.router.stats():
+                line = (f"{row['route']} {row['model']}: {row['requests']} requests, "
+                        f"{row['latency'] / row['requests']:.2f}s avg, ${row['cost']:.4f}")
+                if row['escalated']:
+                    line += f", {row['escalated']} redone"
+                routes.append(line)
+            if routes:
+                self.console.print(f"[dim]Routes: {' · '.join(routes)}[/dim]")
+
+        if self.prompt_caching:
+            cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+            cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            self.console.print(
+                f"[dim]Prompt cache: {cache_read:,} read / {cache_write:,} written this request, "
+                f"{self.cache_read_tokens:,} read / {self.cache_write_tokens:,} written in total[/dim]"
+            )
+
+        if self.tool_cache is not None and self.tool_cache.hits:
+            stats = self.tool_cache.stats()
+            self.console.print(
+                f"[dim]Tool cache: {stats['hits']:,} hits / {stats['misses']:,} misses "
+                f"({stats['hit_rate']:.0%}), {stats['time_saved']:.2f}s saved[/dim]"
+            )
+
         self.console.print("---")
 
-    def _get_completion(self):
+    def _create_message(self, deadline: Optional[float] = None, **params):
         """
-        Get a completion from the Anthropic API.
-        Handles both text-only and multimodal messages.
+        Send a Messages API request, streaming it when streaming is enabled.
+        Always returns a complete Message object.
+        """
+        if not self.streaming_enabled:
+            self._last_request_ttft = None
+            return create_message(self.client, **params)
+        return self._stream_message(params, deadline=deadline)
+
+    def _stream_message(self, params: Dict[str, Any], deadline: Optional[float] = None):
         """
+        Stream a Messages API request, rendering text deltas as they arrive
+        and assembling tool_use blocks from their partial JSON.
+        """
+        started_at = time.perf_counter()
+        self._last_request_ttft = None
+        spinner = None
+        if self.render_stream and self.thinking_enabled:
+            from rich.live import Live
+            from rich.spinner import Spinner
+            spinner = Live(Spinner('dots', text='Thinking...', style="cyan"),
+                           console=self.console, refresh_per_second=10, transient=True)
+            spinner.start()
+
+        rendered_text = False
+        self._stream_interrupted = False
+
+        deferred = self._defer_rendering
+
+        def on_text(text: str):
+            nonlocal rendered_text
+            if deferred:
+                return
+            if spinner is not None:
+                spinner.stop()
+            if not self.render_stream:
+                return
+            if not self._stream_header_shown:
+                self.console.print("\n[bold purple]Claude Engineer:[/bold purple]")
+                self._stream_header_shown = True
+            self.console.print(text, end="", markup=False, highlight=False)
+            rendered_text = True
+
+        # Calls started for an earlier attempt at this request are not reused
+        self.tool_scheduler.discard_speculative()
+        side_effects_requested = False
+
+        def on_block_complete(block):
+            nonlocal side_effects_requested
+            if block.type != 'tool_use' or side_effects_requested:
+                return
+            if not self.tool_scheduler.speculate(block, self._execute_speculative):
+                # Later calls may depend on this call's side effects: wait for the full message
+                side_effects_requested = True
+
+        accumulator = StreamAccumulator(
+            on_text=on_text,
+            on_block_complete=on_block_complete if self.speculative_tools else None,
+            started_at=started_at
+        )
         try:
-            response = self.client.messages.create(
-                model=Config.MODEL,
-                max_tokens=min(
-                    Config.MAX_TOKENS,
-                    Config.MAX_CONVERSATION_TOKENS - self.total_tokens_used
-                ),
-                temperature=self.temperature,
-                tools=self.tools,
-                messages=self.conversation_history,
-                system=f"{SystemPrompts.DEFAULT}\n\n{SystemPrompts.TOOL_USAGE}"
-            )
+            stream = create_message(self.client, stream=True, **params)
+            response = accumulator.consume(stream, deadline=deadline, cancel_event=self.cancel_event)
+        except BaseException:
+            self.tool_scheduler.discard_speculative()
+            # A retry starts the response over; _display_retry marks the printed part
+            self._stream_interrupted = rendered_text
+            raise
+        finally:
+            if spinner is not None:
+                spinner.stop()
+
+        if deferred and response.stop_reason == "tool_use":
+            deferred = False
+            for block in response.content:
+                if block.type == 'text' and block.text:
+                    on_text(block.text)
+
+        if rendered_text:
+            self.console.print()
+            first_block = response.content[0] if response.content else None
+            if first_block is not None and first_block.type == 'text':
+                self._last_streamed_text = first_block.text
+
+        # Only the first request of a turn determines the perceived latency
+        self._last_request_ttft = accumulator.time_to_first_token
+        if self.last_time_to_first_token is None:
+            self.last_time_to_first_token = accumulator.time_to_first_token
+        return response
+
+    def _request_completion(self, deadline: Optional[float] = None, route=None):
+        """
+        Send the current conversation to the model and return its response.
+        deadline is a time.monotonic() value bounding the request; route (from
+        the model router) sets the model and output limit.
+        """
+        self._maybe_compact()
+        model = route.model if route is not None else self.model
+        max_tokens = Config.MAX_TOKENS
+        if route is not None and route.max_tokens:
+            max_tokens = min(max_tokens, route.max_tokens)
+        self._defer_rendering = route is not None and route.provisional
+
+        system = self.request_system
+        tools = self.request_tools
+        messages = self.conversation_history.wire()
+        if self.prompt_caching:
+            # Breakpoints on the system prompt, the tools block and the newest turn
+            system = cached_system(system)
+            tools = cached_tools(tools)
+            messages = with_rolling_breakpoint(messages)
+
+        context_tokens = self.context_tokens
+        params = dict(
+            model=model,
+            max_tokens=max(1, min(
+                max_tokens,
+                Config.MAX_CONVERSATION_TOKENS - context_tokens
+            )),
+            temperature=self.temperature,
+            system=system,
+            messages=messages,
+            tools=tools
+        )
+
+        def send():
+            if deadline is None:
+                return self._create_message(**params)
+            params['timeout'] = max(1.0, deadline - time.monotonic())
+            return self._create_message(deadline=deadline, **params)
+
+        # Already loaded by self.client; only its timeout error is needed here
+        import anthropic
+
+        # Speculative calls started while the response streams get the step's deadline
+        self._tool_round_deadline = deadline
+
+        # The limiter is charged the estimated prompt size now and settled
+        # against the reported usage in _account_usage
+        self._reserved_tokens = context_tokens
+        started = time.perf_counter()
+        with self.tracer.span("messages.create", {
+            "model": model,
+            "route": route.name if route is not None else None,
+            "request.messages": len(messages),
+            "request.context_tokens": context_tokens,
+            "request.stream": self.streaming_enabled
+        }) as span:
+            try:
+                response, stats = self.retry_scheduler.call(
+                    send, tokens=context_tokens, deadline=deadline, on_retry=self._display_retry
+                )
+            except (TimeoutError, anthropic.APITimeoutError) as e:
+                if deadline is None:
+                    raise
+                raise StepBudgetExceeded(str(e)) from e
+
+            usage = getattr(response, 'usage', None)
+            span.update({
+                "response.stop_reason": getattr(response, 'stop_reason', None),
+                "usage.input_tokens": getattr(usage, 'input_tokens', None),
+                "usage.output_tokens": getattr(usage, 'output_tokens', None),
+                "usage.cache_read_input_tokens": getattr(usage, 'cache_read_input_tokens', None),
+                "usage.cache_creation_input_tokens": getattr(usage, 'cache_creation_input_tokens', None),
+                "retries": stats['retries'],
+                "rate_limit_wait": stats['wait'],
+                "time_to_first_token": self._last_request_ttft
+            })
+        self._last_request_retries = stats['retries']
+        self._last_request_wait = stats['wait']
+        self._last_request_latency = time.perf_counter() - started
+        return response
+
+    def _display_retry(self, attempt: int, delay: float, error: Exception) -> None:
+        status = getattr(error, 'status_code', None)
+        reason = error_type(error) or (f"HTTP {status}" if status else type(error).__name__)
+        if self._stream_interrupted:
+            self._stream_interrupted = False
+            self._stream_header_shown = False
+            self.console.print("\n[dim]Response interrupted, the text above is discarded.[/dim]", end="")
+        self.console.print(
+            f"\n[yellow]Request failed ({reason}), retrying in {delay:.1f}s "
+            f"(attempt {attempt}/{self.retry_scheduler.max_retries})...[/yellow]"
+        )
+
+    def _maybe_compact(self) -> None:
+        """
+        Compact the conversation history when its estimated size crosses the
+        compaction threshold.
+        """
+        if self.compactor is None:
+            return
+        tokens = self.context_tokens
+        if not self.compactor.needs_compaction(tokens):
+            return
 
-            # Update token usage based on response usage
-            if hasattr(response, 'usage') and response.usage:
-                message_tokens = response.usage.input_tokens + response.usage.output_tokens
-                self.total_tokens_used += message_tokens
+        result = self.compactor.compact(self.conversation_history, tokens)
+        if not (result.stubbed_blocks or result.elided_messages):
+            return
+        self.conversation_history = MessageStore(result.messages)
+        if self.journal is not None:
+            self.journal.snapshot(result.messages)
+        self.console.print(
+            f"\n[dim]Compacted conversation: {result.tokens_before:,} → {self.context_tokens:,} tokens "
+            f"({result.stubbed_blocks} payloads stubbed, {result.elided_messages} messages elided)[/dim]"
+        )
+
+    def _account_usage(self, response, route=None) -> Optional[str]:
+        """
+        Update billed usage, cost and the observed context size from a response.
+        Returns a message for the user when the conversation token limit is reached.
+        """
+        self._last_request_cost = estimate_cost(
+            getattr(response, 'model', None) or (route.model if route is not None else self.model),
+            getattr(response, 'usage', None),
+            getattr(Config, 'MODEL_PRICES', None)
+        )
+        self.total_cost += self._last_request_cost or 0.0
+        if self.router is not None and route is not None:
+            self.router.record(route, self._last_request_latency, self._last_request_cost,
+                               escalated=self.router.needs_escalation(route, response))
+
+        if hasattr(response, 'usage') and response.usage:
+            # input_tokens excludes the cached part of the prompt
+            cache_read = getattr(response.usage, 'cache_read_input_tokens', 0) or 0
+            cache_write = getattr(response.usage, 'cache_creation_input_tokens', 0) or 0
+            self.cache_read_tokens += cache_read
+            self.cache_write_tokens += cache_write
+
+            message_tokens = (response.usage.input_tokens + cache_read + cache_write
+                              + response.usage.output_tokens)
+            self.total_tokens_used += message_tokens
+            if self.retry_scheduler.limiter is not None:
+                # Cache reads don't count towards the input tokens rate limit
+                self.retry_scheduler.limiter.settle(
+                    self._reserved_tokens, message_tokens - cache_read
+                )
+                self._reserved_tokens = 0
+
+            # The request sent the current history, so its input is the real context size
+            self.context.observe(self.conversation_history, response.usage)
+            with self.tracer.span("display.token_usage"):
                 self._display_token_usage(response.usage)
 
-            if self.total_tokens_used >= Config.MAX_CONVERSATION_TOKENS:
-                self.console.print("\n[bold red]Token limit reached! Please reset the conversation.[/bold red]")
-                return "Token limit reached! Please type 'reset' to start a new conversation."
-
-            if response.stop_reason == "tool_use":
-                self.console.print("\n[bold yellow]  Handling Tool Use...[/bold yellow]\n")
-
-                tool_results = []
-                if getattr(response, 'content', None) and isinstance(response.content, list):
-                    # Execute each tool in the response content
-                    for content_block in response.content:
-                        if content_block.type == "tool_use":
-                            result = self._execute_tool(content_block)
-                            
-                            # Handle structured data (like image blocks) vs text
-                            if isinstance(result, (list, dict)):
-                                tool_results.append({
-                                    "type": "tool_result",
-                                    "tool_use_id": content_block.id,
-                                    "content": result  # Keep structured data intact
-                                })
-                            else:
-                                # Convert text results to proper content blocks
-                                tool_results.append({
-                                    "type": "tool_result",
-                                    "tool_use_id": content_block.id,
-                                    "content": [{"type": "text", "text": str(result)}]
-                                })
-
-                    # Append tool usage to conversation and continue
-                    self.conversation_history.append({
-                        "role": "assistant",
-                        "content": response.content
-                    })
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": tool_results
-                    })
-                    return self._get_completion()  # Recursive call to continue the conversation
+        if self.context.last_prompt_tokens + self._output_tokens(response) >= Config.MAX_CONVERSATION_TOKENS:
+            self.console.print("\n[bold red]Token limit reached! Please reset the conversation.[/bold red]")
+            return "Token limit reached! Please type 'reset' to start a new conversation."
+        return None
 
-                else:
-                    self.console.print("[red]No tool content received despite 'tool_use' stop reason.[/red]")
-                    return "Error: No tool content received"
+    def _output_tokens(self, response) -> int:
+        usage = getattr(response, 'usage', None)
+        return getattr(usage, 'output_tokens', 0) or 0
 
-            # Final assistant response
-            if (getattr(response, 'content', None) and 
-                isinstance(response.content, list) and 
-                response.content):
-                final_content = response.content[0].text
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": response.content
+    def _run_tool_round(self, response, tool_uses: List[Any], timeout: Optional[float] = None) -> None:
+        """
+        Execute the tool_use blocks of a response and append the assistant
+        message and the matching tool results to the conversation.
+        """
+        self.console.print("\n[bold yellow]  Handling Tool Use...[/bold yellow]\n")
+
+        # Independent read-only calls run concurrently, results keep block order.
+        # Calls in worker processes are stopped when the round's time is up.
+        self._tool_round_deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            results = self.tool_scheduler.run(tool_uses, timeout=timeout)
+        finally:
+            self._tool_round_deadline = None
+        self._last_round_speculative = len(self.tool_scheduler.last_speculative)
+        if getattr(Config, 'SHOW_TOOL_USAGE', False):
+            for index in self.tool_scheduler.last_speculative:
+                self._display_tool_usage(tool_uses[index].name, tool_uses[index].input or {}, results[index])
+
+        # An error result sends the next step to the after_error route
+        self._last_round_errors = sum(
+            1 for result in results if isinstance(result, str) and result.startswith("Error")
+        )
+
+        tool_results = []
+        for content_block, result in zip(tool_uses, results):
+            # Handle structured data (like image blocks) vs text
+            if isinstance(result, (list, dict)):
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": content_block.id,
+                    "content": result  # Keep structured data intact
                 })
-                return final_content
             else:
-                self.console.print("[red]No content in final response.[/red]")
-                return "No response content available."
+                # Convert text results to proper content blocks
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": content_block.id,
+                    "content": [{"type": "text", "text": str(result)}]
+                })
+
+        self._append_message({
+            "role": "assistant",
+            "content": response.content
+        })
+        self._append_message({
+            "role": "user",
+            "content": tool_results
+        })
+
+    def _finish_turn(self, response) -> str:
+        """
+        Record the final assistant response and return its text.
+        """
+        if (getattr(response, 'content', None) and
+                isinstance(response.content, list) and
+                response.content):
+            final_content = response.content[0].text
+            self._append_message({
+                "role": "assistant",
+                "content": response.content
+            })
+            return final_content
+        else:
+            self.console.print("[red]No content in final response.[/red]")
+            return "No response content available."
+
+    def _display_step(self, record: StepRecord):
+        """
+        Print a one-line summary of an agent loop step.
+        """
+        self.last_turn_steps.append(record)
+        if not getattr(Config, 'SHOW_STEP_STATS', False):
+            return
 
+        parts = [f"Step {record.step}", f"api {record.api_latency:.2f}s"]
+        if record.route:
+            parts[0] += f" ({record.route}: {record.model})"
+        if record.time_to_first_token is not None:
+            parts[-1] += f" (ttft {record.time_to_first_token:.2f}s)"
+        if record.tool_calls:
+            parts.append(f"tools {record.tool_latency:.2f}s ({', '.join(record.tool_calls)})")
+            if record.speculative_calls:
+                parts[-1] += f", {record.speculative_calls} started while streaming"
+        parts.append(f"{record.input_tokens:,} in / {record.output_tokens:,} out")
+        if record.cost is not None:
+            parts[-1] += f" ${record.cost:.4f}"
+        if record.escalated:
+            parts.append("no tool call, asking the main model")
+        if record.cache_read_tokens or record.cache_write_tokens:
+            parts.append(f"cache {record.cache_read_tokens:,} read / {record.cache_write_tokens:,} written")
+        if record.retries or record.rate_limit_wait >= 0.1:
+            parts.append(f"{record.retries} retries, waited {record.rate_limit_wait:.2f}s")
+        if record.budget_exceeded:
+            parts.append("over budget")
+        self.console.print(f"[dim]{' · '.join(parts)}[/dim]")
+
+    def _get_completion(self):
+        """
+        Get a completion from the Anthropic API, running tool rounds in an
+        iterative agent loop until the model produces a final answer.
+        Handles both text-only and multimodal messages.
+        """
+        try:
+            loop = AgentLoop(
+                self,
+                max_steps=getattr(Config, 'MAX_AGENT_STEPS', 25),
+                step_budget=getattr(Config, 'STEP_TIME_BUDGET', None),
+                on_step=self._display_step
+            )
+            return loop.run()
+        except TurnCancelled:
+            raise
         except Exception as e:
             logging.error(f"Error in _get_completion: {str(e)}")
             return f"Error: {str(e)}"
@@ -430,47 +1276,160 @@ class Assistant:
                 return "Conversation reset!"
             elif user_input.lower() == 'quit':
                 return "Goodbye!"
+            elif user_input.lower() in ('stats', 'stats all'):
+                return self.trace_stats(from_file=user_input.lower() == 'stats all')
+
+        self._ensure_history_loaded()
+        if self.cancel_event.is_set():
+            # A new event, so calls of the cancelled turn that are still winding down stay cancelled
+            self.cancel_event = threading.Event()
+            self.tool_scheduler.cancel_event = self.cancel_event
+        self.last_response_streamed = False
+        self.last_time_to_first_token = None
+        self._stream_header_shown = False
+        self._last_streamed_text = None
+        self.last_turn_steps = []
 
         try:
             # Add user message to conversation history
-            self.conversation_history.append({
+            self._append_message({
                 "role": "user",
                 "content": user_input  # This can be either string or list
             })
-
-            # Show thinking indicator if enabled
-            if self.thinking_enabled:
-                with Live(Spinner('dots', text='Thinking...', style="cyan"), 
-                         refresh_per_second=10, transient=True):
+            self._select_tools(user_input)
+
+            with self.profiler.profile_turn(), \
+                    self.tracer.span("chat.turn", {"history.messages": len(self.conversation_history)}) as span:
+                # Show thinking indicator if enabled. When streaming to the console
+                # the spinner is shown per request until the first token arrives.
+                if self.thinking_enabled and not (self.streaming_enabled and self.render_stream):
+                    from rich.live import Live
+                    from rich.spinner import Spinner
+                    with Live(Spinner('dots', text='Thinking...', style="cyan"),
+                             refresh_per_second=10, transient=True):
+                        response = self._get_completion()
+                else:
                     response = self._get_completion()
-            else:
-                response = self._get_completion()
+                span.update({
+                    "steps": len(self.last_turn_steps),
+                    "tool_calls": sum(len(record.tool_calls) for record in self.last_turn_steps),
+                    "response.bytes": len(response) if isinstance(response, str) else None,
+                    "context_tokens": self.context.last_prompt_tokens
+                })
 
+            # The CLI skips re-printing a final answer it already rendered live
+            self.last_response_streamed = (
+                self._last_streamed_text is not None and response == self._last_streamed_text
+            )
             return response
 
+        except (TurnCancelled, KeyboardInterrupt):
+            self.cancel()
+            self._close_cancelled_turn()
+            self.console.print("\n[yellow]Request cancelled.[/yellow]")
+            return "Request cancelled."
         except Exception as e:
             logging.error(f"Error in chat: {str(e)}")
             return f"Error: {str(e)}"
 
+    def profile_command(self, action: str) -> str:
+        """
+        Handle 'profile on|off|dump': profile chat turns with cProfile and
+        tracemalloc and write the reports to Config.PROFILE_DIR.
+        """
+        action = action.strip().lower()
+        if action == 'on':
+            return self.profiler.start()
+        if action == 'off':
+            return self.profiler.stop()
+        if action == 'dump':
+            return self.profiler.dump()
+        state = "on" if self.profiler.active else "off"
+        return f"Profiling is {state}. Usage: profile on|off|dump"
+
+    def trace_stats(self, from_file: bool = False) -> str:
+        """
+        A table of p50/p95 durations per span type, for this session or
+        (from_file) for every trace in the trace file.
+        """
+        if not self.tracer.enabled:
+            return "Tracing is disabled. Set ENABLE_TRACING in config.py to collect timings."
+        rows = self.tracer.stats(from_file=from_file)
+        if not rows:
+            return "No traces recorded yet."
+
+        scope = "all traces" if from_file else "this session"
+        lines = [
+            f"Span timings ({scope}):",
+            "",
+            "| span | count | p50 | p95 | max | total |",
+            "|---|---:|---:|---:|---:|---:|"
+        ]
+        for row in rows:
+            lines.append(
+                f"| {row['name']} | {row['count']} | {row['p50'] * 1000:.1f} ms | "
+                f"{row['p95'] * 1000:.1f} ms | {row['max'] * 1000:.1f} ms | {row['total']:.2f} s |"
+            )
+        return "\n".join(lines)
+
+    def new_conversation(self, new_session: bool = False) -> None:
+        """
+        Start over with an empty conversation and zeroed usage, keeping the
+        client, the tools and the tool cache. With new_session the journal
+        continues in a new session file instead of marking a reset in the
+        current one (batch.py runs each task as its own session).
+        """
+        self._ensure_history_loaded()
+        self.conversation_history = MessageStore()
+        if self.journal is not None:
+            if new_session:
+                self.journal.close()
+                self.journal = SessionJournal(self._sessions_dir())
+            else:
+                self.journal.reset()
+        self.total_tokens_used = 0
+        self.total_cost = 0.0
+        if self.router is not None:
+            self.router.reset()
+        if self.tool_selector is not None:
+            self.tool_selector.reset()
+        self.context.reset()
+        self.result_store.clear()
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.last_turn_steps = []
+        self.last_time_to_first_token = None
+
     def reset(self):
         """
         Reset the assistant's memory and token usage.
         """
-        self.conversation_history = []
-        self.total_tokens_used = 0
+        self.new_conversation()
         self.console.print("\n[bold green]🔄 Assistant memory has been reset![/bold green]")
 
-        welcome_text = """
-# Claude Engineer v3. A self-improving assistant framework with tool creation
+        print_welcome(self.console)
+        self.display_available_tools()
+
 
+WELCOME_TITLE = "Claude Engineer v3. A self-improving assistant framework with tool creation"
+WELCOME_COMMANDS = """
 Type 'refresh' to reload available tools
 Type 'reset' to clear conversation history
+Type 'stats' to show timings of model requests, tools and display
+Type 'profile on|off|dump' to profile chat turns
 Type 'quit' to exit
 
-Available tools:
-"""
-        self.console.print(Markdown(welcome_text))
-        self.display_available_tools()
+Available tools:"""
+
+
+def print_welcome(console: Console) -> None:
+    """
+    Print the banner shown at startup and after 'reset'. It is laid out the
+    way Markdown would render it, without importing Markdown before the
+    first prompt.
+    """
+    console.print(Panel(Text(WELCOME_TITLE, style="bold", justify="center"), box=box.HEAVY))
+    console.print(WELCOME_COMMANDS, markup=False)
 
 
 def main():
@@ -478,9 +1437,17 @@ def main():
     Entry point for the assistant CLI loop.
     Provides a prompt for user input and handles 'quit' and 'reset' commands.
     """
+    from prompt_toolkit import prompt
+    from prompt_toolkit.styles import Style
+
     console = Console()
     style = Style.from_dict({'prompt': 'orange'})
 
+    parser = argparse.ArgumentParser(description="Claude Engineer v3")
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='SESSION_ID',
+                        help="continue a journaled session (the most recent one by default)")
+    args = parser.parse_args()
+
     try:
         assistant = Assistant()
     except ValueError as e:
@@ -488,18 +1455,22 @@ def main():
         console.print("Please ensure ANTHROPIC_API_KEY is set correctly.")
         return
 
-    welcome_text = """
-# Claude Engineer v3. A self-improving assistant framework with tool creation
-
-Type 'refresh' to reload available tools
-Type 'reset' to clear conversation history
-Type 'quit' to exit
+    assistant.render_stream = True
 
-Available tools:
-"""
-    console.print(Markdown(welcome_text))
+    print_welcome(console)
     assistant.display_available_tools()
 
+    if args.resume:
+        session_id = assistant.resume_session(None if args.resume == 'latest' else args.resume)
+        if session_id:
+            console.print(f"\n[green]Resuming session {session_id}[/green]")
+        else:
+            console.print(f"\n[yellow]No session '{args.resume}' to resume, starting a new one[/yellow]")
+    if assistant.journal is not None:
+        console.print(f"[dim]Session: {assistant.journal.session_id}[/dim]")
+
+    # The SDK loads while the first message is typed
+    assistant.warm_up()
     while True:
         try:
             user_input = prompt("You: ", style=style).strip()
@@ -510,14 +1481,22 @@ Available tools:
             elif user_input.lower() == 'reset':
                 assistant.reset()
                 continue
+            elif user_input.lower() in ('profile', 'profile on', 'profile off', 'profile dump'):
+                action = user_input[len('profile'):]
+                console.print(f"\n{assistant.profile_command(action)}", style="cyan", markup=False)
+                continue
 
             response = assistant.chat(user_input)
-            console.print("\n[bold purple]Claude Engineer:[/bold purple]")
-            if isinstance(response, str):
-                safe_response = response.replace('[', '\\[').replace(']', '\\]')
-                console.print(safe_response)
-            else:
-                console.print(str(response))
+            if not assistant.last_response_streamed:
+                console.print("\n[bold purple]Claude Engineer:[/bold purple]")
+                if isinstance(response, str):
+                    safe_response = response.replace('[', '\\[').replace(']', '\\]')
+                    console.print(safe_response)
+                else:
+                    console.print(str(response))
+
+            if assistant.last_time_to_first_token is not None:
+                console.print(f"[dim]Time to first token: {assistant.last_time_to_first_token:.2f}s[/dim]")
 
         except KeyboardInterrupt:
             continue
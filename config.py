@@ -8,14 +8,63 @@ class Config:
     ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
     MODEL = "claude-3-5-sonnet-20241022"
     MAX_TOKENS = 8000
+    MODEL_ROUTING = False  # Send intermediate tool rounds to FAST_MODEL, see MODEL_ROUTES; pays off on long tool chains
+    FAST_MODEL = "claude-3-5-haiku-20241022"
+    FAST_MODEL_MAX_TOKENS = None  # Output limit of fast steps, None for MAX_TOKENS; outputs cut off are redone with MODEL
+    MODEL_ROUTES = {  # Model per kind of step: "main" (MODEL) or "fast" (FAST_MODEL)
+        "first_step": "main",
+        "tool_round": "fast",
+        "after_error": "main",
+        "final_answer": "main",
+    }
     MAX_CONVERSATION_TOKENS = 200000  # Maximum tokens per conversation
 
     # Paths
     BASE_DIR = Path(__file__).parent
     TOOLS_DIR = BASE_DIR / "tools"
     PROMPTS_DIR = BASE_DIR / "prompts"
+    CACHE_DIR = BASE_DIR / ".cache"
+    TOOL_MANIFEST_PATH = CACHE_DIR / "tool_manifest.json"
+    SESSIONS_DIR = BASE_DIR / "sessions"
+    TRACE_PATH = CACHE_DIR / "traces.jsonl"
+    PROFILE_DIR = CACHE_DIR / "profiles"
 
     # Assistant Configuration
     ENABLE_THINKING = True
     SHOW_TOOL_USAGE = True
+    TOOL_USAGE_PREVIEW_CHARS = 2000  # Characters of tool input and result shown per panel
     DEFAULT_TEMPERATURE = 0.7
+    ENABLE_STREAMING = True  # Stream responses and render text as it arrives
+    SPECULATIVE_TOOL_EXECUTION = True  # Start read-only tools while the response is still streaming
+    MAX_CONCURRENT_TOOLS = 4  # Worker threads for read-only tool calls in one turn
+    MAX_AGENT_STEPS = 25  # Maximum model requests (tool rounds) per user turn
+    STEP_TIME_BUDGET = 300  # Wall-clock seconds per agent step, None to disable
+    SHOW_STEP_STATS = True  # Print latency and token figures after each step
+    LAZY_TOOL_LOADING = True  # Read tools from the manifest, import on first use
+    ENABLE_PROMPT_CACHING = True  # Cache breakpoints on system, tools and latest turn
+    ENABLE_COMPACTION = True  # Shrink old turns instead of hitting the token limit
+    COMPACTION_THRESHOLD = 150000  # Estimated prompt tokens that trigger compaction
+    COMPACTION_TARGET = 100000  # Prompt size compaction aims for
+    COMPACTION_KEEP_TURNS = 2  # Most recent user turns that are never elided
+    TOOL_RESULT_TOKEN_BUDGET = 8000  # Larger tool results are stored and paged, None to disable
+    TOOL_RESULT_PAGE_TOKENS = 4000  # Page size of the result pager tool
+    TOOL_SELECTION = True  # Send only the tools relevant to each turn (local BM25 index over the tools)
+    TOOL_SELECTION_MIN_TOOLS = 30  # Installed tools below which every tool is offered
+    TOOL_SELECTION_TOP_K = 5  # Best matching tools offered per turn, besides the pinned ones
+    PINNED_TOOLS = ["filecontentreadertool", "filecreatortool", "fileedittool", "diffeditortool"]  # Always offered
+    TOOL_CACHE_SIZE = 256  # Cached read-only tool results, 0 to disable
+    TOOL_ISOLATION = True  # Run tools from tools/ in worker processes that can be killed
+    TOOL_TIMEOUT = 120  # Seconds a tool call may run before its worker is killed, None to disable
+    TOOL_MEMORY_LIMIT_MB = 2048  # Address space limit of tool worker processes (POSIX), None to disable
+    TOOL_WORKER_PROCESSES = 8  # Tool worker processes shared by all assistants in a process
+    IMAGE_MAX_DIMENSION = 1568  # Longest side in pixels of images sent to the model
+    IMAGE_JPEG_QUALITY = 85  # Quality of photos re-encoded as JPEG
+    IMAGE_CACHE_SIZE = 64  # Normalized images remembered by content hash
+    RATE_LIMIT_REQUESTS_PER_MINUTE = 50  # Shared per API key; match your API tier, None to disable
+    RATE_LIMIT_TOKENS_PER_MINUTE = 400000  # Input + output tokens per minute, None to disable
+    MAX_API_RETRIES = 5  # Retries of rate-limited, overloaded or failed requests
+    RETRY_BASE_DELAY = 1.0  # Seconds; doubled per retry with jitter unless retry-after is given
+    RETRY_MAX_DELAY = 60.0  # Upper bound of a single backoff delay in seconds
+    ENABLE_SESSION_JOURNAL = True  # Append every message to SESSIONS_DIR/<session>.jsonl
+    RESUME_SESSION = None  # Session id (or "latest") the web app resumes on startup
+    ENABLE_TRACING = True  # Record spans per turn to TRACE_PATH (OTLP/JSON lines)
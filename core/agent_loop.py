@@ -0,0 +1,180 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import time
+
+from core.routing import AFTER_ERROR, FIRST_STEP, TOOL_ROUND, Route
+
+
+@dataclass
+class StepRecord:
+    """
+    Timing and token figures for one step (one Messages API call plus the
+    tool round it triggered) of an agent loop.
+    """
+    step: int
+    model: str
+    route: Optional[str] = None
+    escalated: bool = False
+    cost: Optional[float] = None
+    stop_reason: Optional[str] = None
+    api_latency: float = 0.0
+    time_to_first_token: Optional[float] = None
+    tool_latency: float = 0.0
+    tool_calls: List[str] = field(default_factory=list)
+    speculative_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    retries: int = 0
+    rate_limit_wait: float = 0.0
+    budget_exceeded: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class StepBudgetExceeded(Exception):
+    """Raised when a model request does not finish within the step budget."""
+
+
+class TurnCancelled(Exception):
+    """Raised when the assistant's cancel event is set during a turn."""
+
+
+class AgentLoop:
+    """
+    Drives a single user turn: request a completion, run the requested tools,
+    feed their results back and repeat until the model gives a final answer.
+
+    The loop is iterative and bounded:
+    - max_steps caps the number of model requests per turn.
+    - step_budget (seconds) bounds the wall-clock time of each step; the model
+      request gets the full budget and tools get whatever is left of it.
+
+    Every step produces a StepRecord which is passed to on_step and kept in
+    self.steps. The turn is abandoned with TurnCancelled between steps once
+    the assistant's cancel_event is set.
+
+    With the assistant's router set, each step's model is chosen by the kind
+    of step; a provisional step that does not call a tool is dropped and
+    redone with the final answer route.
+    """
+
+    def __init__(self, assistant, max_steps: int = 25, step_budget: Optional[float] = None,
+                 on_step: Optional[Callable[[StepRecord], None]] = None):
+        self.assistant = assistant
+        self.max_steps = max(1, int(max_steps))
+        self.step_budget = step_budget
+        self.on_step = on_step
+        self.steps: List[StepRecord] = []
+
+    def run(self) -> str:
+        """
+        Run the loop until a final answer, an error or the step limit.
+        Returns the text that should be shown to the user.
+        """
+        kind = FIRST_STEP
+        for step in range(1, self.max_steps + 1):
+            self._check_cancelled()
+            deadline = time.monotonic() + self.step_budget if self.step_budget else None
+            route = self._route(kind)
+
+            api_started = time.perf_counter()
+            try:
+                response = self.assistant._request_completion(deadline=deadline, route=route)
+            except StepBudgetExceeded:
+                record = self._new_record(step, None)
+                record.api_latency = time.perf_counter() - api_started
+                record.budget_exceeded = True
+                self._emit(record)
+                self.assistant.console.print(
+                    f"\n[bold red]Step {step} exceeded its time budget of {self.step_budget:.0f}s.[/bold red]"
+                )
+                return f"Error: step {step} exceeded its time budget of {self.step_budget:.0f}s"
+
+            record = self._new_record(step, response)
+            record.api_latency = time.perf_counter() - api_started
+            record.route = route.name if route else None
+
+            limit_message = self.assistant._account_usage(response, route=route)
+            record.cost = self.assistant._last_request_cost
+            if limit_message:
+                self._emit(record)
+                return limit_message
+
+            if route is not None and self.assistant.router.needs_escalation(route, response):
+                # Not appended to the history: the step is asked again
+                record.escalated = True
+                self._emit(record)
+                kind = None
+                continue
+
+            if response.stop_reason == "tool_use":
+                tool_uses = [
+                    block for block in (getattr(response, 'content', None) or [])
+                    if block.type == "tool_use"
+                ]
+                if not tool_uses:
+                    self._emit(record)
+                    self.assistant.console.print("[red]No tool content received despite 'tool_use' stop reason.[/red]")
+                    return "Error: No tool content received"
+
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                tools_started = time.perf_counter()
+                self.assistant._run_tool_round(response, tool_uses, timeout=timeout)
+                record.tool_latency = time.perf_counter() - tools_started
+                record.tool_calls = [tool_use.name for tool_use in tool_uses]
+                record.speculative_calls = self.assistant._last_round_speculative
+                record.budget_exceeded = deadline is not None and time.monotonic() > deadline
+                self._emit(record)
+                self._check_cancelled()
+                kind = AFTER_ERROR if self.assistant._last_round_errors else TOOL_ROUND
+                continue
+
+            self._emit(record)
+            return self.assistant._finish_turn(response)
+
+        self.assistant.console.print(
+            f"\n[bold red]Stopped after {self.max_steps} steps without a final answer.[/bold red]"
+        )
+        return (
+            f"Stopped after {self.max_steps} steps without a final answer. "
+            "Ask me to continue if you want me to keep going."
+        )
+
+    def _route(self, kind: Optional[str]) -> Optional[Route]:
+        """
+        The route of the next step; kind None means the last step was dropped.
+        """
+        router = getattr(self.assistant, 'router', None)
+        if router is None:
+            return None
+        if kind is None:
+            return router.final_route(self.assistant.model)
+        return router.choose(self.assistant.model, kind)
+
+    def _check_cancelled(self) -> None:
+        cancel_event = getattr(self.assistant, 'cancel_event', None)
+        if cancel_event is not None and cancel_event.is_set():
+            raise TurnCancelled("The turn was cancelled")
+
+    def _new_record(self, step: int, response) -> StepRecord:
+        usage = getattr(response, 'usage', None)
+        return StepRecord(
+            step=step,
+            model=getattr(response, 'model', None) or self.assistant.model,
+            stop_reason=getattr(response, 'stop_reason', None),
+            time_to_first_token=self.assistant._last_request_ttft,
+            retries=self.assistant._last_request_retries,
+            rate_limit_wait=self.assistant._last_request_wait,
+            input_tokens=getattr(usage, 'input_tokens', 0) or 0,
+            output_tokens=getattr(usage, 'output_tokens', 0) or 0,
+            cache_read_tokens=getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            cache_write_tokens=getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+        )
+
+    def _emit(self, record: StepRecord) -> None:
+        self.steps.append(record)
+        if self.on_step:
+            self.on_step(record)
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+
+def path_fingerprint(paths: Iterable[str], skip: Optional[Callable[[str], bool]] = None) -> Tuple:
+    """
+    (path, mtime_ns, size) for every given path. Directories are walked so that
+    a change to any file below them changes the fingerprint; files and
+    directories for which skip(path) is true (what the tool never reads, such
+    as .git or node_modules) are left out. Missing paths are recorded as such.
+    """
+    entries: List[Tuple] = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            entries.append((path, None, None))
+            continue
+        entries.append((path, stat.st_mtime_ns, stat.st_size))
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(name for name in dirs if not (skip and skip(os.path.join(root, name))))
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    if skip and skip(file_path):
+                        continue
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entries.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+def tool_paths(tool_input: Dict[str, Any], path_inputs: Iterable[str]) -> List[str]:
+    """
+    The file paths named by a tool call, read from the input fields listed in
+    the tool's path_inputs (each a path or a list of paths).
+    """
+    paths = []
+    for key in path_inputs:
+        value = tool_input.get(key)
+        if isinstance(value, str):
+            paths.append(value)
+        elif isinstance(value, (list, tuple)):
+            paths.extend(str(item) for item in value)
+    return paths
+
+
+class ToolResultCache:
+    """
+    LRU cache of read-only tool results, keyed by tool name and input.
+
+    A tool opts in through two BaseTool attributes:
+    - path_inputs: input fields holding file paths. The entry is valid while
+      the mtime and size of those paths (and of every file below a directory
+      that the tool's skip_path doesn't exclude) are unchanged.
+    - cache_ttl: seconds an entry stays valid, for results fetched over the
+      network.
+
+    Hits, misses and the execution time saved by hits are counted per tool.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self._per_tool: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def is_cacheable(tool) -> bool:
+        return bool(getattr(tool, 'read_only', False)) and bool(
+            getattr(tool, 'path_inputs', None) or getattr(tool, 'cache_ttl', None)
+        )
+
+    @staticmethod
+    def key(tool_name: str, tool_input: Dict[str, Any]) -> Tuple[str, str]:
+        return tool_name, json.dumps(tool_input, sort_keys=True, default=str)
+
+    def fingerprint(self, tool, tool_input: Dict[str, Any]) -> Optional[Tuple]:
+        path_inputs = getattr(tool, 'path_inputs', None)
+        if not path_inputs:
+            return None
+        return path_fingerprint(tool_paths(tool_input, path_inputs), skip=getattr(tool, 'skip_path', None))
+
+    def get(self, tool, tool_input: Dict[str, Any], fingerprint: Optional[Tuple] = None) -> Tuple[bool, Any]:
+        """
+        Look up a tool call. Returns (True, result) on a hit and (False, None)
+        on a miss; stale entries are dropped. Pass the call's fingerprint if
+        it was already taken, so the paths are not walked twice.
+        """
+        key = self.key(tool.name, tool_input)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None:
+            expired = entry['expires_at'] is not None and time.monotonic() >= entry['expires_at']
+            if not expired and entry['fingerprint'] is not None and fingerprint is None:
+                fingerprint = self.fingerprint(tool, tool_input)
+            if not expired and (entry['fingerprint'] is None or entry['fingerprint'] == fingerprint):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.time_saved += entry['duration']
+                    self._count(tool.name, 'hits')
+                return True, entry['result']
+            with self._lock:
+                self._entries.pop(key, None)
+
+        with self._lock:
+            self.misses += 1
+            self._count(tool.name, 'misses')
+        return False, None
+
+    def put(self, tool, tool_input: Dict[str, Any], result: Any,
+            fingerprint: Optional[Tuple], duration: float) -> None:
+        """
+        Store a result. fingerprint must be taken before the tool ran, so a
+        change made while it was running invalidates the entry.
+        """
+        ttl = getattr(tool, 'cache_ttl', None)
+        entry = {
+            'result': result,
+            'fingerprint': fingerprint,
+            'expires_at': time.monotonic() + ttl if ttl else None,
+            'duration': duration
+        }
+        key = self.key(tool.name, tool_input)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tool_name: str) -> None:
+        """
+        Drop every entry of a tool, e.g. after its module was reloaded.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == tool_name]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'time_saved': round(self.time_saved, 3),
+                'entries': len(self._entries),
+                'tools': {name: dict(counts) for name, counts in self._per_tool.items()}
+            }
+
+    def _count(self, tool_name: str, counter: str) -> None:
+        counts = self._per_tool.setdefault(tool_name, {'hits': 0, 'misses': 0})
+        counts[counter] += 1
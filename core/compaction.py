@@ -0,0 +1,226 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from core.context import estimate_tokens
+from core.prompt_cache import block_to_dict
+
+# Tool results and inputs smaller than this are left alone
+STUB_MIN_TOKENS = 400
+# The most recent messages (the last couple of tool rounds) are never stubbed
+KEEP_RECENT_MESSAGES = 4
+# Strings kept from an elided tool_use input value
+INPUT_PREVIEW_CHARS = 200
+# Characters of each dropped user request kept in the summary
+SUMMARY_REQUEST_CHARS = 200
+# First line of the text block that replaces elided turns
+SUMMARY_HEADER = "[Earlier conversation compacted]"
+
+
+@dataclass
+class CompactionResult:
+    """
+    Outcome of a compaction pass.
+    """
+    messages: List[Dict[str, Any]]
+    tokens_before: int
+    tokens_after: int
+    stubbed_blocks: int = 0
+    elided_messages: int = 0
+
+
+def _blocks(content: Any) -> List[Any]:
+    if isinstance(content, list):
+        return content
+    if isinstance(content, str) and content:
+        return [{"type": "text", "text": content}]
+    return []
+
+
+def _block_type(block: Any) -> Optional[str]:
+    if isinstance(block, dict):
+        return block.get('type')
+    return getattr(block, 'type', None)
+
+
+def is_turn_start(message: Dict[str, Any]) -> bool:
+    """
+    True for a user message typed by the user, as opposed to one that only
+    carries tool results.
+    """
+    if message.get('role') != 'user':
+        return False
+    return not any(_block_type(block) == 'tool_result' for block in _blocks(message.get('content')))
+
+
+class ConversationCompactor:
+    """
+    Shrinks a conversation once its estimated prompt size crosses a threshold,
+    until it fits under a lower target.
+
+    Two passes, oldest messages first:
+    1. Bulky payloads are replaced by short stubs: old tool_result content,
+       images and large tool_use input values. Every tool_use keeps its id and
+       every tool_result keeps its tool_use_id, so the pairing the API requires
+       stays valid.
+    2. If that isn't enough, whole turns before the last keep_turns user turns
+       are dropped and replaced by a short summary of what was asked and which
+       tools were used. Turns are only cut where a user turn starts, so no
+       tool_result is separated from its tool_use.
+
+    Messages are never modified in place; changed messages are replaced by new
+    dicts, which keeps the per-message estimates in ContextTracker valid.
+    """
+
+    def __init__(self, threshold: int, target: int, keep_turns: int = 2,
+                 message_tokens: Optional[Callable[[Dict[str, Any]], int]] = None):
+        self.threshold = threshold
+        self.target = min(target, threshold)
+        self.keep_turns = max(1, keep_turns)
+        self.message_tokens = message_tokens or (
+            lambda message: estimate_tokens(message.get('content'))
+        )
+
+    def needs_compaction(self, total_tokens: int) -> bool:
+        return total_tokens >= self.threshold
+
+    def compact(self, messages: List[Dict[str, Any]], total_tokens: int) -> CompactionResult:
+        """
+        Compact the messages of a conversation whose prompt is estimated at
+        total_tokens. Returns the new message list and the estimated savings.
+        """
+        result = CompactionResult(messages=list(messages), tokens_before=total_tokens,
+                                  tokens_after=total_tokens)
+        tool_names = self._tool_names(messages)
+
+        self._stub_payloads(result, tool_names)
+        if result.tokens_after > self.target:
+            self._elide_turns(result, tool_names)
+        return result
+
+    def _tool_names(self, messages: List[Dict[str, Any]]) -> Dict[str, str]:
+        names = {}
+        for message in messages:
+            if message.get('role') != 'assistant':
+                continue
+            for block in _blocks(message.get('content')):
+                if _block_type(block) == 'tool_use':
+                    block = block_to_dict(block)
+                    names[block.get('id')] = block.get('name', 'tool')
+        return names
+
+    def _replace(self, result: CompactionResult, index: int, message: Dict[str, Any]) -> None:
+        old = result.messages[index]
+        result.tokens_after -= self.message_tokens(old) - self.message_tokens(message)
+        result.messages[index] = message
+
+    def _stub_payloads(self, result: CompactionResult, tool_names: Dict[str, str]) -> None:
+        messages = result.messages
+        for index in range(max(0, len(messages) - KEEP_RECENT_MESSAGES)):
+            if result.tokens_after <= self.target:
+                return
+            message = messages[index]
+            content = message.get('content')
+            if not isinstance(content, list):
+                continue
+
+            stubbed = 0
+            new_content = []
+            for block in content:
+                new_block = self._stub_block(block, tool_names)
+                if new_block is not block:
+                    stubbed += 1
+                new_content.append(new_block)
+            if stubbed:
+                self._replace(result, index, dict(message, content=new_content))
+                result.stubbed_blocks += stubbed
+
+    def _stub_block(self, block: Any, tool_names: Dict[str, str]) -> Any:
+        block_type = _block_type(block)
+
+        if block_type == 'tool_result':
+            block = block_to_dict(block)
+            tokens = estimate_tokens(block.get('content'))
+            if tokens < STUB_MIN_TOKENS:
+                return block
+            name = tool_names.get(block.get('tool_use_id'), 'tool')
+            stub = dict(block, content=[{
+                "type": "text",
+                "text": f"[Output of {name} elided during compaction (~{tokens:,} tokens). "
+                        "Run the tool again if it is needed.]"
+            }])
+            stub.pop('cache_control', None)
+            return stub
+
+        if block_type == 'image':
+            return {"type": "text", "text": "[Image elided during compaction]"}
+
+        if block_type == 'tool_use':
+            data = block_to_dict(block)
+            tool_input = data.get('input') or {}
+            if estimate_tokens(tool_input) < STUB_MIN_TOKENS or not isinstance(tool_input, dict):
+                return block
+            trimmed = {
+                key: (f"{value[:INPUT_PREVIEW_CHARS]}... [{len(value):,} chars elided during compaction]"
+                      if isinstance(value, str) and len(value) > INPUT_PREVIEW_CHARS else value)
+                for key, value in tool_input.items()
+            }
+            return dict(data, input=trimmed)
+
+        return block
+
+    def _elide_turns(self, result: CompactionResult, tool_names: Dict[str, str]) -> None:
+        messages = result.messages
+        turn_starts = [index for index, message in enumerate(messages) if is_turn_start(message)]
+        if len(turn_starts) <= self.keep_turns:
+            return
+
+        # Drop whole turns, oldest first, until the estimate fits the target
+        candidates = turn_starts[1:len(turn_starts) - self.keep_turns + 1]
+        cut = None
+        tokens = result.tokens_after
+        for boundary in candidates:
+            previous = cut or 0
+            tokens -= sum(self.message_tokens(message) for message in messages[previous:boundary])
+            cut = boundary
+            if tokens <= self.target:
+                break
+        if not cut:
+            return
+
+        dropped = messages[:cut]
+        summary = self._summary(dropped, tool_names)
+        first_kept = messages[cut]
+        merged = dict(first_kept, content=[{"type": "text", "text": summary}]
+                      + list(_blocks(first_kept.get('content'))))
+
+        result.tokens_after -= sum(self.message_tokens(message) for message in dropped)
+        result.messages = messages[cut:]
+        self._replace(result, 0, merged)
+        result.elided_messages += len(dropped)
+
+    def _summary(self, dropped: List[Dict[str, Any]], tool_names: Dict[str, str]) -> str:
+        lines: List[str] = []
+        used_tools: Dict[str, int] = {}
+
+        for message in dropped:
+            for block in _blocks(message.get('content')):
+                block_type = _block_type(block)
+                if block_type == 'text' and message.get('role') == 'user':
+                    text = block_to_dict(block).get('text', '')
+                    if text.startswith(SUMMARY_HEADER):
+                        # Keep what an earlier compaction already summarized
+                        lines.extend(text.splitlines()[1:])
+                    elif text.strip():
+                        request = " ".join(text.split())
+                        if len(request) > SUMMARY_REQUEST_CHARS:
+                            request = request[:SUMMARY_REQUEST_CHARS] + "..."
+                        lines.append(f"- User asked: {request}")
+                elif block_type == 'tool_use':
+                    name = block_to_dict(block).get('name', 'tool')
+                    used_tools[name] = used_tools.get(name, 0) + 1
+
+        if used_tools:
+            lines.append("- Tools used: " + ", ".join(
+                f"{name} x{count}" if count > 1 else name for name, count in used_tools.items()
+            ))
+        return "\n".join([SUMMARY_HEADER] + lines)
@@ -0,0 +1,151 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import threading
+
+# Rough characters-per-token ratio for mixed English text and code
+CHARS_PER_TOKEN = 3.5
+# Upper bound the API charges for a single image block
+IMAGE_TOKENS = 1600
+# Per-message framing overhead (role markers and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estimate the token count of a piece of text.
+    """
+    if not text:
+        return 0
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def estimate_tokens(value: Any) -> int:
+    """
+    Estimate the token count of message content: strings, content block dicts,
+    SDK content blocks or lists of any of those.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return estimate_text_tokens(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(item) for item in value)
+
+    if isinstance(value, dict):
+        block_type = value.get('type')
+        get = value.get
+    else:
+        block_type = getattr(value, 'type', None)
+        get = lambda key, default=None: getattr(value, key, default)  # noqa: E731
+
+    if block_type == 'text':
+        return estimate_text_tokens(get('text', ''))
+    if block_type == 'image':
+        return IMAGE_TOKENS
+    if block_type == 'tool_use':
+        return estimate_text_tokens(get('name', '')) + estimate_text_tokens(
+            json.dumps(get('input', {}), default=str)
+        )
+    if block_type == 'tool_result':
+        return estimate_tokens(get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+    if block_type in ('thinking', 'redacted_thinking'):
+        return estimate_text_tokens(get('thinking', '') or get('data', ''))
+
+    if isinstance(value, dict):
+        return estimate_text_tokens(json.dumps(value, default=str))
+    return estimate_text_tokens(str(value))
+
+
+class ContextTracker:
+    """
+    Tracks the real prompt size of the next request, as opposed to cumulative
+    billing usage.
+
+    Message estimates are memoized per message object, so messages are treated
+    as immutable: code that rewrites history (compaction) replaces message
+    dicts instead of editing them. Whenever the API reports the actual prompt
+    size of a request, that figure becomes the anchor, and later estimates only
+    add the messages appended since then.
+    """
+
+    def __init__(self):
+        self._memo: Dict[int, Tuple[Any, int]] = {}
+        # The objects themselves are kept (and compared with 'is'): a bare id()
+        # can be reused by a new object once the old one is freed
+        self._fixed_prompt: Optional[Tuple[str, List[Dict[str, Any]]]] = None
+        self._fixed_tokens = 0
+        self._anchor_messages: List[Dict[str, Any]] = []
+        self._anchor_tokens = 0
+        self._anchor_fixed = 0
+        self._lock = threading.Lock()
+        self.last_prompt_tokens = 0
+
+    def set_prompt(self, system: str, tools: List[Dict[str, Any]]) -> None:
+        """
+        Set the parts of the prompt sent with every request (system prompt and
+        tool definitions). Re-estimated only when they change.
+        """
+        if self._fixed_prompt is not None and (
+            self._fixed_prompt[0] is system and self._fixed_prompt[1] is tools
+        ):
+            return
+        self._fixed_prompt = (system, tools)
+        self._fixed_tokens = estimate_text_tokens(system) + estimate_text_tokens(
+            json.dumps(tools, default=str)
+        )
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        cached = self._memo.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        tokens = estimate_tokens(message.get('content')) + MESSAGE_OVERHEAD_TOKENS
+        self._memo[id(message)] = (message, tokens)
+        return tokens
+
+    def estimate(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Estimated prompt size in tokens of a request sending these messages.
+        """
+        with self._lock:
+            anchored = len(self._anchor_messages)
+            if anchored and len(messages) >= anchored and all(
+                message is anchor
+                for message, anchor in zip(messages, self._anchor_messages)
+            ):
+                total = self._anchor_tokens - self._anchor_fixed + self._fixed_tokens
+                total += sum(self.message_tokens(message) for message in messages[anchored:])
+            else:
+                total = self._fixed_tokens + sum(self.message_tokens(message) for message in messages)
+
+            # Forget estimates of messages that are no longer in the history
+            if len(self._memo) > 2 * len(messages) + 16:
+                live = {id(message) for message in messages}
+                self._memo = {key: value for key, value in self._memo.items() if key in live}
+            return total
+
+    def observe(self, messages: List[Dict[str, Any]], usage: Any) -> int:
+        """
+        Record the actual prompt size the API reported for a request that sent
+        these messages. Returns that size.
+        """
+        prompt_tokens = (
+            (getattr(usage, 'input_tokens', 0) or 0)
+            + (getattr(usage, 'cache_read_input_tokens', 0) or 0)
+            + (getattr(usage, 'cache_creation_input_tokens', 0) or 0)
+        )
+        with self._lock:
+            self._anchor_messages = list(messages)
+            self._anchor_tokens = prompt_tokens
+            self._anchor_fixed = self._fixed_tokens
+            for message in messages:
+                self.message_tokens(message)
+            self.last_prompt_tokens = prompt_tokens
+        return prompt_tokens
+
+    def reset(self) -> None:
+        with self._lock:
+            self._memo.clear()
+            self._anchor_messages = []
+            self._anchor_tokens = 0
+            self._anchor_fixed = 0
+            self.last_prompt_tokens = 0
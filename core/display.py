@@ -0,0 +1,102 @@
+from typing import Any, List
+import json
+import re
+
+# Base64 runs shorter than this are shown as they are
+BASE64_MIN_CHARS = 200
+_BASE64_RUN = re.compile(r'(?:data:[\w.+-]+/[\w.+-]+;base64,)?[A-Za-z0-9+/]{%d,}={0,2}' % BASE64_MIN_CHARS)
+# Keys whose long string values are image payloads in tool inputs and results
+_BINARY_KEYS = ('data', 'image', 'source')
+
+
+def _omit_base64(text: str, cut: bool = False) -> str:
+    def replace(match) -> str:
+        # A run reaching a cut continues past it, so its length is unknown
+        if cut and match.end() == len(text):
+            return "[base64 data omitted]"
+        return f"[base64 data omitted, {len(match.group(0)):,} chars]"
+    return _BASE64_RUN.sub(replace, text)
+
+
+def preview_text(text: str, max_chars: int) -> str:
+    """
+    The first max_chars characters of a string with base64 runs omitted.
+    Only the prefix is scanned, so the cost does not depend on the length.
+    """
+    # A base64 run crossing the cut is still recognised as long as it fits in the margin
+    scanned = text[:max_chars + BASE64_MIN_CHARS]
+    prefix = _omit_base64(scanned, cut=len(scanned) < len(text))
+    if len(prefix) > max_chars:
+        prefix = prefix[:max_chars]
+    remaining = len(text) - max_chars
+    if remaining > 0:
+        prefix += f"\n... ({remaining:,} more characters)"
+    return prefix
+
+
+def preview(value: Any, max_chars: int = 2000) -> str:
+    """
+    A bounded, human-readable rendering of a tool input or result.
+
+    Strings are cut to their first max_chars characters and never parsed.
+    Dicts and lists are written out as indented JSON, stopping as soon as
+    max_chars characters have been produced, so a multi-megabyte structure
+    is neither serialized nor copied in full.
+    """
+    if isinstance(value, str):
+        return preview_text(value, max_chars)
+    if isinstance(value, bytes):
+        return f"[{len(value):,} bytes of binary data]"
+
+    parts: List[str] = []
+    budget = [max_chars]
+
+    def emit(text: str) -> bool:
+        # False once the text no longer fits, which stops the walk
+        if len(text) > budget[0]:
+            parts.append(text[:budget[0]])
+            budget[0] = 0
+            return False
+        parts.append(text)
+        budget[0] -= len(text)
+        return True
+
+    def write(item: Any, indent: str, key: Any = None) -> bool:
+        if isinstance(item, dict):
+            if not item:
+                return emit("{}")
+            if not emit("{"):
+                return False
+            inner = indent + "  "
+            for index, (child_key, child) in enumerate(item.items()):
+                if not emit(("," if index else "") + f"\n{inner}{json.dumps(str(child_key))}: "):
+                    return False
+                if not write(child, inner, child_key):
+                    return False
+            return emit(f"\n{indent}}}")
+        if isinstance(item, (list, tuple)):
+            if not item:
+                return emit("[]")
+            if not emit("["):
+                return False
+            inner = indent + "  "
+            for index, child in enumerate(item):
+                if not emit(("," if index else "") + f"\n{inner}"):
+                    return False
+                if not write(child, inner):
+                    return False
+            return emit(f"\n{indent}]")
+        if isinstance(item, str):
+            if key in _BINARY_KEYS and len(item) > 1000:
+                head = item[:BASE64_MIN_CHARS]
+                if head.startswith('data:') or _BASE64_RUN.match(head):
+                    return emit(f'"[base64 data omitted, {len(item):,} chars]"')
+            return emit(json.dumps(preview_text(item, budget[0]), ensure_ascii=False))
+        try:
+            return emit(json.dumps(item))
+        except (TypeError, ValueError):
+            return emit(repr(item))
+
+    if not write(value, ""):
+        parts.append("\n... (preview truncated)")
+    return "".join(parts)
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import base64
+import binascii
+import hashlib
+import io
+import threading
+
+# Pillow's (Image, ImageOps), imported with the first image; see _pillow
+_pil: Optional[Tuple[Any, Any]] = None
+
+# Media types accepted by the Messages API, by file signature
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+# Images with at most this many distinct colours (diagrams, UI, text) stay PNG
+PALETTE_COLORS = 256
+
+
+def _pillow() -> Tuple[Any, Any]:
+    """
+    Pillow's Image and ImageOps modules, imported on first use so that
+    importing this module stays cheap. (None, None) without Pillow: images
+    are then validated and passed through unchanged.
+    """
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image, ImageOps
+            _pil = (Image, ImageOps)
+        except ImportError:
+            _pil = (None, None)
+    return _pil
+
+
+def detect_media_type(data: bytes) -> Optional[str]:
+    """
+    The media type of an image from its magic bytes, or None if it is not a
+    PNG, JPEG, GIF or WebP image.
+    """
+    for signature, media_type in _SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+@dataclass
+class EncodedImage:
+    media_type: str
+    data: str  # base64
+    width: Optional[int] = None
+    height: Optional[int] = None
+    original_bytes: int = 0
+    encoded_bytes: int = 0
+
+    def to_block(self) -> Dict[str, Any]:
+        return {
+            "type": "image",
+            "source": {"type": "base64", "media_type": self.media_type, "data": self.data}
+        }
+
+
+class ImageEncoder:
+    """
+    Normalizes images before they are sent to the model.
+
+    Images are scaled down so that neither side exceeds max_dimension, then
+    written as PNG when they have transparency or few colours and as JPEG at
+    jpeg_quality otherwise. An image that is already small enough is kept as
+    it is unless re-encoding makes it smaller. The media type always comes
+    from the bytes, never from a file name or a client-supplied header.
+
+    Results are memoized by the sha256 of the input, and also of the base64
+    output, so an image normalized by /upload and sent back by the browser
+    to /chat is only encoded once. Without Pillow, images are only validated.
+    """
+
+    def __init__(self, max_dimension: int = 1568, jpeg_quality: int = 85, cache_size: int = 64):
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, EncodedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, raw: bytes) -> EncodedImage:
+        """
+        Normalize encoded image bytes. Raises ValueError for anything that is
+        not a supported image.
+        """
+        digest = hashlib.sha256(raw).hexdigest()
+        cached = self._cached(digest)
+        if cached is not None:
+            return cached
+
+        media_type = detect_media_type(raw)
+        if media_type is None:
+            raise ValueError("Unsupported image format: expected PNG, JPEG, GIF or WebP")
+
+        Image, _ = _pillow()
+        if Image is None:
+            encoded = EncodedImage(media_type, base64.b64encode(raw).decode('ascii'),
+                                   original_bytes=len(raw), encoded_bytes=len(raw))
+        else:
+            try:
+                with Image.open(io.BytesIO(raw)) as image:
+                    encoded = self._normalize(image, raw, media_type)
+            except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+                raise ValueError(f"Could not read image: {str(e)}")
+
+        self._remember(digest, encoded)
+        return encoded
+
+    def encode_base64(self, data: str) -> EncodedImage:
+        """
+        Normalize a base64 image, with or without a data: URL prefix.
+        """
+        if data.startswith('data:') and ',' in data:
+            data = data.split(',', 1)[1]
+        # Data this encoder produced is recognised without decoding it
+        cached = self._cached(_text_digest(data))
+        if cached is not None:
+            return cached
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Image data is not valid base64")
+        return self.encode(raw)
+
+    def encode_pil(self, image: Any) -> EncodedImage:
+        """
+        Normalize an in-memory Pillow image, such as a screenshot.
+        """
+        digest = hashlib.sha256(
+            f"{image.mode}:{image.size}:".encode('ascii') + image.tobytes()
+        ).hexdigest()
+        cached = self._cached(digest)
+        if cached is not None:
+            return cached
+        encoded = self._normalize(image, None, None)
+        self._remember(digest, encoded)
+        return encoded
+
+    def _normalize(self, image: Any, raw: Optional[bytes], media_type: Optional[str]) -> EncodedImage:
+        Image, ImageOps = _pillow()
+        width, height = image.size
+        target = self._target_size(width, height)
+        resize = target != (width, height)
+
+        if media_type == 'image/jpeg':
+            if resize:
+                # Let the JPEG decoder skip detail that is thrown away anyway
+                image.draft('RGB', target)
+            image = ImageOps.exif_transpose(image)
+        if getattr(image, 'is_animated', False):
+            image.seek(0)
+        if resize:
+            image = image.copy()
+            image.thumbnail(self._target_size(*image.size), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        if self._keep_lossless(image):
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                image = image.convert('RGBA')
+            image.save(buffer, format='PNG', optimize=True)
+            encoded_type = 'image/png'
+        else:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            encoded_type = 'image/jpeg'
+        output = buffer.getvalue()
+
+        original_bytes = len(raw) if raw is not None else len(output)
+        if raw is not None and not resize and len(raw) <= len(output):
+            output, encoded_type = raw, media_type
+        return EncodedImage(encoded_type, base64.b64encode(output).decode('ascii'),
+                            image.size[0], image.size[1], original_bytes, len(output))
+
+    def _target_size(self, width: int, height: int) -> Tuple[int, int]:
+        longest = max(width, height)
+        if not self.max_dimension or longest <= self.max_dimension:
+            return width, height
+        scale = self.max_dimension / longest
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    @staticmethod
+    def _keep_lossless(image: Any) -> bool:
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            return True
+        if image.mode in ('1', 'P'):
+            return True
+        return image.getcolors(PALETTE_COLORS) is not None
+
+    def _cached(self, digest: str) -> Optional[EncodedImage]:
+        with self._lock:
+            encoded = self._cache.get(digest)
+            if encoded is not None:
+                self._cache.move_to_end(digest)
+            return encoded
+
+    def _remember(self, digest: str, encoded: EncodedImage) -> None:
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[digest] = encoded
+            self._cache[_text_digest(encoded.data)] = encoded
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def _text_digest(data: str) -> str:
+    return "b64:" + hashlib.sha256(data.encode('ascii', 'replace')).hexdigest()
+
+
+_shared: Dict[Tuple, ImageEncoder] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_encoder(max_dimension: int, jpeg_quality: int, cache_size: int) -> ImageEncoder:
+    """
+    The ImageEncoder for a set of settings, created on first use, so the web
+    app and the tools share one memo.
+    """
+    with _shared_lock:
+        key = (max_dimension, jpeg_quality, cache_size)
+        encoder = _shared.get(key)
+        if encoder is None:
+            encoder = ImageEncoder(max_dimension, jpeg_quality, cache_size)
+            _shared[key] = encoder
+        return encoder
@@ -0,0 +1,282 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import atexit
+import itertools
+import logging
+import os
+import pickle
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# How often a waiting call checks its deadline and cancellation
+POLL_INTERVAL = 0.1
+# Project root, put on the workers' PYTHONPATH so core.* and tools.* import
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+class ToolCancelled(Exception):
+    """Raised by ToolProcessPool.call when the caller cancels the call."""
+
+
+class _Worker:
+    """
+    One worker process and the thread reading its responses.
+    """
+
+    def __init__(self, memory_limit_mb: Optional[int], generation: int):
+        self.generation = generation
+        # Tool modules the worker has been asked to import; it keeps them loaded
+        self.modules: Set[str] = set()
+        # Set by restart() while the worker is busy: stop it once its call returns
+        self.retired = False
+        command = [sys.executable, '-m', 'core.tool_worker']
+        if memory_limit_mb:
+            command += ['--memory-limit', str(int(memory_limit_mb))]
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(_ROOT), env.get('PYTHONPATH')]))
+
+        # Its own session (process group on Windows), so that Ctrl+C in the
+        # terminal does not reach it and everything it starts can be killed with it
+        if os.name == 'posix':
+            isolation = {'start_new_session': True}
+        else:
+            isolation = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, **isolation
+        )
+        self.responses: "queue.Queue[Optional[Tuple[int, bool, Any]]]" = queue.Queue()
+        threading.Thread(target=self._read, name=f"ce3-tool-worker-{self.process.pid}", daemon=True).start()
+
+    def _read(self) -> None:
+        stream = self.process.stdout
+        while True:
+            try:
+                self.responses.put(pickle.load(stream))
+            except Exception:
+                # EOF or a broken stream: the process is gone or unusable
+                self.responses.put(None)
+                return
+
+    def send(self, request: Tuple) -> None:
+        self.process.stdin.write(pickle.dumps(request))
+        self.process.stdin.flush()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        """
+        Kill the worker and every process it started.
+        """
+        try:
+            if os.name == 'posix':
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            logging.error(f"Tool worker {self.process.pid} did not exit after being killed")
+        self.close()
+
+    def close(self) -> None:
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+
+
+class ToolProcessPool:
+    """
+    Runs tool calls in reusable worker processes.
+
+    Each call is sent to an idle worker (started on demand, at most
+    max_workers at a time) which imports the tool's module, keeps the tool
+    instance for later calls and returns the result. A call that outlives its
+    timeout, or whose cancel event is set, has its worker killed together
+    with any processes the tool started; the caller gets an error result and
+    a fresh worker takes its place on the next call. Worker memory is capped
+    with RLIMIT_AS where the platform supports it.
+
+    restart() retires the workers that loaded given modules (or all of them),
+    e.g. after tool modules changed.
+    """
+
+    def __init__(self, max_workers: int = 4, memory_limit_mb: Optional[int] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.memory_limit_mb = memory_limit_mb
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+        self._busy = 0
+        self._generation = 0
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self.killed = 0
+
+    def call(self, module_name: str, class_name: str, kwargs: Dict[str, Any], label: str,
+             timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> Any:
+        """
+        Execute `class_name().execute(**kwargs)` from `module_name` in a worker.
+        Tool errors are returned as "Error ..." strings; ToolCancelled is raised
+        when cancel_event is set before the call finishes.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        worker = self._acquire(deadline, cancel_event)
+        if worker is None:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ToolCancelled(label)
+            return f"Error: tool '{label}' did not start within {timeout:.0f}s, all tool workers are busy"
+
+        call_id = next(self._ids)
+        worker.modules.add(module_name)
+        try:
+            worker.send((call_id, module_name, class_name, kwargs))
+        except (OSError, ValueError, pickle.PicklingError) as e:
+            self._discard(worker)
+            return f"Error executing tool '{label}': could not send the call to a worker ({str(e)})"
+
+        # Whatever interrupts the wait (KeyboardInterrupt included) must not leave
+        # the worker marked busy with the tool still running in its own session
+        try:
+            while True:
+                wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+                try:
+                    response = worker.responses.get(timeout=wait)
+                except queue.Empty:
+                    response = False
+
+                if response is None:
+                    try:
+                        code = worker.process.wait(timeout=1)
+                    except subprocess.TimeoutExpired:
+                        code = None
+                    self._discard(worker)
+                    return f"Error executing tool '{label}': the worker process exited unexpectedly (exit code {code})"
+                if response:
+                    response_id, ok, result = response
+                    if response_id == call_id:
+                        self._release(worker)
+                        return result if ok else f"Error executing tool '{label}': {result}"
+                    continue
+
+                if cancel_event is not None and cancel_event.is_set():
+                    self._discard(worker)
+                    raise ToolCancelled(label)
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._discard(worker)
+                    return f"Error: tool '{label}' did not finish within {timeout:.0f}s and was stopped"
+        except ToolCancelled:
+            raise
+        except BaseException:
+            self._discard(worker)
+            raise
+
+    def restart(self, modules: Optional[Iterable[str]] = None) -> None:
+        """
+        Stop the workers that imported any of `modules` (every worker if None):
+        idle ones now, busy ones when their call returns. Other workers stay warm.
+        """
+        with self._condition:
+            if modules is None:
+                self._generation += 1
+                stale = set(self._workers)
+            else:
+                modules = set(modules)
+                stale = {worker for worker in self._workers if worker.modules & modules}
+                for worker in stale:
+                    worker.retired = True
+            idle = [worker for worker in self._idle if worker in stale]
+            self._idle = [worker for worker in self._idle if worker not in stale]
+            self._workers.difference_update(idle)
+        for worker in idle:
+            worker.kill()
+
+    def shutdown(self) -> None:
+        """
+        Kill every worker, busy or not. Their pending calls return errors.
+        """
+        with self._condition:
+            self._generation += 1
+            workers, self._idle = list(self._workers), []
+            self._workers.clear()
+        for worker in workers:
+            worker.kill()
+
+    def _acquire(self, deadline: Optional[float], cancel_event: Optional[threading.Event]) -> Optional[_Worker]:
+        with self._condition:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive():
+                        self._busy += 1
+                        return worker
+                    self._workers.discard(worker)
+                    worker.close()
+                if self._busy < self.max_workers:
+                    self._busy += 1
+                    generation = self._generation
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                self._condition.wait(POLL_INTERVAL)
+
+        try:
+            worker = _Worker(self.memory_limit_mb, generation)
+        except OSError as e:
+            logging.error(f"Could not start a tool worker: {str(e)}")
+            with self._condition:
+                self._busy -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._workers.add(worker)
+        return worker
+
+    def _release(self, worker: _Worker) -> None:
+        with self._condition:
+            self._busy -= 1
+            retired = worker.retired or worker.generation != self._generation
+            if retired:
+                self._workers.discard(worker)
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+        if retired:
+            worker.kill()
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._condition:
+            self._workers.discard(worker)
+            self._busy -= 1
+            self.killed += 1
+            self._condition.notify()
+
+
+_shared: Dict[Tuple, ToolProcessPool] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_tool_pool(max_workers: int, memory_limit_mb: Optional[int]) -> ToolProcessPool:
+    """
+    The ToolProcessPool for a set of settings, created on first use, so every
+    assistant in the process (batch mode, the web app) shares its workers.
+    """
+    with _shared_lock:
+        key = (max_workers, memory_limit_mb)
+        pool = _shared.get(key)
+        if pool is None:
+            pool = ToolProcessPool(max_workers, memory_limit_mb)
+            _shared[key] = pool
+            # Don't leave workers (or what they started) behind when the process exits
+            atexit.register(pool.shutdown)
+        return pool
@@ -0,0 +1,214 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from core.prompt_cache import block_to_dict
+
+# Source type used in the journal for images stored as separate blob files
+BLOB_SOURCE = "journal_blob"
+# Line prefixes of records that discard everything written before them
+_BOUNDARY_PREFIXES = (b'{"type":"snapshot"', b'{"type":"reset"')
+
+
+class SessionJournal:
+    """
+    Append-only JSONL journal of one conversation.
+
+    Every message is appended as soon as it is added to the history, as one
+    `{"type":"message"}` line. Rewrites of the history (compaction) are stored
+    as a `{"type":"snapshot"}` line holding the new history, and a reset as a
+    `{"type":"reset"}` line, so the file is never modified in place.
+
+    SDK content blocks are stored in wire format. Base64 image data is written
+    once per distinct image to a blob file named by its sha256, and the
+    message only keeps a reference to it.
+    """
+
+    def __init__(self, directory: Path, session_id: Optional[str] = None):
+        self.directory = Path(directory)
+        self.session_id = session_id or self.new_session_id()
+        self.path = self.directory / f"{self.session_id}.jsonl"
+        self.blob_dir = self.directory / "blobs"
+        self._file = None
+        self._lock = threading.Lock()
+        self._known_blobs = set()
+        self._loaded_blobs: Dict[str, str] = {}
+
+    @staticmethod
+    def new_session_id() -> str:
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    @staticmethod
+    def latest_session(directory: Path) -> Optional[str]:
+        """
+        The id of the most recently written session in a directory.
+        """
+        try:
+            journals = [path for path in Path(directory).glob('*.jsonl') if path.is_file()]
+        except OSError:
+            return None
+        if not journals:
+            return None
+        return max(journals, key=lambda path: path.stat().st_mtime).stem
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    # Writing
+
+    def append(self, message: Dict[str, Any]) -> None:
+        self._write({"type": "message", "message": self._encode_message(message)})
+
+    def snapshot(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Record that the history was replaced by these messages.
+        """
+        self._write({"type": "snapshot", "messages": [self._encode_message(message) for message in messages]})
+
+    def reset(self) -> None:
+        self._write({"type": "reset"})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(',', ':'), default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logging.error(f"Could not write session journal {self.path}: {str(e)}")
+
+    def _encode_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        content = message.get('content')
+        if isinstance(content, list):
+            content = [self._encode_block(block) for block in content]
+        return dict(message, content=content)
+
+    def _encode_block(self, block: Any) -> Any:
+        block = block_to_dict(block)
+        if not isinstance(block, dict):
+            return block
+        if block.get('type') == 'image':
+            source = block.get('source') or {}
+            if source.get('type') == 'base64' and source.get('data'):
+                reference = self._store_blob(source['data'])
+                if reference is not None:
+                    return dict(block, source={
+                        "type": BLOB_SOURCE,
+                        "sha256": reference,
+                        "media_type": source.get('media_type')
+                    })
+        elif block.get('type') == 'tool_result' and isinstance(block.get('content'), list):
+            return dict(block, content=[self._encode_block(item) for item in block['content']])
+        return block
+
+    def _store_blob(self, data: str) -> Optional[str]:
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            return None
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest in self._known_blobs:
+            return digest
+
+        blob_path = self.blob_dir / digest
+        try:
+            if not blob_path.exists():
+                self.blob_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = blob_path.with_suffix('.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(raw)
+                os.replace(tmp_path, blob_path)
+        except OSError as e:
+            logging.error(f"Could not store image in session journal: {str(e)}")
+            return None
+        self._known_blobs.add(digest)
+        self._loaded_blobs[digest] = data
+        return digest
+
+    # Reading
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the messages of the current history out of the journal.
+
+        The file is read twice, line by line: a first pass only looks at line
+        prefixes to find the last snapshot or reset, and the second pass parses
+        the records after it. Lines before that point are never parsed.
+        """
+        if not self.path.exists():
+            return
+        start = 0
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.startswith(_BOUNDARY_PREFIXES):
+                    start = offset
+                offset += len(line)
+
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a partial last line behind
+                    logging.error(f"Skipping unreadable line {line_number} in {self.path}")
+                    continue
+                if record.get('type') == 'message':
+                    yield self._decode_message(record['message'])
+                elif record.get('type') == 'snapshot':
+                    for message in record.get('messages', []):
+                        yield self._decode_message(message)
+
+    def _decode_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        content = message.get('content')
+        if isinstance(content, list):
+            message['content'] = [self._decode_block(block) for block in content]
+        return message
+
+    def _decode_block(self, block: Any) -> Any:
+        if not isinstance(block, dict):
+            return block
+        if block.get('type') == 'image':
+            source = block.get('source') or {}
+            if source.get('type') == BLOB_SOURCE:
+                data = self._load_blob(source.get('sha256', ''))
+                if data is None:
+                    return {"type": "text", "text": "[Image from the resumed session is no longer available]"}
+                block['source'] = {"type": "base64", "media_type": source.get('media_type'), "data": data}
+        elif block.get('type') == 'tool_result' and isinstance(block.get('content'), list):
+            block['content'] = [self._decode_block(item) for item in block['content']]
+        return block
+
+    def _load_blob(self, digest: str) -> Optional[str]:
+        # Every reference to the same image shares one base64 string
+        data = self._loaded_blobs.get(digest)
+        if data is not None:
+            return data
+        try:
+            with open(self.blob_dir / digest, 'rb') as f:
+                data = base64.b64encode(f.read()).decode('ascii')
+        except OSError:
+            return None
+        self._loaded_blobs[digest] = data
+        self._known_blobs.add(digest)
+        return data
@@ -0,0 +1,206 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import ast
+import hashlib
+import json
+import logging
+import os
+
+# Class attributes copied from a tool class into its manifest entry
+TOOL_METADATA_FIELDS = (
+    'name', 'description', 'input_schema', 'read_only',
+    'isolated', 'time_limit', 'path_inputs', 'cache_ttl'
+)
+
+
+def file_digest(file_path: Path) -> str:
+    """
+    sha256 of a file's content.
+    """
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def module_changed(previous: Optional[Dict[str, Any]], file_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Compare a module file with a previously taken fingerprint
+    ({'mtime_ns', 'size', 'sha256'}). Returns None when the content is unchanged,
+    otherwise the file's new fingerprint. The content hash is only computed
+    when mtime or size differ.
+    """
+    stat = os.stat(file_path)
+    if previous and previous['mtime_ns'] == stat.st_mtime_ns and previous['size'] == stat.st_size:
+        return None
+
+    digest = file_digest(file_path)
+    if previous and previous['sha256'] == digest:
+        # Touched but not modified
+        previous['mtime_ns'] = stat.st_mtime_ns
+        previous['size'] = stat.st_size
+        return None
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest}
+
+
+def extract_tool_metadata(source: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Statically read the metadata of every BaseTool subclass in a module's source.
+
+    Only literal class attributes are understood. Returns None when a tool's
+    metadata can't be read this way, in which case the module has to be imported.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+
+    tools = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        base_names = {
+            base.id if isinstance(base, ast.Name) else getattr(base, 'attr', None)
+            for base in node.bases
+        }
+        if 'BaseTool' not in base_names:
+            continue
+
+        attributes: Dict[str, Any] = {}
+        for statement in node.body:
+            if (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                    and isinstance(statement.targets[0], ast.Name)):
+                target, value = statement.targets[0].id, statement.value
+            elif (isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name)
+                    and statement.value is not None):
+                target, value = statement.target.id, statement.value
+            else:
+                continue
+            if target not in TOOL_METADATA_FIELDS:
+                continue
+            try:
+                attributes[target] = ast.literal_eval(value)
+            except ValueError:
+                return None
+
+        if not all(field in attributes for field in ('name', 'description', 'input_schema')):
+            return None
+
+        # BaseTool's defaults
+        attributes.setdefault('read_only', False)
+        attributes.setdefault('isolated', True)
+        attributes.setdefault('time_limit', None)
+        attributes.setdefault('path_inputs', ())
+        attributes.setdefault('cache_ttl', None)
+        attributes['class_name'] = node.name
+        tools.append(attributes)
+
+    return tools
+
+
+class ToolManifest:
+    """
+    On-disk cache of tool metadata (name, description, input_schema and the
+    execution settings of BaseTool) for every module in the tools directory.
+
+    Entries are keyed by the module file's mtime and size, with a content hash
+    as fallback when only the mtime changed. Startup reads this file instead of
+    importing the tool modules; a module is only imported when one of its tools
+    is executed for the first time, and not at all by this process when it
+    runs in a tool worker.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self._entries = data.get('modules', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable tool manifest {self.path}: {str(e)}")
+
+    def save(self) -> None:
+        """
+        Write the manifest back to disk if anything changed.
+        """
+        if not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'modules': self._entries}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logging.error(f"Could not write tool manifest {self.path}: {str(e)}")
+
+    def entry_for(self, module_name: str, file_path: Path) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry for a module, refreshing it from the source
+        file when it changed. Returns None if the module must be imported to
+        learn its tools.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        cached = self._entries.get(module_name)
+        if cached and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+            return cached
+
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if cached and cached['sha256'] == digest:
+            # Touched but unchanged: keep the metadata, remember the new mtime
+            cached['mtime_ns'] = stat.st_mtime_ns
+            cached['size'] = stat.st_size
+            self._dirty = True
+            return cached
+
+        tools = extract_tool_metadata(raw.decode('utf-8', errors='replace'))
+        if tools is None:
+            return None
+        return self._store(module_name, stat, digest, tools)
+
+    def record(self, module_name: str, file_path: Path, tools: List[Dict[str, Any]]) -> None:
+        """
+        Store metadata collected by importing a module.
+        """
+        try:
+            stat = os.stat(file_path)
+            digest = file_digest(file_path)
+        except OSError:
+            return
+        self._store(module_name, stat, digest, tools)
+
+    def prune(self, module_names) -> None:
+        """
+        Drop entries for modules that no longer exist.
+        """
+        for module_name in set(self._entries) - set(module_names):
+            del self._entries[module_name]
+            self._dirty = True
+
+    def _store(self, module_name: str, stat: os.stat_result, digest: str,
+               tools: List[Dict[str, Any]]) -> Dict[str, Any]:
+        entry = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': digest,
+            'tools': tools
+        }
+        self._entries[module_name] = entry
+        self._dirty = True
+        return entry
@@ -0,0 +1,162 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from core.compaction import is_turn_start
+from core.prompt_cache import block_to_dict
+
+
+class Message(Mapping):
+    """
+    One conversation message, stored in wire format.
+
+    SDK content blocks are converted to plain dicts when the message is
+    created, so the message can be sent, journaled and estimated without
+    serializing SDK objects again. It reads like the message dict it was
+    made from (message['role'], message.get('content'), dict(message)) and,
+    like the history dicts before it, is never modified: code that rewrites
+    history replaces messages.
+    """
+
+    __slots__ = ('role', 'content', 'wire')
+
+    def __init__(self, message: Mapping):
+        content = message.get('content')
+        if isinstance(content, (list, tuple)):
+            content = [block_to_dict(block) for block in content]
+        self.wire: Dict[str, Any] = dict(message, content=content)
+        self.role: Optional[str] = self.wire.get('role')
+        self.content: Union[str, List[Dict[str, Any]], None] = content
+
+    def __getitem__(self, key: str) -> Any:
+        return self.wire[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.wire)
+
+    def __len__(self) -> int:
+        return len(self.wire)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.wire.get(key, default)
+
+    def blocks(self) -> List[Dict[str, Any]]:
+        return self.content if isinstance(self.content, list) else []
+
+    def __repr__(self) -> str:
+        return f"Message({self.wire!r})"
+
+
+def create_message(client, stream: bool = False, timeout: Optional[float] = None, **params: Any):
+    """
+    Send a Messages API request whose params (messages, tools, system) are
+    already in wire format. Returns a Message, or the event stream if stream.
+
+    Same request as client.messages.create(**params), but the params go out
+    as the JSON body through client.post, the SDK's documented call for raw
+    requests. messages.create first walks every message block and tool
+    definition against its TypedDicts (maybe_transform), which costs about
+    0.4s per request at 400 messages and would otherwise dominate the turn.
+    The client's headers, timeout and response parsing still apply.
+    """
+    from anthropic import Stream
+    from anthropic.types import Message as APIMessage, RawMessageStreamEvent
+
+    body = dict(params, stream=True) if stream else params
+    return client.post(
+        "/v1/messages",
+        body=body,
+        cast_to=APIMessage,
+        options={} if timeout is None else {"timeout": timeout},
+        stream=stream,
+        stream_cls=Stream[RawMessageStreamEvent]
+    )
+
+
+class MessageStore:
+    """
+    The conversation history.
+
+    Messages are converted to Message records once, when they are added, and
+    their wire dicts are kept in a parallel list, so building a request is a
+    list copy instead of a walk over every block. Indexes are updated on
+    append: the last tool used, the tools called in each user turn and the
+    positions of image blocks.
+
+    Indexing and iteration give Message records; a slice is a plain list of
+    them. A store built from existing records (a compacted history, a resumed
+    one) reuses them without converting anything again.
+    """
+
+    def __init__(self, messages: Iterable[Any] = ()):
+        self._messages: List[Message] = []
+        self._wire: List[Dict[str, Any]] = []
+        self.last_tool_name: Optional[str] = None
+        self._turn_tools: List[List[str]] = []
+        self._images: List[Tuple[int, int]] = []
+        self.extend(messages)
+
+    def append(self, message: Any) -> Message:
+        record = message if isinstance(message, Message) else Message(message)
+        index = len(self._messages)
+        self._messages.append(record)
+        self._wire.append(record.wire)
+
+        if is_turn_start(record) or not self._turn_tools:
+            self._turn_tools.append([])
+        for position, block in enumerate(record.blocks()):
+            block_type = block.get('type')
+            if block_type == 'tool_use':
+                self.last_tool_name = block.get('name')
+                self._turn_tools[-1].append(self.last_tool_name)
+            elif block_type == 'image' or (
+                    block_type == 'tool_result' and isinstance(block.get('content'), list)
+                    and any(isinstance(item, dict) and item.get('type') == 'image'
+                            for item in block['content'])):
+                self._images.append((index, position))
+        return record
+
+    def extend(self, messages: Iterable[Any]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def wire(self) -> List[Dict[str, Any]]:
+        """
+        The messages in wire format, ready to send. The list is a copy; the
+        dicts in it are shared and must not be modified.
+        """
+        return list(self._wire)
+
+    def tool_calls_per_turn(self) -> List[int]:
+        """
+        The number of tool calls in each user turn, oldest first.
+        """
+        return [len(names) for names in self._turn_tools]
+
+    def tools_used(self, turns: int = 1) -> List[str]:
+        """
+        Names of the tools called in the last `turns` user turns, in order of
+        first use.
+        """
+        names: Dict[str, None] = {}
+        for turn in self._turn_tools[-turns:] if turns > 0 else []:
+            names.update(dict.fromkeys(turn))
+        return list(names)
+
+    def image_blocks(self) -> List[Dict[str, Any]]:
+        """
+        The content blocks holding images (image blocks and tool results
+        containing images), oldest first.
+        """
+        return [self._messages[index].content[position] for index, position in self._images]
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return f"MessageStore({len(self._messages)} messages)"
@@ -0,0 +1,179 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Functions listed per sort order in the cProfile report
+TOP_FUNCTIONS = 40
+# Allocation sites listed in the tracemalloc report
+TOP_ALLOCATIONS = 30
+# Frames recorded per allocation; enough to see the caller of a hot helper
+TRACEMALLOC_FRAMES = 8
+
+
+class SessionProfiler:
+    """
+    On-demand cProfile and tracemalloc profiling of chat turns.
+
+    Between start() and stop(), every turn run inside profile_turn() is
+    profiled; reports are written by dump() (and by stop()). Memory is
+    compared against a snapshot taken at start(), so the allocation report
+    shows what grew during the profiled turns, along with the growth of the
+    conversation history.
+
+    cProfile only sees the thread that runs the turn: tool calls executed on
+    the scheduler's worker threads appear as time spent waiting for them.
+    Only one turn is profiled at a time; concurrent turns (web app) run
+    unprofiled.
+    """
+
+    def __init__(self, output_dir: Path, history_size: Optional[Callable[[], Tuple[int, int]]] = None):
+        self.output_dir = Path(output_dir)
+        self.history_size = history_size
+        self._profile: Optional[cProfile.Profile] = None
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+        self._history_at_start: Optional[Tuple[int, int]] = None
+        self._started_at = 0.0
+        self._turns = 0
+        self._lock = threading.Lock()
+        self._turn_lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> str:
+        with self._lock:
+            if self._profile is not None:
+                return "Profiling is already on."
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._baseline = tracemalloc.take_snapshot()
+            self._history_at_start = self.history_size() if self.history_size else None
+            self._started_at = time.time()
+            self._turns = 0
+            self._profile = cProfile.Profile()
+        return "Profiling on: chat turns are profiled until 'profile off'."
+
+    def stop(self) -> str:
+        """
+        Stop profiling and write the final reports.
+        """
+        with self._turn_lock:
+            with self._lock:
+                if self._profile is None:
+                    return "Profiling is not on."
+                paths = self._write_reports()
+                self._profile = None
+                self._baseline = None
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+        return "Profiling off. Reports written to:\n" + "\n".join(str(path) for path in paths)
+
+    def dump(self) -> str:
+        """
+        Write reports for the turns profiled so far and keep profiling.
+        """
+        with self._turn_lock:
+            with self._lock:
+                if self._profile is None:
+                    return "Profiling is not on. Use 'profile on' first."
+                paths = self._write_reports()
+        return "Reports written to:\n" + "\n".join(str(path) for path in paths)
+
+    @contextmanager
+    def profile_turn(self) -> Iterator[None]:
+        """
+        Profile the enclosed chat turn if profiling is on.
+        """
+        if self._profile is None or not self._turn_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profile = self._profile
+            if profile is None:
+                yield
+                return
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._turns += 1
+        finally:
+            self._turn_lock.release()
+
+    def _write_reports(self) -> List[Path]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        raw_path = self.output_dir / f"profile-{stamp}.prof"
+        cpu_path = self.output_dir / f"profile-{stamp}.txt"
+        memory_path = self.output_dir / f"memory-{stamp}.txt"
+
+        header = (f"{self._turns} chat turns profiled since "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started_at))}\n")
+
+        # Snapshot memory before building the CPU report allocates its own data
+        memory_report = self._memory_report()
+
+        self._profile.dump_stats(str(raw_path))
+        with open(cpu_path, 'w', encoding='utf-8') as f:
+            f.write(header)
+            f.write(f"Raw profile for snakeviz/pstats: {raw_path.name}\n")
+            if self._turns:
+                for sort_key in ('cumulative', 'tottime'):
+                    buffer = io.StringIO()
+                    stats = pstats.Stats(self._profile, stream=buffer)
+                    stats.strip_dirs().sort_stats(sort_key).print_stats(TOP_FUNCTIONS)
+                    f.write(f"\n=== Top {TOP_FUNCTIONS} functions by {sort_key} time ===\n")
+                    f.write(buffer.getvalue())
+
+        with open(memory_path, 'w', encoding='utf-8') as f:
+            f.write(header)
+            f.write(memory_report)
+
+        return [cpu_path, memory_path, raw_path]
+
+    def _memory_report(self) -> str:
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current / 1024 / 1024:.1f} MB current, {peak / 1024 / 1024:.1f} MB peak"]
+
+        if self.history_size and self._history_at_start is not None:
+            messages, tokens = self.history_size()
+            start_messages, start_tokens = self._history_at_start
+            lines.append(
+                f"Conversation history: {start_messages} -> {messages} messages, "
+                f"~{start_tokens:,} -> ~{tokens:,} tokens"
+            )
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        lines.append(f"\n=== Top {TOP_ALLOCATIONS} allocation sites grown since 'profile on' ===")
+        for diff in snapshot.compare_to(self._baseline, 'lineno')[:TOP_ALLOCATIONS]:
+            lines.append(
+                f"{diff.size_diff / 1024:+10.1f} KB {diff.count_diff:+8d} blocks  {diff.traceback[0]}"
+            )
+
+        lines.append(f"\n=== Top {TOP_ALLOCATIONS} live allocation sites by size ===")
+        for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            lines.append(
+                f"{statistic.size / 1024:10.1f} KB {statistic.count:8d} blocks  {statistic.traceback[0]}"
+            )
+
+        lines.append("\n=== Largest allocation call stacks ===")
+        for statistic in snapshot.statistics('traceback')[:5]:
+            lines.append(f"{statistic.size / 1024:.1f} KB in {statistic.count} blocks")
+            lines.extend(f"    {line}" for line in statistic.traceback.format())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+from typing import Any, Dict, List
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def block_to_dict(block: Any) -> Dict[str, Any]:
+    """
+    Convert an SDK content block (or a dict) to a plain wire-format dict.
+    """
+    if isinstance(block, dict):
+        return block
+    to_dict = getattr(block, 'to_dict', None)
+    if to_dict is not None:
+        return to_dict()
+    return block.model_dump(exclude_none=True)
+
+
+def cached_system(text: str) -> List[Dict[str, Any]]:
+    """
+    The system prompt as a single text block carrying a cache breakpoint.
+    """
+    return [{"type": "text", "text": text, "cache_control": EPHEMERAL}]
+
+
+def cached_tools(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    A copy of the tool definitions with a cache breakpoint on the last one,
+    which caches the whole tools block.
+    """
+    if not tools:
+        return tools
+    return tools[:-1] + [dict(tools[-1], cache_control=EPHEMERAL)]
+
+
+def with_rolling_breakpoint(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    A copy of the conversation with a cache breakpoint on the last block of
+    the last message. The history itself is not modified, so only the newest
+    turn carries the breakpoint and the next request reads the prefix from cache.
+    """
+    if not messages:
+        return messages
+
+    last = messages[-1]
+    content = last.get('content')
+    if isinstance(content, str):
+        if not content:
+            return messages
+        blocks = [{"type": "text", "text": content}]
+    elif isinstance(content, list) and content:
+        blocks = list(content)
+    else:
+        return messages
+
+    last_block = block_to_dict(blocks[-1])
+    if last_block.get('type') in ('thinking', 'redacted_thinking'):
+        return messages
+    if last_block.get('type') == 'text' and not last_block.get('text'):
+        return messages
+    blocks[-1] = dict(last_block, cache_control=EPHEMERAL)
+
+    return messages[:-1] + [dict(last, content=blocks)]
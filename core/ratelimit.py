@@ -0,0 +1,259 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+import itertools
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits, server errors and overload
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+# Error types in API error bodies worth retrying. An error sent as an event of
+# a stream that has started arrives with the stream's status, 200, so only its
+# type tells it is transient.
+RETRYABLE_ERROR_TYPES = {'overloaded_error', 'api_error', 'rate_limit_error'}
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding up to `per_minute` units.
+    Not thread-safe on its own; RateLimiter serializes access.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` units are available (0 if they are now).
+        Requests larger than the bucket only wait for a full bucket.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float, now: float) -> None:
+        """
+        Correct an earlier take() once the real amount is known. Negative
+        amounts refund units; the level may go below zero, which makes later
+        callers wait.
+        """
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Client-side limiter for requests and tokens per minute, shared by every
+    caller using the same API key in this process.
+
+    Callers are served strictly in arrival order: each acquire() takes a
+    ticket, and only the oldest waiting ticket may take capacity, so a large
+    request can't be starved by a stream of small ones. A 429 reported by any
+    caller pauses the whole limiter until its retry-after has passed.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._condition = threading.Condition()
+        self._tickets = itertools.count()
+        self._serving = 0
+        self._done = set()
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> float:
+        """
+        Block until a request of about `tokens` tokens may be sent.
+        deadline is a time.monotonic() value; TimeoutError is raised if the
+        wait would outlast it. Returns the time spent waiting.
+        """
+        started = time.monotonic()
+        with self._condition:
+            ticket = next(self._tickets)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if ticket == self._serving:
+                        wait = max(
+                            self._paused_until - now,
+                            self.requests.wait_time(1, now) if self.requests else 0.0,
+                            self.tokens.wait_time(tokens, now) if self.tokens else 0.0
+                        )
+                        if wait <= 0:
+                            if self.requests:
+                                self.requests.take(1, now)
+                            if self.tokens:
+                                self.tokens.take(tokens, now)
+                            return now - started
+                    else:
+                        # Woken by notify_all when the ticket ahead of us is served
+                        wait = None
+
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            raise TimeoutError("Rate limit wait would exceed the deadline")
+                        wait = remaining if wait is None else wait
+                    self._condition.wait(wait)
+            finally:
+                # Served or gave up (timeout, interrupt): later tickets must not wait for us
+                self._done.add(ticket)
+                while self._serving in self._done:
+                    self._done.discard(self._serving)
+                    self._serving += 1
+                self._condition.notify_all()
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Charge the difference between the tokens acquired for a request and
+        the tokens it actually used.
+        """
+        if self.tokens is None:
+            return
+        with self._condition:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+            self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every caller for `seconds`, e.g. after the API returned a 429.
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+
+_shared: Dict[Tuple, RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_limiter(key: str, requests_per_minute: Optional[float],
+                   tokens_per_minute: Optional[float]) -> RateLimiter:
+    """
+    The RateLimiter for an API key (or any other key), created on first use.
+    """
+    with _shared_lock:
+        limiter_key = (key, requests_per_minute, tokens_per_minute)
+        limiter = _shared.get(limiter_key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _shared[limiter_key] = limiter
+        return limiter
+
+
+def error_type(error: Exception) -> Optional[str]:
+    """
+    The type of an API error from its body ({"error": {"type": ...}}), e.g.
+    "overloaded_error", or None.
+    """
+    body = getattr(error, 'body', None)
+    details = body.get('error') if isinstance(body, dict) else None
+    if isinstance(details, dict) and isinstance(details.get('type'), str):
+        return details['type']
+    return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429 or error_type(error) == 'rate_limit_error'
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether an API error is transient: rate limits, overload, server errors
+    and dropped connections, whether reported by the HTTP status or, for
+    errors in the middle of a stream, by the error type. Timeouts are not
+    retried; they mean the caller's time budget is used up.
+    """
+    if error_type(error) in RETRYABLE_ERROR_TYPES:
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ == 'APIConnectionError'
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    The delay in seconds the server asked for in the retry-after(-ms) headers.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class RetryScheduler:
+    """
+    Sends requests through a RateLimiter and retries transient failures.
+
+    The delay before a retry is the server's retry-after when given, otherwise
+    exponential backoff with full jitter. Rate-limit responses also pause the
+    shared limiter, so other callers back off instead of piling on.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.limiter = limiter
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(0.0, delay)
+
+    def call(self, send: Callable[[], Any], tokens: int = 0, deadline: Optional[float] = None,
+             on_retry: Optional[Callable[[int, float, Exception], None]] = None) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Call send() until it succeeds, fails permanently or runs out of retries.
+        Returns (result, {'retries', 'wait'}) where wait is the total time spent
+        queued in the limiter and backing off.
+        """
+        stats = {'retries': 0, 'wait': 0.0}
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                stats['wait'] += self.limiter.acquire(tokens, deadline=deadline)
+            try:
+                return send(), stats
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = self.backoff(attempt, error)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                if self.limiter is not None:
+                    if is_rate_limited(error):
+                        self.limiter.pause(delay)
+                    # The failed request used no tokens
+                    self.limiter.settle(tokens, 0)
+
+                attempt += 1
+                stats['retries'] = attempt
+                if on_retry:
+                    on_retry(attempt, delay, error)
+                time.sleep(delay)
+                stats['wait'] += delay
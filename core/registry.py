@@ -0,0 +1,142 @@
+from typing import Any, Dict, List, Optional
+import importlib
+import threading
+
+from tools.base import BaseTool
+
+
+class ToolRegistry:
+    """
+    Maps tool names to tool instances.
+
+    Tools are registered either as live instances or as metadata specs taken
+    from the tool manifest. A spec is turned into an instance - importing its
+    module - the first time the tool is looked up, and the instance is then
+    reused for every later call together with any clients or sessions it holds.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, Dict[str, Any]] = {}
+        self._instances: Dict[str, BaseTool] = {}
+        self._lock = threading.RLock()
+
+    def register(self, tool: BaseTool, module_name: Optional[str] = None) -> None:
+        """
+        Register a tool instance under its name, replacing any previous one.
+        """
+        with self._lock:
+            self._specs[tool.name] = {
+                'name': tool.name,
+                'description': tool.description,
+                'input_schema': tool.input_schema,
+                'read_only': bool(getattr(tool, 'read_only', False)),
+                'isolated': bool(getattr(tool, 'isolated', True)),
+                'time_limit': getattr(tool, 'time_limit', None),
+                'path_inputs': tuple(getattr(tool, 'path_inputs', ()) or ()),
+                'cache_ttl': getattr(tool, 'cache_ttl', None),
+                'module': module_name,
+                'class_name': type(tool).__name__
+            }
+            self._instances[tool.name] = tool
+
+    def register_spec(self, spec: Dict[str, Any], module_name: str) -> None:
+        """
+        Register a tool by its metadata only; the module is imported lazily.
+        """
+        with self._lock:
+            self._specs[spec['name']] = dict(spec, module=module_name)
+            self._instances.pop(spec['name'], None)
+
+    def get(self, name: str) -> Optional[BaseTool]:
+        """
+        Return the instance for a tool, importing and instantiating it on first use.
+        Returns None for unknown tools; import errors are raised to the caller.
+        """
+        tool = self._instances.get(name)
+        if tool is not None:
+            return tool
+
+        with self._lock:
+            tool = self._instances.get(name)
+            if tool is not None:
+                return tool
+            spec = self._specs.get(name)
+            if spec is None or not spec.get('module'):
+                return None
+
+            module = importlib.import_module(spec['module'])
+            tool_class = getattr(module, spec['class_name'])
+            tool = tool_class()
+            self._instances[name] = tool
+            return tool
+
+    def specs_for_module(self, module_name: str) -> List[Dict[str, Any]]:
+        """
+        Metadata of the tools registered from a module, without the module name.
+        """
+        return [
+            {key: value for key, value in spec.items() if key != 'module'}
+            for spec in list(self._specs.values())
+            if spec.get('module') == module_name
+        ]
+
+    def spec(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Metadata of a tool, module name included, without importing it.
+        """
+        spec = self._specs.get(name)
+        return dict(spec) if spec else None
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def module_of(self, name: str) -> Optional[str]:
+        spec = self._specs.get(name)
+        return spec.get('module') if spec else None
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._specs.pop(name, None)
+            self._instances.pop(name, None)
+
+    def remove_module(self, module_name: str) -> List[str]:
+        """
+        Unregister every tool that came from a module. Returns their names.
+        """
+        with self._lock:
+            names = [name for name, spec in self._specs.items() if spec.get('module') == module_name]
+            for name in names:
+                self._specs.pop(name, None)
+                self._instances.pop(name, None)
+            return names
+
+    def clear(self) -> None:
+        with self._lock:
+            self._specs.clear()
+            self._instances.clear()
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def is_read_only(self, name: str) -> bool:
+        spec = self._specs.get(name)
+        return bool(spec and spec.get('read_only'))
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """
+        Tool definitions in the format expected by the Messages API.
+        """
+        return [
+            {
+                "name": spec['name'],
+                "description": spec['description'],
+                "input_schema": spec['input_schema']
+            }
+            for spec in list(self._specs.values())
+        ]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
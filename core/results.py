@@ -0,0 +1,188 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import math
+import threading
+import uuid
+
+from core.context import CHARS_PER_TOKEN, estimate_text_tokens
+from tools.base import BaseTool
+
+# Share of a truncated preview taken from the start of the result; the rest is the tail
+PREVIEW_HEAD_SHARE = 0.75
+# Characters shown on each side of a search match within a long line
+MATCH_CONTEXT_CHARS = 150
+
+
+class ResultStore:
+    """
+    Keeps the full text of tool results that exceeded the per-result token
+    budget, so only a head/tail preview has to go into the conversation.
+
+    Each stored result gets a short handle the model can pass to the pager
+    tool to read it page by page. The store is bounded in total size; the
+    least recently used results are dropped first.
+    """
+
+    def __init__(self, token_budget: int = 8000, page_tokens: int = 4000,
+                 max_bytes: int = 50 * 1024 * 1024):
+        self.token_budget = token_budget
+        self.page_chars = max(1, int(page_tokens * CHARS_PER_TOKEN))
+        self.max_bytes = max_bytes
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def budget(self, tool_name: str, result: Any) -> Any:
+        """
+        Return the result to put into the conversation: unchanged when it is
+        within the token budget (or not text), otherwise a preview that names
+        the handle under which the full text was stored.
+        """
+        if not isinstance(result, str) or not self.token_budget:
+            return result
+        tokens = estimate_text_tokens(result)
+        if tokens <= self.token_budget:
+            return result
+
+        handle = self.put(tool_name, result)
+        pages = self.page_count(handle)
+        preview_chars = int(self.token_budget * CHARS_PER_TOKEN)
+        head_chars = int(preview_chars * PREVIEW_HEAD_SHARE)
+        tail_chars = preview_chars - head_chars
+
+        return (
+            f"{result[:head_chars]}\n\n"
+            f"[... truncated: the full result is {len(result):,} characters (~{tokens:,} tokens). "
+            f"It is stored as handle '{handle}' with {pages} pages of {self.page_chars:,} characters. "
+            f"Use the {ResultPagerTool.name} tool with this handle to read a page, "
+            "or pass a pattern to find the lines you need ...]\n\n"
+            f"{result[-tail_chars:] if tail_chars else ''}"
+        )
+
+    def put(self, tool_name: str, text: str) -> str:
+        """
+        Store a result and return its handle.
+        """
+        handle = f"res-{uuid.uuid4().hex[:8]}"
+        size = len(text)
+        with self._lock:
+            self._results[handle] = {'tool': tool_name, 'text': text}
+            self._size += size
+            while self._size > self.max_bytes and len(self._results) > 1:
+                _, dropped = self._results.popitem(last=False)
+                self._size -= len(dropped['text'])
+        return handle
+
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._results.get(handle)
+            if entry is not None:
+                self._results.move_to_end(handle)
+            return entry
+
+    def page_count(self, handle: str) -> int:
+        entry = self._results.get(handle)
+        if entry is None:
+            return 0
+        return max(1, math.ceil(len(entry['text']) / self.page_chars))
+
+    def page(self, handle: str, page: int = 1) -> str:
+        """
+        One page (1-based) of a stored result, with a header saying where it is.
+        """
+        entry = self.get(handle)
+        if entry is None:
+            return f"Error: unknown or expired result handle '{handle}'. Run the tool again."
+
+        pages = self.page_count(handle)
+        if page < 1 or page > pages:
+            return f"Error: page {page} is out of range; handle '{handle}' has {pages} pages."
+
+        start = (page - 1) * self.page_chars
+        text = entry['text'][start:start + self.page_chars]
+        return f"[{entry['tool']} result '{handle}', page {page} of {pages}]\n{text}"
+
+    def search(self, handle: str, pattern: str, max_matches: int = 200) -> str:
+        """
+        Lines of a stored result containing pattern (case-insensitive), with
+        line numbers and the page they are on.
+        """
+        entry = self.get(handle)
+        if entry is None:
+            return f"Error: unknown or expired result handle '{handle}'. Run the tool again."
+
+        needle = pattern.lower()
+        matches = []
+        offset = 0
+        for line_number, line in enumerate(entry['text'].splitlines(keepends=True), start=1):
+            position = line.lower().find(needle)
+            if position != -1:
+                start = max(0, position - MATCH_CONTEXT_CHARS)
+                end = position + len(needle) + MATCH_CONTEXT_CHARS
+                snippet = ("..." if start else "") + line[start:end].rstrip() + ("..." if end < len(line.rstrip()) else "")
+                page = (offset + position) // self.page_chars + 1
+                matches.append(f"{line_number} (page {page}): {snippet}")
+                if len(matches) >= max_matches:
+                    matches.append(f"[stopped after {max_matches} matches]")
+                    break
+            offset += len(line)
+
+        if not matches:
+            return f"No lines in '{handle}' contain '{pattern}'."
+        result = "\n".join(matches)
+        if len(result) > self.page_chars:
+            result = result[:self.page_chars] + "\n[matches truncated, use a narrower pattern]"
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self._size = 0
+
+
+class ResultPagerTool(BaseTool):
+    """
+    Built-in tool that reads tool results stored in a ResultStore.
+    """
+
+    name = "resultpagertool"
+    read_only = True
+    description = '''
+    Reads more of a tool result that was too large to return in full.
+    Large results are truncated to a preview that names a handle (e.g. 'res-1a2b3c4d')
+    and the number of pages. Pass the handle and a page number to read that page,
+    or a pattern to list the matching lines and the pages they are on.
+    Only fetch the pages you actually need.
+    '''
+    input_schema = {
+        "type": "object",
+        "properties": {
+            "handle": {
+                "type": "string",
+                "description": "Result handle given in the truncated preview"
+            },
+            "page": {
+                "type": "integer",
+                "description": "1-based page number to read (default 1)"
+            },
+            "pattern": {
+                "type": "string",
+                "description": "Optional case-insensitive text to search for instead of reading a page"
+            }
+        },
+        "required": ["handle"]
+    }
+
+    def __init__(self, store: ResultStore):
+        self.store = store
+
+    def execute(self, **kwargs) -> str:
+        handle = kwargs.get('handle', '')
+        pattern = kwargs.get('pattern')
+        if pattern:
+            return self.store.search(handle, pattern)
+        try:
+            page = int(kwargs.get('page', 1) or 1)
+        except (TypeError, ValueError):
+            return "Error: page must be an integer"
+        return self.store.page(handle, page)
@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+
+# USD per million tokens (input, output) by model name prefix
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-sonnet": (3.0, 15.0),
+    "claude-3-haiku": (0.25, 1.25),
+}
+# Prompt cache writes and reads relative to the input price
+CACHE_WRITE_FACTOR = 1.25
+CACHE_READ_FACTOR = 0.1
+
+# Kinds of step a route is chosen for
+FIRST_STEP = "first_step"
+TOOL_ROUND = "tool_round"
+AFTER_ERROR = "after_error"
+FINAL_ANSWER = "final_answer"
+DEFAULT_ROUTES = {
+    FIRST_STEP: "main",
+    TOOL_ROUND: "fast",
+    AFTER_ERROR: "main",
+    FINAL_ANSWER: "main",
+}
+
+
+def estimate_cost(model: str, usage: Any, prices: Optional[Dict[str, Tuple[float, float]]] = None) -> Optional[float]:
+    """
+    The price in USD of a request from its usage, or None for a model
+    without a known price.
+    """
+    prices = MODEL_PRICES if prices is None else prices
+    matches = [prefix for prefix in prices if model and model.startswith(prefix)]
+    if not matches or usage is None:
+        return None
+    input_price, output_price = prices[max(matches, key=len)]
+    input_tokens = (
+        (getattr(usage, 'input_tokens', 0) or 0)
+        + (getattr(usage, 'cache_creation_input_tokens', 0) or 0) * CACHE_WRITE_FACTOR
+        + (getattr(usage, 'cache_read_input_tokens', 0) or 0) * CACHE_READ_FACTOR
+    )
+    output_tokens = getattr(usage, 'output_tokens', 0) or 0
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class Route:
+    """
+    The model and output limit used for one request.
+    provisional routes are redone by the final_answer route if the response
+    turns out to be the final answer (or is cut off) rather than a tool call.
+    """
+    name: str
+    model: str
+    max_tokens: Optional[int] = None
+    provisional: bool = False
+
+
+class ModelRouter:
+    """
+    Picks the model of each step of an agent loop.
+
+    Every step is one of first_step (the request that reads the user's
+    message), tool_round (after a tool round whose calls succeeded) or
+    after_error (after a tool round with an error result), and `routes` maps
+    each kind to "main" (the assistant's model) or "fast" (fast_model, with
+    output capped at fast_max_tokens if set). Picking tools from fresh
+    results is what most steps of a chain do, and a smaller model does it
+    faster and for a fraction of the price.
+
+    The final answer cannot be known before it is written, so fast steps are
+    provisional: when a fast step answers instead of calling a tool, or runs
+    into its output limit, the response is dropped and the step is redone
+    with the final_answer route. The dropped response costs a short fast
+    request; the fast model also has its own prompt cache, so the redone
+    step reads less of the prompt from cache.
+
+    Requests, latency and cost are counted per route.
+    """
+
+    def __init__(self, fast_model: str, fast_max_tokens: Optional[int] = None,
+                 routes: Optional[Dict[str, str]] = None):
+        self.fast_model = fast_model
+        self.fast_max_tokens = fast_max_tokens
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, main_model: str, kind: str) -> Route:
+        name = self.routes.get(kind, "main")
+        if name != "fast" or not self.fast_model or self.fast_model == main_model:
+            return Route("main", main_model)
+        escalate = self.routes.get(FINAL_ANSWER, "main") != "fast"
+        return Route("fast", self.fast_model, self.fast_max_tokens, provisional=escalate)
+
+    def needs_escalation(self, route: Route, response: Any) -> bool:
+        """
+        True if a provisional response has to be redone: it is not a tool
+        call, so it would have been the final answer or was cut off.
+        """
+        return route.provisional and getattr(response, 'stop_reason', None) != "tool_use"
+
+    def final_route(self, main_model: str) -> Route:
+        route = self.choose(main_model, FINAL_ANSWER)
+        # Redoing a step with another provisional route would not end
+        route.provisional = False
+        return route
+
+    def record(self, route: Route, latency: float, cost: Optional[float], escalated: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(route.name, {
+                "route": route.name, "model": route.model, "requests": 0,
+                "escalated": 0, "latency": 0.0, "cost": 0.0
+            })
+            stats["model"] = route.model
+            stats["requests"] += 1
+            stats["escalated"] += int(escalated)
+            stats["latency"] += latency
+            stats["cost"] += cost or 0.0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        One row per route used: requests, escalated requests, total latency
+        in seconds and total cost in USD.
+        """
+        with self._lock:
+            return [dict(stats) for stats in self._stats.values()]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,176 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+import contextvars
+import threading
+import time
+
+# How often a waiting run() checks the cancel event
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class ToolScheduler:
+    """
+    Runs the tool_use blocks of a single assistant turn on a bounded thread pool.
+
+    Consecutive read-only tool calls are executed concurrently. Any other call
+    acts as a barrier: it runs on its own once everything before it has finished,
+    so tools with side effects still see the order the model asked for.
+    Results are always returned in the order of the given tool_use blocks.
+
+    Read-only calls can also be started early with speculate(), while the
+    response that contains them is still streaming; run() then picks up their
+    futures by tool_use id instead of executing the calls again.
+
+    time_limit(name) gives the limit a tool declares for itself, if any; a
+    call to such a tool is waited for until that limit even when the round's
+    timeout is shorter.
+    """
+
+    def __init__(self, execute: Callable[[Any], Any], is_read_only: Callable[[str], bool],
+                 max_workers: int = 4, cancel_event: Optional[threading.Event] = None,
+                 time_limit: Optional[Callable[[str], Optional[float]]] = None):
+        self.execute = execute
+        self.is_read_only = is_read_only
+        self.time_limit = time_limit
+        self.cancel_event = cancel_event
+        self.max_workers = max(1, int(max_workers))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._speculative: Dict[str, Future] = {}
+        # Indexes of the calls of the last run() answered by speculative executions
+        self.last_speculative: List[int] = []
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="ce3-tool"
+                )
+            return self._executor
+
+    def run(self, tool_uses: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Execute all tool_use blocks and return their results in input order.
+
+        With a timeout (seconds for the whole round), calls still running when
+        it expires (or when their tool's own time_limit does, if that is later)
+        get an error result instead; their threads are left to finish in the
+        background. Once cancel_event is set, calls that are still
+        running or not started yet get an error result as well.
+        """
+        results: List[Any] = [None] * len(tool_uses)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        speculative = self._take_speculative(tool_uses)
+        self.last_speculative = sorted(speculative)
+
+        for batch in self._batches(tool_uses):
+            if self._cancelled():
+                for index in batch:
+                    results[index] = f"Error: tool '{tool_uses[index].name}' was cancelled"
+                continue
+            started_early = any(index in speculative for index in batch)
+            if deadline is None and not started_early and (len(batch) == 1 or self.max_workers == 1):
+                for index in batch:
+                    results[index] = self._run_one(tool_uses[index])
+                continue
+
+            futures = {
+                index: speculative.get(index) or self._submit(tool_uses[index])
+                for index in batch
+            }
+            for index, future in futures.items():
+                results[index] = self._wait(future, tool_uses[index], self._call_deadline(tool_uses[index], deadline))
+
+        return results
+
+    def speculate(self, tool_use: Any, execute: Optional[Callable[[Any], Any]] = None) -> bool:
+        """
+        Start a read-only tool call ahead of run(). Returns False (and does
+        nothing) for tools that are not read-only.
+        """
+        if not self.is_read_only(tool_use.name):
+            return False
+        future = self._submit(tool_use, execute)
+        with self._lock:
+            self._speculative[tool_use.id] = future
+        return True
+
+    def discard_speculative(self) -> None:
+        """
+        Forget calls started by speculate(), e.g. when the response that
+        requested them is retried. Running calls finish in the background.
+        """
+        with self._lock:
+            self._speculative.clear()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _batches(self, tool_uses: List[Any]) -> List[List[int]]:
+        """
+        Group tool_use indexes into batches that may run concurrently.
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+
+        for index, tool_use in enumerate(tool_uses):
+            if self.is_read_only(tool_use.name):
+                current.append(index)
+                continue
+            if current:
+                batches.append(current)
+                current = []
+            batches.append([index])
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _wait(self, future: Future, tool_use: Any, deadline: Optional[float]) -> Any:
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self.cancel_event is not None:
+                # Wake up regularly to notice cancellation
+                remaining = CANCEL_POLL_INTERVAL if remaining is None else min(remaining, CANCEL_POLL_INTERVAL)
+            try:
+                return future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                if self._cancelled():
+                    return f"Error: tool '{tool_use.name}' was cancelled"
+                if deadline is not None and time.monotonic() >= deadline:
+                    return f"Error: tool '{tool_use.name}' did not finish within the step time budget"
+
+    def _call_deadline(self, tool_use: Any, deadline: Optional[float]) -> Optional[float]:
+        limit = self.time_limit(tool_use.name) if self.time_limit is not None and deadline is not None else None
+        return deadline if not limit else max(deadline, time.monotonic() + limit)
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _submit(self, tool_use: Any, execute: Optional[Callable[[Any], Any]] = None) -> Future:
+        # Each call runs in a copy of the caller's context, so it joins the current trace
+        return self.executor.submit(contextvars.copy_context().run, self._run_one, tool_use, execute)
+
+    def _take_speculative(self, tool_uses: List[Any]) -> Dict[int, Future]:
+        """
+        Index -> future of the given calls that were started by speculate().
+        Calls started for other responses are dropped.
+        """
+        with self._lock:
+            pending, self._speculative = self._speculative, {}
+        return {
+            index: pending[tool_use.id]
+            for index, tool_use in enumerate(tool_uses)
+            if getattr(tool_use, 'id', None) in pending
+        }
+
+    def _run_one(self, tool_use: Any, execute: Optional[Callable[[Any], Any]] = None) -> Any:
+        try:
+            return (execute or self.execute)(tool_use)
+        except Exception as e:
+            return f"Error executing tool '{tool_use.name}': {str(e)}"
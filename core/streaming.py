@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from core.agent_loop import TurnCancelled
+
+
+class StreamAccumulator:
+    """
+    Assemble a complete Message from the raw events of a streamed
+    `messages.create(..., stream=True)` call.
+
+    - Text deltas are forwarded to `on_text` as soon as they arrive.
+    - tool_use inputs are rebuilt from their `input_json_delta` fragments and
+      parsed once the block closes.
+    - `on_block_complete` is called with every finished content block.
+    - The time to the first content delta is recorded in `time_to_first_token`.
+    """
+
+    def __init__(self, on_text: Optional[Callable[[str], None]] = None,
+                 on_block_complete: Optional[Callable[[Any], None]] = None,
+                 started_at: Optional[float] = None):
+        self.on_text = on_text
+        self.on_block_complete = on_block_complete
+        self.message = None
+        self.time_to_first_token: Optional[float] = None
+        self._started_at = started_at if started_at is not None else time.perf_counter()
+        self._blocks: Dict[int, Any] = {}
+        self._finished: Dict[int, Any] = {}
+        self._text_parts: Dict[int, List[str]] = {}
+        self._json_parts: Dict[int, List[str]] = {}
+
+    def consume(self, events, deadline: Optional[float] = None,
+                cancel_event: Optional[threading.Event] = None) -> Any:
+        """
+        Consume the whole event stream and return the assembled message.
+        If a time.monotonic() deadline is given and passes before the stream
+        ends, the stream is closed and TimeoutError is raised; if cancel_event
+        is set, it is closed and TurnCancelled is raised.
+        """
+        for event in events:
+            self.handle(event)
+            if deadline is not None and time.monotonic() > deadline:
+                self._close(events)
+                raise TimeoutError("Streaming response exceeded its deadline")
+            if cancel_event is not None and cancel_event.is_set():
+                self._close(events)
+                raise TurnCancelled("The turn was cancelled while streaming")
+        return self.finalize()
+
+    @staticmethod
+    def _close(events) -> None:
+        close = getattr(events, 'close', None)
+        if close:
+            close()
+
+    def handle(self, event) -> None:
+        """
+        Apply a single stream event to the message being assembled.
+        """
+        event_type = getattr(event, 'type', None)
+
+        if event_type == 'message_start':
+            self.message = event.message
+            self.message.content = []
+
+        elif event_type == 'content_block_start':
+            self._blocks[event.index] = event.content_block
+            if event.content_block.type == 'text':
+                self._text_parts[event.index] = [event.content_block.text or ""]
+            elif event.content_block.type == 'tool_use':
+                self._json_parts[event.index] = []
+
+        elif event_type == 'content_block_delta':
+            self._mark_first_token()
+            delta = event.delta
+            if delta.type == 'text_delta':
+                self._text_parts.setdefault(event.index, []).append(delta.text)
+                if self.on_text:
+                    self.on_text(delta.text)
+            elif delta.type == 'input_json_delta':
+                self._json_parts.setdefault(event.index, []).append(delta.partial_json)
+
+        elif event_type == 'content_block_stop':
+            block = self._close_block(event.index)
+            if block is not None and self.on_block_complete:
+                self.on_block_complete(block)
+
+        elif event_type == 'message_delta':
+            self.message.stop_reason = event.delta.stop_reason
+            self.message.stop_sequence = getattr(event.delta, 'stop_sequence', None)
+            if getattr(event, 'usage', None) is not None:
+                self.message.usage.output_tokens = event.usage.output_tokens
+
+    def finalize(self) -> Any:
+        """
+        Close any blocks left open and return the assembled message.
+        """
+        if self.message is None:
+            raise ValueError("Stream ended before a message_start event was received")
+
+        for index in list(self._blocks):
+            self._close_block(index)
+        self.message.content = [block for _, block in sorted(self._finished.items())]
+        return self.message
+
+    def _close_block(self, index: int):
+        block = self._blocks.pop(index, None)
+        if block is None:
+            return None
+
+        if block.type == 'text':
+            block.text = "".join(self._text_parts.pop(index, []))
+        elif block.type == 'tool_use':
+            raw_json = "".join(self._json_parts.pop(index, []))
+            block.input = json.loads(raw_json) if raw_json else {}
+
+        self._finished[index] = block
+        return block
+
+    def _mark_first_token(self) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self._started_at
@@ -0,0 +1,277 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence
+import math
+import re
+import threading
+
+from tools.base import BaseTool
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Repeats of a tool's name and schema tokens relative to its description
+NAME_WEIGHT = 3
+SCHEMA_WEIGHT = 2
+# Shortest index term searched for inside compound tool names ("filecontentreadertool")
+MIN_NAME_PART = 4
+# Tools added by a search must score at least this share of the best match
+EXPAND_MIN_SHARE = 0.5
+
+_WORD = re.compile(r'[a-z0-9]+')
+_CAMEL = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do for from has have how i if in into is it its me my "
+    "need no not of on or our please should so that the their then there these this to "
+    "use used uses using want was we what when which will with without would you your".split()
+)
+
+
+def _stem(word: str) -> str:
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word stems of a text, without stop words. camelCase and
+    snake_case identifiers are split into their words.
+    """
+    words = _WORD.findall(_CAMEL.sub(' ', text or '').lower())
+    return [_stem(word) for word in words if word not in _STOP_WORDS]
+
+
+def _schema_text(schema: Any) -> str:
+    """
+    Property names and descriptions of a JSON schema, nested ones included.
+    """
+    parts: List[str] = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, dict):
+            for name, prop in (node.get('properties') or {}).items():
+                parts.append(name)
+                if isinstance(prop, dict):
+                    parts.append(str(prop.get('description', '')))
+                    parts.extend(str(value) for value in prop.get('enum') or [])
+                walk(prop)
+            walk(node.get('items'))
+
+    walk(schema)
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """
+    Okapi BM25 over tool definitions, built locally from their names,
+    descriptions and input schema fields.
+
+    Tool names are usually compound words without separators, so every index
+    term of at least MIN_NAME_PART characters found inside a name also counts
+    as a name term.
+    """
+
+    def __init__(self, definitions: Sequence[Dict[str, Any]] = ()):
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._document_frequency: Counter = Counter()
+        self._average_length = 0.0
+        self.build(definitions)
+
+    def build(self, definitions: Sequence[Dict[str, Any]]) -> None:
+        documents: Dict[str, List[str]] = {}
+        for definition in definitions:
+            name = definition['name']
+            documents[name] = (
+                tokenize(definition.get('description', ''))
+                + tokenize(_schema_text(definition.get('input_schema'))) * SCHEMA_WEIGHT
+            )
+
+        vocabulary = {term for terms in documents.values() for term in terms if len(term) >= MIN_NAME_PART}
+        for name, terms in documents.items():
+            name_terms = tokenize(name) + [term for term in vocabulary if term in name.lower()]
+            terms.extend(name_terms * NAME_WEIGHT)
+
+        self._terms = {name: Counter(terms) for name, terms in documents.items()}
+        self._lengths = {name: len(terms) for name, terms in documents.items()}
+        self._document_frequency = Counter(term for counts in self._terms.values() for term in counts)
+        self._average_length = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 0.0
+
+    def search(self, query: str, k: int = 5, exclude: Iterable[str] = (), min_share: float = 0.0) -> List[str]:
+        """
+        Names of the k tools most relevant to the query, best first. Tools
+        matching no query term, or scoring below min_share of the best
+        score, are not returned.
+        """
+        excluded = set(exclude)
+        query_terms = set(tokenize(query))
+        if not query_terms or not self._terms:
+            return []
+
+        total = len(self._terms)
+        scores: Dict[str, float] = {}
+        for name, counts in self._terms.items():
+            if name in excluded:
+                continue
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[name] / (self._average_length or 1))
+            score = 0.0
+            for term in query_terms:
+                frequency = counts.get(term)
+                if not frequency:
+                    continue
+                documents = self._document_frequency[term]
+                idf = math.log(1 + (total - documents + 0.5) / (documents + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+            if score > 0:
+                scores[name] = score
+        cutoff = max(scores.values(), default=0.0) * min_share
+        ranked = sorted((name for name in scores if scores[name] >= cutoff), key=lambda name: (-scores[name], name))
+        return ranked[:k]
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+class ToolSelector:
+    """
+    Chooses the tool definitions sent with each request.
+
+    At the start of every turn the selection becomes the pinned tools, the
+    top_k tools the index ranks highest for the user's message and the tools
+    used in the last turns. ToolSearchTool adds tools during a turn when the
+    model is missing a capability. Definitions keep the registry's order,
+    and a turn whose best matches are all selected already keeps the previous
+    selection, so the tools block (and the prompt cache behind it) only
+    changes when the task does. With no more installed tools than
+    min_tools, or than the selection would hold, every tool is sent: a few
+    tools cost less than the searches a missed one leads to.
+    """
+
+    def __init__(self, top_k: int = 6, pinned: Iterable[str] = (), min_tools: int = 0):
+        self.top_k = max(1, int(top_k))
+        self.pinned = list(pinned)
+        self.min_tools = int(min_tools or 0)
+        self.index = ToolIndex()
+        self._definitions: List[Dict[str, Any]] = []
+        self._selected: set = set()
+        self._selection: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def rebuild(self, definitions: List[Dict[str, Any]], added: Iterable[str] = ()) -> None:
+        """
+        Index a new set of tool definitions. Tools that were just added stay
+        selected, so a tool created during a turn can be used right away.
+        """
+        with self._lock:
+            self.index.build(definitions)
+            self._definitions = list(definitions)
+            names = {definition['name'] for definition in definitions}
+            self._update((self._selected | set(added)) & names)
+
+    def select(self, query: str, used: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Choose the tools for a turn from the user's message and the tools
+        used recently. Returns the selected definitions.
+        """
+        with self._lock:
+            matches = self.index.search(query, self.top_k)
+            # Searches and calls during earlier turns may have grown the selection
+            stable = len(self._selected) <= 2 * (self.top_k + len(self.pinned))
+            if self._selection and stable and set(matches) <= self._selected:
+                return self._selection
+            self._update(set(self.pinned) | set(matches) | set(used))
+            return self._selection
+
+    def expand(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Add the k best tools for a capability that are not selected yet.
+        Returns their definitions.
+        """
+        with self._lock:
+            matches = self.index.search(query, k, exclude=self._selected, min_share=EXPAND_MIN_SHARE)
+            if matches:
+                self._update(self._selected | set(matches))
+            return [definition for definition in self._definitions if definition['name'] in matches]
+
+    def add(self, names: Iterable[str]) -> None:
+        with self._lock:
+            names = set(names) - self._selected
+            if names:
+                self._update(self._selected | names)
+
+    def reset(self) -> None:
+        """
+        Go back to the pinned tools, forgetting what earlier turns selected.
+        """
+        with self._lock:
+            self._update(set())
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """
+        The selected definitions. The same list object is returned until the
+        selection changes.
+        """
+        return self._selection
+
+    @property
+    def active(self) -> bool:
+        """
+        Whether tools are left out at all. False while every installed tool
+        is sent (see min_tools).
+        """
+        return len(self._definitions) > max(self.min_tools, self.top_k + len(self.pinned))
+
+    def _update(self, names: set) -> None:
+        if not self.active:
+            names = {definition['name'] for definition in self._definitions}
+        names |= {name for name in self.pinned if any(d['name'] == name for d in self._definitions)}
+        if names == self._selected and self._selection:
+            return
+        self._selected = names
+        self._selection = [definition for definition in self._definitions if definition['name'] in names]
+
+
+class ToolSearchTool(BaseTool):
+    """
+    Built-in tool that offers more of the installed tools when the selected
+    ones don't cover what the model needs.
+    """
+
+    name = "toolsearchtool"
+    description = '''
+    Finds installed tools that are not offered yet.
+    Only the tools most relevant to the current request are offered. If none of them
+    can do what is needed (for example reading a web page, linting code or taking a
+    screenshot), describe the capability in a few words; the best matching installed
+    tools are added and can be called from the next step.
+    Search here before creating a new tool with the tool creator.
+    '''
+    input_schema = {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "The capability needed, e.g. 'scrape the text of a web page'"
+            }
+        },
+        "required": ["query"]
+    }
+
+    def __init__(self, selector: ToolSelector):
+        self.selector = selector
+
+    def execute(self, **kwargs) -> str:
+        query = (kwargs.get('query') or '').strip()
+        if not query:
+            return "Error: describe the capability you need in the query"
+        found = self.selector.expand(query)
+        if not found:
+            return (f"No other installed tool matches '{query}'. Use the offered tools, "
+                    "or create a new tool if the capability is really missing.")
+        lines = [f"Added {len(found)} tool(s), available from the next step:"]
+        for definition in found:
+            summary = next((line.strip() for line in definition.get('description', '').splitlines()
+                            if line.strip()), '')
+            lines.append(f"- {definition['name']}: {summary}")
+        return "\n".join(lines)
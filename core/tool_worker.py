@@ -0,0 +1,72 @@
+"""
+Entry point of the worker processes started by core.isolation.ToolProcessPool.
+
+    python -m core.tool_worker [--memory-limit MB]
+
+Requests are read from stdin and responses written to the original stdout as
+pickled tuples; anything the tools print goes to stderr instead.
+"""
+from typing import Any, Dict, Tuple
+import argparse
+import importlib
+import os
+import pickle
+import sys
+
+
+def apply_memory_limit(megabytes: int) -> None:
+    """
+    Cap the address space of this process and of the processes it starts.
+    """
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    limit = megabytes * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool worker process")
+    parser.add_argument('--memory-limit', type=int, default=None, help="address space limit in MB")
+    args = parser.parse_args()
+    if args.memory_limit:
+        apply_memory_limit(args.memory_limit)
+
+    requests = sys.stdin.buffer
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    # Tool output must not end up in the response stream
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    instances: Dict[Tuple[str, str], Any] = {}
+    while True:
+        try:
+            call_id, module_name, class_name, kwargs = pickle.load(requests)
+        except (EOFError, pickle.UnpicklingError):
+            break
+
+        try:
+            tool = instances.get((module_name, class_name))
+            if tool is None:
+                tool = getattr(importlib.import_module(module_name), class_name)()
+                instances[(module_name, class_name)] = tool
+            response = (call_id, True, tool.execute(**kwargs))
+        except MemoryError:
+            response = (call_id, False, "the tool exceeded the worker memory limit")
+        except BaseException as e:
+            response = (call_id, False, f"{type(e).__name__}: {str(e)}")
+
+        try:
+            data = pickle.dumps(response)
+        except Exception as e:
+            data = pickle.dumps((call_id, False, f"result could not be returned: {str(e)}"))
+        responses.write(data)
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
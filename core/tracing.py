@@ -0,0 +1,239 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+# Span durations kept in memory per span name for `stats`
+RECENT_SPANS = 5000
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar('ce3_current_span', default=None)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    """
+    An attribute value in OTLP/JSON form.
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_attribute_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """
+    One timed operation within a trace. Use Tracer.span() to create spans.
+    """
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'attributes',
+                 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def update(self, attributes: Dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            self.set(key, value)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _attribute_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def update(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Minimal tracer producing OpenTelemetry-shaped spans.
+
+    Spans nest through a context variable, so a span opened inside another one
+    becomes its child; code running on worker threads joins the trace as long
+    as it runs in a copy of the caller's context. When a root span ends, the
+    whole trace is appended to export_path as one OTLP/JSON line
+    (`{"resourceSpans": [...]}`), the format of the OpenTelemetry collector's
+    file exporter. A child that outlives its root (say, a background tool call)
+    is written on a line of its own, under the same trace id. Durations of
+    recent spans are also kept in memory.
+    """
+
+    def __init__(self, export_path: Optional[Path] = None, enabled: bool = True,
+                 service_name: str = "ce3", max_file_bytes: int = 20 * 1024 * 1024):
+        self.enabled = enabled
+        self.export_path = Path(export_path) if export_path else None
+        self.service_name = service_name
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Span]] = defaultdict(list)
+        self._open_traces: Set[str] = set()
+        self.recent: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=RECENT_SPANS))
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        Time the enclosed block as a span; the first span without a parent
+        starts a new trace. Yields the span so attributes can be added.
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        span = Span(self, name, parent.trace_id if parent else secrets.token_hex(16),
+                    parent.span_id if parent else None, attributes)
+        if parent is None:
+            with self._lock:
+                self._open_traces.add(span.trace_id)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool) -> None:
+        with self._lock:
+            self.recent[span.name].append(span.duration)
+            if span.trace_id not in self._open_traces:
+                # The root already ended and its trace was exported
+                spans = [span]
+            else:
+                self._pending[span.trace_id].append(span)
+                if not is_root:
+                    return
+                self._open_traces.discard(span.trace_id)
+                spans = self._pending.pop(span.trace_id)
+        self._export(spans)
+
+    def _export(self, spans: List[Span]) -> None:
+        if self.export_path is None:
+            return
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}}
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "ce3.tracing"},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        line = json.dumps(record, separators=(',', ':'), default=str) + "\n"
+        with self._lock:
+            try:
+                self.export_path.parent.mkdir(parents=True, exist_ok=True)
+                if (self.max_file_bytes and self.export_path.exists()
+                        and self.export_path.stat().st_size > self.max_file_bytes):
+                    os.replace(self.export_path, self.export_path.with_suffix('.jsonl.1'))
+                with open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                logging.error(f"Could not write trace file {self.export_path}: {str(e)}")
+
+    def durations_from_file(self) -> Dict[str, List[float]]:
+        """
+        Span durations per span name from every trace in the export file.
+        """
+        durations: Dict[str, List[float]] = defaultdict(list)
+        if self.export_path is None or not self.export_path.exists():
+            return durations
+        with open(self.export_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                for resource in record.get('resourceSpans', []):
+                    for scope in resource.get('scopeSpans', []):
+                        for span in scope.get('spans', []):
+                            durations[span['name']].append(
+                                (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e9
+                            )
+        return durations
+
+    def stats(self, from_file: bool = False) -> List[Dict[str, Any]]:
+        """
+        count, p50, p95 and max duration per span name, from the spans of this
+        process or from the whole export file.
+        """
+        if from_file:
+            durations = self.durations_from_file()
+        else:
+            with self._lock:
+                durations = {name: list(values) for name, values in self.recent.items()}
+
+        rows = []
+        for name, values in sorted(durations.items()):
+            if not values:
+                continue
+            ordered = sorted(values)
+            rows.append({
+                'name': name,
+                'count': len(ordered),
+                'p50': _percentile(ordered, 0.50),
+                'p95': _percentile(ordered, 0.95),
+                'max': ordered[-1],
+                'total': sum(ordered)
+            })
+        return rows
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
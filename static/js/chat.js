@@ -194,7 +194,7 @@ document.getElementById('chat-form').addEventListener('submit', async (e) => {
     if (currentImageData) {
         // Optionally show the image in the chat
         const imagePreview = document.createElement('img');
-        imagePreview.src = `data:image/jpeg;base64,${currentImageData}`;
+        imagePreview.src = `data:${currentMediaType || 'image/jpeg'};base64,${currentImageData}`;
         imagePreview.className = 'max-h-48 rounded-lg mt-2';
         document.querySelector('.message-wrapper:last-child .prose').appendChild(imagePreview);
     }
@@ -2,6 +2,20 @@ from abc import ABC, abstractmethod
 from typing import Dict
 
 class BaseTool(ABC):
+    # Read-only tools have no side effects, so several calls to them in the
+    # same assistant turn may run concurrently.
+    read_only = False
+    # Read-only tools can also have their results cached. path_inputs names the
+    # input fields holding file paths (cached until those files change), and
+    # cache_ttl is how many seconds a result stays valid, for network fetches.
+    path_inputs = ()
+    cache_ttl = None
+    # With TOOL_ISOLATION on, tools run in worker processes that are killed
+    # after time_limit seconds (None: Config.TOOL_TIMEOUT). Tools that need to
+    # share the assistant's process can set isolated = False.
+    isolated = True
+    time_limit = None
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -24,3 +38,8 @@ class BaseTool(ABC):
     def execute(self, **kwargs) -> str:
         """Execute the tool with given parameters"""
         pass
+
+    def skip_path(self, path: str) -> bool:
+        """Whether the tool ignores a file or directory found below a path input.
+        The tool cache leaves such paths out of its fingerprint."""
+        return False
@@ -5,6 +5,8 @@ from urllib.parse import quote_plus
 
 class DuckduckgoTool(BaseTool):
     name = "duckduckgotool"
+    read_only = True
+    cache_ttl = 600
     description = '''
     Performs a search using DuckDuckGo and returns the top search results.
     Returns titles, snippets, and URLs of the search results.
@@ -36,7 +38,7 @@ class DuckduckgoTool(BaseTool):
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, timeout=10)
             response.raise_for_status()
             soup = BeautifulSoup(response.text, 'html.parser')
             
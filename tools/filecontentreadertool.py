@@ -5,6 +5,8 @@ import mimetypes
 
 class FileContentReaderTool(BaseTool):
     name = "filecontentreadertool"
+    read_only = True
+    path_inputs = ("file_paths",)
     description = '''
     Reads content from multiple files and returns their contents.
     Accepts a list of file paths and returns a dictionary with file paths as keys
@@ -74,6 +76,9 @@ class FileContentReaderTool(BaseTool):
 
         return False
 
+    def skip_path(self, path: str) -> bool:
+        return self._should_skip(path)
+
     def _read_file(self, file_path: str) -> str:
         """Safely read a file and handle errors."""
         try:
@@ -1,9 +1,10 @@
 from tools.base import BaseTool
 from typing import List, Dict, Any, Optional
-import base64
-import io
 import json  # Add this import
 
+from config import Config
+from core.images import shared_encoder
+
 try:
     import pyautogui
     from PIL import Image
@@ -14,6 +15,7 @@ except ImportError as e:
 
 class ScreenshotTool(BaseTool):
     name = "screenshottool"
+    read_only = True
     description = '''
     Captures a screenshot of the current screen and returns an image block ready to be sent to Claude.
     Optionally, a specific region of the screen can be captured by providing coordinates.
@@ -22,14 +24,16 @@ class ScreenshotTool(BaseTool):
     - region (optional): A list of four integers [x, y, width, height] specifying the region of the screen to capture.
       If omitted, captures the entire screen.
 
-    The output is a JSON-formatted string that can be included directly as part of the conversation content:
+    The screenshot is downscaled to the configured maximum size and encoded as PNG or JPEG,
+    whichever suits its content. The output is a list of content blocks that can be included
+    directly as part of the conversation content:
     [
       {
         "type": "image",
         "source": {
           "type": "base64",
-          "media_type": "image/png",
-          "data": "<base64-encoded png>"
+          "media_type": "image/png" or "image/jpeg",
+          "data": "<base64-encoded image>"
         }
       }
     ]
@@ -59,22 +63,15 @@ class ScreenshotTool(BaseTool):
             # Take screenshot (full screen or specified region)
             screenshot: Image.Image = pyautogui.screenshot(region=region)
 
-            # Convert to base64
-            with io.BytesIO() as buffer:
-                screenshot.save(buffer, format="PNG")
-                encoded_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
+            # Downscale and encode through the shared image pipeline
+            encoder = shared_encoder(
+                getattr(Config, 'IMAGE_MAX_DIMENSION', 1568),
+                getattr(Config, 'IMAGE_JPEG_QUALITY', 85),
+                getattr(Config, 'IMAGE_CACHE_SIZE', 64)
+            )
 
             # Return the image block as a Python list/dict (not as JSON string)
-            return [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/png",
-                        "data": encoded_data,
-                    }
-                }
-            ]
+            return [encoder.encode_pil(screenshot).to_block()]
 
         except Exception as e:
             return f"Error capturing screenshot: {str(e)}"
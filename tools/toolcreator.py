@@ -5,12 +5,12 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 import re
-import anthropic
 
 load_dotenv()
 
 class ToolCreatorTool(BaseTool):
     name = "toolcreator"
+    time_limit = 300  # Waits for the model to write the tool
     description = '''
     Creates a new tool based on a natural language description.
     Use this when you need a new capability that isn't available in current tools.
@@ -29,7 +29,7 @@ class ToolCreatorTool(BaseTool):
     }
 
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = None  # Created on first use; importing the SDK is slow
         self.console = Console()
         self.tools_dir = Path(__file__).parent.parent / "tools"  # Fixed path
 
@@ -86,6 +86,9 @@ Return ONLY the Python code without any explanation or markdown formatting.
 """
 
         try:
+            if self.client is None:
+                import anthropic
+                self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
             # Get tool implementation from Claude with animation
             response = self.client.messages.create(
                 model="claude-3-5-sonnet-20241022",
@@ -7,6 +7,7 @@ from tools.base import BaseTool
 
 class UVPackageManager(BaseTool):
     name = "uvpackagemanager"
+    time_limit = 600  # Package installs can take a while
     description = '''
     Comprehensive interface to the uv package manager providing package management,
     project management, Python version management, tool management, and script support.
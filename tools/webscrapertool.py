@@ -5,6 +5,8 @@ import re
 
 class WebScraperTool(BaseTool):
     name = "webscrapertool"
+    read_only = True
+    cache_ttl = 600
     description = '''
     An enhanced web scraper that fetches a web page, extracts and returns its main textual content,
     along with the page title and meta description if available. It attempts to identify the main